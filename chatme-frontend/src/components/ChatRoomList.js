@@ -155,6 +155,13 @@ const ChatRoomList = () => {
     const currentRoomName = location.pathname.split('/').pop();
 
     const groupRooms = filteredRooms.filter((r) => r.is_group === true);
+    // Direct chats are listed by user; look their room summaries up by name
+    const roomsByName = Object.fromEntries(rooms.map((r) => [r.name, r]));
+
+    const previewText = (room) => {
+        if (!room || !room.last_message) return null;
+        return `${room.last_message.sender_username}: ${room.last_message.content}`;
+    };
 
     // Menu Handlers for Groups
     const handleMenuOpen = (event, room) => {
@@ -271,12 +278,16 @@ const ChatRoomList = () => {
                                                         selected={isActive}
                                                     >
                                                         <ListItemAvatar>
-                                                            <Avatar sx={{ width: 40, height: 40 }}>
-                                                                {room.name.charAt(0).toUpperCase()}
-                                                            </Avatar>
+                                                            <Badge color="primary" badgeContent={room.unread_count} max={99}>
+                                                                <Avatar sx={{ width: 40, height: 40 }}>
+                                                                    {room.name.charAt(0).toUpperCase()}
+                                                                </Avatar>
+                                                            </Badge>
                                                         </ListItemAvatar>
                                                         <ListItemText
                                                             primary={room.name}
+                                                            secondary={previewText(room)}
+                                                            secondaryTypographyProps={{ noWrap: true }}
                                                             sx={{
                                                                 ml: 2,
                                                                 whiteSpace: 'nowrap',
@@ -307,6 +318,7 @@ const ChatRoomList = () => {
                                 {filteredUsers.map((user) => {
                                     const roomName = `direct_${Math.min(auth.user.id, user.id)}_${Math.max(auth.user.id, user.id)}`;
                                     const isActive = roomName === currentRoomName;
+                                    const directRoom = roomsByName[roomName];
                                     return (
                                         <React.Fragment key={user.id}>
                                             <ListItem disablePadding>
@@ -343,6 +355,8 @@ const ChatRoomList = () => {
                                                     </ListItemAvatar>
                                                     <ListItemText
                                                         primary={user.username}
+                                                        secondary={previewText(directRoom)}
+                                                        secondaryTypographyProps={{ noWrap: true }}
                                                         sx={{
                                                             ml: 2,
                                                             whiteSpace: 'nowrap',
@@ -350,6 +364,9 @@ const ChatRoomList = () => {
                                                             textOverflow: 'ellipsis',
                                                         }}
                                                     />
+                                                    {directRoom && directRoom.unread_count > 0 && (
+                                                        <Badge color="primary" badgeContent={directRoom.unread_count} max={99} sx={{ mr: 1 }} />
+                                                    )}
                                                 </ListItemButton>
                                             </ListItem>
                                             <Divider component="li" />
@@ -57,11 +57,12 @@ const ChatWindow = () => {
                 if (!room) return;
 
                 // Assuming it's a direct chat
-                const oUser = room.participants.find(p => p.id !== currentUserId);
+                const roomRes = await API.get(`rooms/${room.id}/`);
+                const oUser = roomRes.data.participants.find(p => p.id !== currentUserId);
                 setOtherUser(oUser || null);
 
                 const msgRes = await API.get(`rooms/${room.id}/messages/`);
-                setMessages(msgRes.data);
+                setMessages(msgRes.data.results);
 
                 const token = localStorage.getItem('access'); // Adjust if needed
                 const socketUrl = `ws://localhost:8000/ws/chat/${roomName}/?token=${token}`;
@@ -1,5 +1,5 @@
 // src/components/ChatWindow.js
-import React, { useEffect, useState, useRef } from 'react';
+import React, { useCallback, useEffect, useState, useRef } from 'react';
 import API from '../api';
 import { useParams } from 'react-router-dom';
 import { useSelector } from 'react-redux';
@@ -25,14 +25,30 @@ import {
 import SendIcon from '@mui/icons-material/Send';
 import MoreVertIcon from '@mui/icons-material/MoreVert';
 
+// Read markers are sent at most once per this interval while the user scrolls
+const READ_DEBOUNCE_MS = 1000;
+
+// How close to the bottom (px) counts as having scrolled to the newest message
+const BOTTOM_THRESHOLD = 40;
+
 const ChatWindow = () => {
     const { roomName } = useParams();
     const [messages, setMessages] = useState([]);
     const [input, setInput] = useState('');
     const [otherUser, setOtherUser] = useState(null);
     const [loading, setLoading] = useState(true);
+    const [roomId, setRoomId] = useState(null);
+    // Cursor for the next page of older history; null once it is all loaded
+    const [olderCursor, setOlderCursor] = useState(null);
+    const [loadingOlder, setLoadingOlder] = useState(false);
     const socketRef = useRef(null);
     const messagesEndRef = useRef(null);
+    const messagesBoxRef = useRef(null);
+    // Set while older messages are prepended, so the view is not scrolled to the bottom
+    const prependingRef = useRef(null);
+    // Id of the newest message already reported as read, and the pending report
+    const readUpToRef = useRef(null);
+    const readTimerRef = useRef(null);
     const auth = useSelector((state) => state.auth);
 
     const currentUserId = auth.user ? auth.user.id : null;
@@ -52,23 +68,35 @@ const ChatWindow = () => {
     const [creatingGroup, setCreatingGroup] = useState(false);
 
     useEffect(() => {
+        readUpToRef.current = null;
+
         const fetchRoomAndMessages = async () => {
             try {
-                const response = await API.get('rooms/');
-                const room = response.data.find((r) => r.name === roomName);
-                if (!room) {
+                const response = await API.get('rooms/', { params: { name: roomName } });
+                const summary = response.data[0];
+                if (!summary) {
                     console.error('Room not found');
                     setLoading(false);
                     return;
                 }
 
-                const oUser = room.participants.find((p) => p.id !== currentUserId);
+                const [roomRes, msgRes] = await Promise.all([
+                    API.get(`rooms/${summary.id}/`),
+                    API.get(`rooms/${summary.id}/messages/`),
+                ]);
+                const oUser = roomRes.data.participants.find((p) => p.id !== currentUserId);
                 setOtherUser(oUser || null);
 
-                const msgRes = await API.get(`rooms/${room.id}/messages/`);
-                setMessages(msgRes.data);
+                setRoomId(summary.id);
+                setMessages(msgRes.data.results);
+                setOlderCursor(msgRes.data.before);
                 setLoading(false);
 
+                // Opening the room marks it read
+                const results = msgRes.data.results;
+                readUpToRef.current = results.length ? results[results.length - 1].id : null;
+                API.post(`rooms/${summary.id}/read/`).catch((error) => console.error('Error marking room as read:', error));
+
                 // WebSocket Connection
                 const token = localStorage.getItem('access');
                 const wsProtocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
@@ -85,6 +113,13 @@ const ChatWindow = () => {
                     if (data.message) {
                         setMessages((prev) => [...prev, data.message]);
                     }
+                    if (data.moderation) {
+                        // Scoring finished after the message was broadcast
+                        const { id, is_flagged, toxicity } = data.moderation;
+                        setMessages((prev) =>
+                            prev.map((m) => (m.id === id ? { ...m, is_flagged, toxicity } : m))
+                        );
+                    }
                 };
 
                 socketRef.current.onerror = (error) => {
@@ -103,16 +138,70 @@ const ChatWindow = () => {
         fetchRoomAndMessages();
 
         return () => {
+            clearTimeout(readTimerRef.current);
             if (socketRef.current) socketRef.current.close();
         };
     }, [roomName, currentUserId]);
 
+    // Report the room as read up to the newest loaded message; debounced, and
+    // skipped when nothing arrived since the last report
+    const markRead = useCallback(() => {
+        if (!roomId || messages.length === 0) return;
+        const latestId = messages[messages.length - 1].id;
+        clearTimeout(readTimerRef.current);
+        if (latestId === readUpToRef.current) return;
+        readTimerRef.current = setTimeout(() => {
+            readUpToRef.current = latestId;
+            API.post(`rooms/${roomId}/read/`).catch((error) => console.error('Error marking room as read:', error));
+        }, READ_DEBOUNCE_MS);
+    }, [roomId, messages]);
+
+    // Coming back to the window marks the room read
+    useEffect(() => {
+        window.addEventListener('focus', markRead);
+        return () => window.removeEventListener('focus', markRead);
+    }, [markRead]);
+
     useEffect(() => {
+        const box = messagesBoxRef.current;
+        if (prependingRef.current !== null && box) {
+            // Keep the previously visible messages in place
+            box.scrollTop = box.scrollHeight - prependingRef.current;
+            prependingRef.current = null;
+            return;
+        }
         if (messagesEndRef.current) {
             messagesEndRef.current.scrollIntoView({ behavior: 'smooth' });
         }
     }, [messages]);
 
+    const loadOlderMessages = async () => {
+        if (!olderCursor || loadingOlder || !roomId) return;
+        setLoadingOlder(true);
+        try {
+            const res = await API.get(`rooms/${roomId}/messages/`, { params: { before: olderCursor } });
+            if (messagesBoxRef.current) {
+                prependingRef.current = messagesBoxRef.current.scrollHeight - messagesBoxRef.current.scrollTop;
+            }
+            setMessages((prev) => [...res.data.results, ...prev]);
+            setOlderCursor(res.data.before);
+        } catch (error) {
+            console.error('Error fetching older messages:', error);
+        }
+        setLoadingOlder(false);
+    };
+
+    const handleMessagesScroll = (e) => {
+        const box = e.currentTarget;
+        if (box.scrollTop === 0) {
+            loadOlderMessages();
+        }
+        // Scrolling to the newest message marks the room read, but not while the window is in the background
+        if (box.scrollHeight - box.scrollTop - box.clientHeight <= BOTTOM_THRESHOLD && document.hasFocus()) {
+            markRead();
+        }
+    };
+
     const sendMessage = () => {
         if (input.trim() !== '' && socketRef.current && socketRef.current.readyState === WebSocket.OPEN) {
             const message = { message: input };
@@ -253,6 +342,8 @@ const ChatWindow = () => {
 
                 {/* Messages Area */}
                 <Box 
+                    ref={messagesBoxRef}
+                    onScroll={handleMessagesScroll}
                     sx={{ 
                         flexGrow: 1, 
                         overflowY: 'auto', 
@@ -291,6 +382,11 @@ const ChatWindow = () => {
                         </Typography>
                     ) : (
                         <List sx={{ width: '100%', padding: 0 }}>
+                            {loadingOlder && (
+                                <Box sx={{ display: 'flex', justifyContent: 'center', mb: 2 }}>
+                                    <CircularProgress size={20} />
+                                </Box>
+                            )}
                             {messages.map((msg) => {
                                 const isCurrentUser = msg.sender.id === currentUserId;
                                 const avatarUrl = msg.sender.image_url || '/static/images/default_avatar.png';
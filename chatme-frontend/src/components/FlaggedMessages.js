@@ -1,7 +1,11 @@
 // src/components/FlaggedMessages.js
 
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useState, useRef } from 'react';
 import {
+    Box,
+    Button,
+    MenuItem,
+    TextField,
     Typography,
     List,
     ListItem,
@@ -16,18 +20,80 @@ import {
 import DeleteIcon from '@mui/icons-material/Delete';
 import API from '../api';
 
+const TOXICITY_LABELS = ['toxic', 'severe_toxic', 'obscene', 'threat', 'insult', 'identity_hate'];
+
 const FlaggedMessages = () => {
     const [flaggedMessages, setFlaggedMessages] = useState([]);
     const [snackbar, setSnackbar] = useState({ open: false, message: '', severity: 'success' });
+    const [label, setLabel] = useState('');
+    const [room, setRoom] = useState('');
+    // Cursor for the next (older) page of the queue; null when there is none
+    const [olderCursor, setOlderCursor] = useState(null);
+    const socketRef = useRef(null);
+    const filtersRef = useRef({ label: '', room: '' });
+
+    const queueParams = () => {
+        const params = {};
+        if (label) params.label = label;
+        if (room.trim()) params.room = room.trim();
+        return params;
+    };
 
     useEffect(() => {
+        filtersRef.current = { label, room: room.trim() };
         fetchFlaggedMessages();
+        // eslint-disable-next-line react-hooks/exhaustive-deps
+    }, [label, room]);
+
+    useEffect(() => {
+        // New flags are pushed by the server instead of refetching the queue
+        const token = localStorage.getItem('access');
+        const wsProtocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+        const backendURL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8000';
+        const socketUrl = `${wsProtocol}://${new URL(backendURL).host}/ws/moderation/?token=${token}`;
+        socketRef.current = new WebSocket(socketUrl);
+
+        socketRef.current.onmessage = (e) => {
+            const data = JSON.parse(e.data);
+            if (!data.flagged) return;
+            const filters = filtersRef.current;
+            const matching = data.flagged.filter((msg) =>
+                (!filters.label || msg.toxicity === filters.label) &&
+                (!filters.room || String(msg.room) === filters.room)
+            );
+            setFlaggedMessages((prev) => {
+                const known = new Set(prev.map((msg) => msg.id));
+                const fresh = matching.filter((msg) => !known.has(msg.id)).reverse();
+                return [...fresh, ...prev];
+            });
+        };
+
+        socketRef.current.onerror = (error) => {
+            console.error('Moderation feed error:', error);
+        };
+
+        return () => {
+            if (socketRef.current) socketRef.current.close();
+        };
     }, []);
 
     const fetchFlaggedMessages = async () => {
         try {
-            const response = await API.get('/flagged-messages/');
-            setFlaggedMessages(response.data);
+            const response = await API.get('/flagged-messages/', { params: queueParams() });
+            setFlaggedMessages(response.data.results);
+            setOlderCursor(response.data.before);
+        } catch (error) {
+            console.error('Error fetching flagged messages:', error);
+            setSnackbar({ open: true, message: 'Failed to fetch flagged messages.', severity: 'error' });
+        }
+    };
+
+    const fetchOlderMessages = async () => {
+        if (!olderCursor) return;
+        try {
+            const response = await API.get('/flagged-messages/', { params: { ...queueParams(), before: olderCursor } });
+            setFlaggedMessages((prev) => [...prev, ...response.data.results]);
+            setOlderCursor(response.data.before);
         } catch (error) {
             console.error('Error fetching flagged messages:', error);
             setSnackbar({ open: true, message: 'Failed to fetch flagged messages.', severity: 'error' });
@@ -54,6 +120,27 @@ const FlaggedMessages = () => {
             <Typography variant="h5" gutterBottom>
                 Flagged Messages
             </Typography>
+            <Box sx={{ display: 'flex', gap: 2, mb: 2 }}>
+                <TextField
+                    select
+                    size="small"
+                    label="Toxicity"
+                    value={label}
+                    onChange={(e) => setLabel(e.target.value)}
+                    sx={{ minWidth: 180 }}
+                >
+                    <MenuItem value="">All</MenuItem>
+                    {TOXICITY_LABELS.map((name) => (
+                        <MenuItem key={name} value={name}>{name.replace('_', ' ')}</MenuItem>
+                    ))}
+                </TextField>
+                <TextField
+                    size="small"
+                    label="Room ID"
+                    value={room}
+                    onChange={(e) => setRoom(e.target.value.replace(/\D/g, ''))}
+                />
+            </Box>
             {flaggedMessages.length === 0 ? (
                 <Typography variant="body1">No flagged messages.</Typography>
             ) : (
@@ -86,6 +173,11 @@ const FlaggedMessages = () => {
                     ))}
                 </List>
             )}
+            {olderCursor && (
+                <Box sx={{ display: 'flex', justifyContent: 'center', mt: 2 }}>
+                    <Button variant="outlined" onClick={fetchOlderMessages}>Load older</Button>
+                </Box>
+            )}
             <Snackbar
                 open={snackbar.open}
                 autoHideDuration={6000}
@@ -0,0 +1,144 @@
+# chatapp/aggregates.py
+"""
+Hourly and daily toxicity counts per user and room.
+
+Every scored message adds one toxic or non-toxic count to two
+ToxicityAggregate rows, its hour and its day bucket (UTC), so the
+moderation dashboard reads a few pre-summed rows instead of scanning
+Message. Like the profile counters, rows are only changed with F()
+expressions; with TOXICITY_AGGREGATE_FLUSH_MS > 0 increments are buffered
+and written in bulk by a background thread. The
+`backfill_toxicity_aggregates` command rebuilds the table from history.
+"""
+import atexit
+import threading
+from collections import defaultdict
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .counters import CounterAggregator
+
+GRANULARITIES = ('hour', 'day')
+
+
+def bucket_starts(timestamp):
+    """
+    Return [(granularity, bucket_start)] for a message sent at `timestamp`.
+    """
+    if timezone.is_aware(timestamp):
+        timestamp = timestamp.astimezone(dt_timezone.utc)
+    hour = timestamp.replace(minute=0, second=0, microsecond=0)
+    return [('hour', hour), ('day', hour.replace(hour=0))]
+
+
+def add_message(deltas, user_id, room_id, timestamp, toxic, count=1):
+    """
+    Count one message into `deltas`, a defaultdict(lambda: [0, 0]) keyed
+    like apply_aggregate_deltas expects. A `count` of -1 takes it back out.
+    """
+    for granularity, bucket_start in bucket_starts(timestamp):
+        deltas[(granularity, bucket_start, user_id, room_id)][0 if toxic else 1] += count
+
+
+def apply_aggregate_deltas(deltas):
+    """
+    Apply {(granularity, bucket_start, user_id, room_id): (toxic, non_toxic)}
+    in one transaction: an UPDATE per existing row and one bulk INSERT for
+    the buckets that have no row yet.
+    """
+    from .models import ToxicityAggregate
+
+    if not deltas:
+        return
+    with transaction.atomic():
+        existing = {
+            (granularity, bucket_start, user_id, room_id): pk
+            for pk, granularity, bucket_start, user_id, room_id in ToxicityAggregate.objects.filter(
+                bucket_start__in={key[1] for key in deltas},
+                user_id__in={key[2] for key in deltas},
+                room_id__in={key[3] for key in deltas},
+            ).values_list('pk', 'granularity', 'bucket_start', 'user_id', 'room_id')
+        }
+        missing = []
+        for key, (toxic, non_toxic) in deltas.items():
+            pk = existing.get(key)
+            if pk is None:
+                granularity, bucket_start, user_id, room_id = key
+                missing.append(ToxicityAggregate(
+                    granularity=granularity, bucket_start=bucket_start, user_id=user_id, room_id=room_id,
+                    toxic_count=toxic, non_toxic_count=non_toxic,
+                ))
+            else:
+                ToxicityAggregate.objects.filter(pk=pk).update(
+                    toxic_count=F('toxic_count') + toxic,
+                    non_toxic_count=F('non_toxic_count') + non_toxic,
+                )
+        if not missing:
+            return
+        try:
+            with transaction.atomic():
+                ToxicityAggregate.objects.bulk_create(missing)
+        except IntegrityError:
+            # Another process created some of these buckets in the meantime
+            for row in missing:
+                _upsert(row)
+
+
+def _upsert(row):
+    from .models import ToxicityAggregate
+
+    aggregate, created = ToxicityAggregate.objects.get_or_create(
+        granularity=row.granularity, bucket_start=row.bucket_start, user_id=row.user_id, room_id=row.room_id,
+        defaults={'toxic_count': row.toxic_count, 'non_toxic_count': row.non_toxic_count},
+    )
+    if not created:
+        ToxicityAggregate.objects.filter(pk=aggregate.pk).update(
+            toxic_count=F('toxic_count') + row.toxic_count,
+            non_toxic_count=F('non_toxic_count') + row.non_toxic_count,
+        )
+
+
+_aggregator = None
+_aggregator_lock = threading.Lock()
+
+
+def get_aggregator():
+    global _aggregator
+    with _aggregator_lock:
+        if _aggregator is None:
+            _aggregator = CounterAggregator(
+                settings.TOXICITY_AGGREGATE_FLUSH_MS / 1000.0,
+                apply=apply_aggregate_deltas,
+                name='toxicity-aggregates',
+            )
+            atexit.register(_aggregator.flush)
+        return _aggregator
+
+
+def record_message(user_id, room_id, timestamp, toxic):
+    """
+    Count one scored message sent by `user_id` in `room_id` at `timestamp`.
+    """
+    record_messages([(user_id, room_id, timestamp, toxic)])
+
+
+def record_messages(results):
+    """
+    Count many scored messages at once. `results` yields
+    (user_id, room_id, timestamp, toxic) tuples.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    for user_id, room_id, timestamp, toxic in results:
+        add_message(deltas, user_id, room_id, timestamp, toxic)
+    if not deltas:
+        return
+    if getattr(settings, 'TOXICITY_AGGREGATE_FLUSH_MS', 0) > 0:
+        aggregator = get_aggregator()
+        for key, (toxic, non_toxic) in deltas.items():
+            aggregator.add(key, toxic, non_toxic)
+    else:
+        apply_aggregate_deltas(deltas)
@@ -0,0 +1,90 @@
+# chatapp/antonyms.py
+"""
+Precomputed replacements for every entry of the toxic-word lexicon.
+
+WordNet is only consulted by `build_table()`, which runs from the
+build_antonym_table management command or when the spreadsheet the lexicon
+comes from has changed. At runtime the table is a pickled dict that loads in
+well under a millisecond.
+"""
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+TABLE_FORMAT_VERSION = 1
+
+
+def source_signature(source_path, with_hash=True):
+    stat = os.stat(source_path)
+    signature = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+    if with_hash:
+        signature['sha256'] = hashlib.sha256(Path(source_path).read_bytes()).hexdigest()
+    return signature
+
+
+def build_table(lexicon, get_antonym):
+    """
+    Map every entry of `lexicon` (a ToxicLexicon) to its replacement.
+    """
+    entries = list(lexicon.words) + [' '.join(tokens) for tokens in lexicon.phrases]
+    return {entry: get_antonym(entry) for entry in sorted(entries)}
+
+
+def save_table(table_path, table, signature):
+    table_path = Path(table_path)
+    table_path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {'version': TABLE_FORMAT_VERSION, 'source': signature, 'table': table}
+    # Write to a temporary file first so readers never see a partial table
+    fd, tmp_path = tempfile.mkstemp(dir=table_path.parent, prefix=table_path.name, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, table_path)
+
+
+def load_table(table_path):
+    """
+    Return the stored payload, or None if the file is missing or unreadable.
+    """
+    try:
+        with open(table_path, 'rb') as f:
+            payload = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    if not isinstance(payload, dict) or payload.get('version') != TABLE_FORMAT_VERSION:
+        return None
+    return payload
+
+
+def is_current(payload, source_path):
+    """
+    True if `payload` was built from the current contents of `source_path`.
+    A matching mtime and size is trusted; otherwise the content hash decides.
+    """
+    stored = payload['source']
+    signature = source_signature(source_path, with_hash=False)
+    if signature['mtime_ns'] == stored.get('mtime_ns') and signature['size'] == stored.get('size'):
+        return True
+    return source_signature(source_path)['sha256'] == stored.get('sha256')
+
+
+def load_or_build(table_path, source_path, build):
+    """
+    Load the table at `table_path`, rebuilding it with `build()` when it is
+    missing or was built from a different version of `source_path`.
+    """
+    payload = load_table(table_path)
+    if payload is not None and is_current(payload, source_path):
+        if payload['source'].get('mtime_ns') != os.stat(source_path).st_mtime_ns:
+            # Same content, new mtime: record it so the hash is skipped next time
+            save_table(table_path, payload['table'], source_signature(source_path))
+        return payload['table']
+
+    logger.info("Antonym table at %s is missing or stale; rebuilding.", table_path)
+    table = build()
+    save_table(table_path, table, source_signature(source_path))
+    return table
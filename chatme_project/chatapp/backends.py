@@ -0,0 +1,145 @@
+# chatapp/backends.py
+"""
+Inference backends for the toxicity classifier.
+
+Every backend takes a tokenized batch (int32 `input_ids` and `attention_mask`
+of shape (batch, seq_len)) and returns a (batch, 6) float32 array of sigmoid
+probabilities in the order of `chatapp.predict.labels`. TOXICITY_BACKEND
+selects the backend used by `predict_toxicity`.
+"""
+import numpy as np
+from django.conf import settings
+
+from . import registry
+
+
+def _sigmoid(logits):
+    return 1.0 / (1.0 + np.exp(-logits))
+
+
+class InferenceBackend:
+    name = None
+
+    def predict_proba(self, input_ids, attention_mask):
+        raise NotImplementedError
+
+
+class TensorFlowBackend(InferenceBackend):
+    """
+    The original BERT SavedModel, run in-process.
+    """
+    name = 'tensorflow'
+
+    def __init__(self, bucket_lengths=None):
+        import tensorflow as tf
+
+        self._tf = tf
+        self._infer = registry.get('infer')
+        self._dtype = self._infer.structured_input_signature[1]['input_ids'].dtype
+
+        # One concrete function per bucket length, traced up front, so every
+        # bucket runs a graph specialised for its shape
+        if bucket_lengths is None:
+            bucket_lengths = registry.get('length_buckets').boundaries
+        self._functions = {length: self._trace(length) for length in bucket_lengths}
+
+    def _trace(self, length):
+        tf = self._tf
+        spec = tf.TensorSpec([None, length], self._dtype)
+        infer = self._infer
+
+        @tf.function(input_signature=[spec, spec])
+        def forward(input_ids, attention_mask):
+            logits = infer(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                token_type_ids=tf.zeros_like(input_ids),
+            )['logits']
+            return tf.sigmoid(logits)
+
+        return forward.get_concrete_function()
+
+    def predict_proba(self, input_ids, attention_mask):
+        tf = self._tf
+        input_ids = tf.constant(input_ids, dtype=self._dtype)
+        attention_mask = tf.constant(attention_mask, dtype=self._dtype)
+
+        forward = self._functions.get(int(input_ids.shape[1]))
+        if forward is not None:
+            return forward(input_ids, attention_mask).numpy()
+        logits = self._infer(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            token_type_ids=tf.zeros_like(input_ids),
+        )['logits']
+        return tf.sigmoid(logits).numpy()
+
+
+class OnnxBackend(InferenceBackend):
+    """
+    An ONNX export of the SavedModel (dynamically int8-quantized by default,
+    see the export_onnx command) run with ONNX Runtime on the CPU.
+    """
+    name = 'onnx'
+
+    def __init__(self, model_path=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = getattr(settings, 'TOXICITY_ONNX_THREADS', 0)
+        if threads:
+            options.intra_op_num_threads = threads
+
+        self._session = ort.InferenceSession(
+            str(model_path or settings.TOXICITY_ONNX_MODEL_PATH),
+            sess_options=options,
+            providers=['CPUExecutionProvider'],
+        )
+        self._inputs = {
+            model_input.name: np.int64 if 'int64' in model_input.type else np.int32
+            for model_input in self._session.get_inputs()
+        }
+        outputs = [output.name for output in self._session.get_outputs()]
+        self._output = 'logits' if 'logits' in outputs else outputs[0]
+
+    def predict_proba(self, input_ids, attention_mask):
+        feeds = {
+            'input_ids': input_ids,
+            'attention_mask': attention_mask,
+            'token_type_ids': np.zeros_like(input_ids),
+        }
+        feeds = {name: feeds[name].astype(dtype, copy=False) for name, dtype in self._inputs.items()}
+        logits = self._session.run([self._output], feeds)[0]
+        return _sigmoid(logits.astype(np.float32))
+
+
+class ModelServerBackend(InferenceBackend):
+    """
+    Scores on a shared model server started with run_model_server.
+    """
+    name = 'model_server'
+
+    def __init__(self, socket_path=None):
+        from .model_server import ModelServerClient
+
+        self._client = ModelServerClient(socket_path or settings.TOXICITY_MODEL_SERVER_SOCKET)
+
+    def predict_proba(self, input_ids, attention_mask):
+        return self._client.predict_proba(input_ids, attention_mask)
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (TensorFlowBackend, OnnxBackend, ModelServerBackend)
+}
+
+
+def create_backend(name):
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown toxicity backend '{name}'. Choose one of: {', '.join(BACKENDS)}."
+        ) from None
+    return backend_class()
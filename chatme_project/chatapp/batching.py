@@ -0,0 +1,106 @@
+# chatapp/batching.py
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Collects items submitted from many threads and hands them to `handler`
+    as a single list once `max_batch_size` items are queued or the oldest
+    queued item has waited `max_wait` seconds.
+
+    `handler` receives a list of items and must return a list of results in
+    the same order. Every caller gets a Future resolved with its own result.
+    """
+
+    def __init__(self, handler, max_batch_size=32, max_wait=0.005, name='micro-batcher'):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1.")
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = name
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def submit(self, item):
+        """
+        Queue an item and return a Future for its result.
+        """
+        future = Future()
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError(f"{self.name} has been stopped.")
+            self._ensure_worker()
+            self._queue.append((item, future, time.monotonic()))
+            self._condition.notify()
+        return future
+
+    def process(self, item, timeout=None):
+        """
+        Submit an item and block until its result is ready.
+        """
+        return self.submit(item).result(timeout=timeout)
+
+    def stop(self):
+        """
+        Flush whatever is queued and stop the worker thread.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _ensure_worker(self):
+        # Called with the condition held.
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._queue:
+                if self._stopped:
+                    return None
+                self._condition.wait()
+
+            # Wait for the batch to fill up, but never past the deadline of
+            # the oldest queued item.
+            deadline = self._queue[0][2] + self.max_wait
+            while len(self._queue) < self.max_batch_size and not self._stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            size = min(len(self._queue), self.max_batch_size)
+            return [self._queue.popleft() for _ in range(size)]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            items = [item for item, _, _ in batch]
+            futures = [future for _, future, _ in batch]
+            try:
+                results = self.handler(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"{self.name} handler returned {len(results)} results for {len(items)} items."
+                    )
+            except Exception as exc:
+                for future in futures:
+                    future.set_exception(exc)
+                continue
+
+            for future, result in zip(futures, results):
+                future.set_result(result)
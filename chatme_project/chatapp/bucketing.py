@@ -0,0 +1,72 @@
+# chatapp/bucketing.py
+import threading
+
+import numpy as np
+
+
+class LengthBuckets:
+    """
+    Groups tokenized sequences by length so each group is padded only to its
+    bucket boundary (e.g. 16/32/64/128 tokens) instead of to the longest
+    sequence in the batch. Keeps a per-bucket histogram of the traffic seen,
+    for tuning the boundaries.
+    """
+
+    def __init__(self, boundaries, max_length):
+        self.boundaries = sorted({b for b in boundaries if 0 < b < max_length} | {max_length})
+        self.max_length = max_length
+        self._lock = threading.Lock()
+        self._histogram = {
+            boundary: {'sequences': 0, 'batches': 0, 'tokens': 0, 'padded_tokens': 0}
+            for boundary in self.boundaries
+        }
+
+    def bucket_for(self, length):
+        for boundary in self.boundaries:
+            if length <= boundary:
+                return boundary
+        return self.max_length
+
+    def split(self, sequences):
+        """
+        Yield (indices, input_ids, attention_mask) for every non-empty bucket.
+        `sequences` are lists of token ids; the arrays are int32 and padded
+        with zeros to the bucket length.
+        """
+        groups = {}
+        for index, ids in enumerate(sequences):
+            groups.setdefault(self.bucket_for(len(ids)), []).append(index)
+
+        for boundary, indices in sorted(groups.items()):
+            input_ids = np.zeros((len(indices), boundary), dtype=np.int32)
+            attention_mask = np.zeros((len(indices), boundary), dtype=np.int32)
+            tokens = 0
+            for row, index in enumerate(indices):
+                ids = sequences[index][:boundary]
+                input_ids[row, :len(ids)] = ids
+                attention_mask[row, :len(ids)] = 1
+                tokens += len(ids)
+            self._record(boundary, len(indices), tokens)
+            yield indices, input_ids, attention_mask
+
+    def _record(self, boundary, sequences, tokens):
+        with self._lock:
+            entry = self._histogram[boundary]
+            entry['sequences'] += sequences
+            entry['batches'] += 1
+            entry['tokens'] += tokens
+            entry['padded_tokens'] += sequences * boundary
+
+    def histogram(self):
+        """
+        Per-bucket counters plus the share of padded positions that carried
+        real tokens.
+        """
+        with self._lock:
+            return {
+                str(boundary): {
+                    **entry,
+                    'fill_ratio': entry['tokens'] / entry['padded_tokens'] if entry['padded_tokens'] else 0.0,
+                }
+                for boundary, entry in self._histogram.items()
+            }
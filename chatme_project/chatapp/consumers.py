@@ -1,11 +1,20 @@
 # chatapp/consumers.py
+import asyncio
 import json
+from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from .models import ChatRoom, Message
+from .models import Message
 from .serializers import MessageSerializer
-from .online_users import set_user_online, set_user_offline
+from .predict import aclassify_toxicity
+from .presence import get_presence
+from . import moderation
+from .ingest import PendingMessage, get_message_writer
+from . import room_cache
+from .encoding import encoded_event
+from .moderation_feed import MODERATION_GROUP
 
 User = get_user_model()
 
@@ -15,9 +24,21 @@ class ChatConsumer(AsyncWebsocketConsumer):
         self.room_group_name = f'chat_{self.room_name}'
 
         user = self.scope["user"]
+
+        # Resolve the room once; every message on this connection reuses it.
+        # Only a cache miss needs a worker thread for the database.
+        room = room_cache.get_cached(self.room_name) or await self.get_room(self.room_name)
+        if room is None or not room.can_join(user):
+            self.room = None
+            await self.close()
+            return
+        self.room = room
+
+        self.heartbeat_task = None
         if user.is_authenticated:
-            # Mark user as online
+            # Mark user as online and keep this connection's presence fresh
             await self.mark_user_online(user.id)
+            self.heartbeat_task = asyncio.ensure_future(self.heartbeat(user.id))
 
         # Join room group
         await self.channel_layer.group_add(
@@ -27,9 +48,15 @@ class ChatConsumer(AsyncWebsocketConsumer):
         await self.accept()
 
     async def disconnect(self, close_code):
+        if getattr(self, 'room', None) is None:
+            # Rejected in connect(); never joined the group
+            return
+
         user = self.scope["user"]
         if user.is_authenticated:
             # Mark user as offline
+            if self.heartbeat_task is not None:
+                self.heartbeat_task.cancel()
             await self.mark_user_offline(user.id)
 
         # Leave room group
@@ -38,29 +65,54 @@ class ChatConsumer(AsyncWebsocketConsumer):
             self.channel_name
         )
 
-    @database_sync_to_async
-    def mark_user_online_sync(self, user_id):
-        set_user_online(user_id)
+    # Presence uses the asyncio Redis client on the event loop, without a thread hop
 
     async def mark_user_online(self, user_id):
-        await self.mark_user_online_sync(user_id)
-
-    @database_sync_to_async
-    def mark_user_offline_sync(self, user_id):
-        set_user_offline(user_id)
+        await get_presence().aconnect(user_id, self.channel_name, self.room.id)
 
     async def mark_user_offline(self, user_id):
-        await self.mark_user_offline_sync(user_id)
+        await get_presence().adisconnect(user_id, self.channel_name, self.room.id)
+
+    async def heartbeat(self, user_id):
+        interval = getattr(settings, 'PRESENCE_HEARTBEAT_INTERVAL', 30)
+        while True:
+            await asyncio.sleep(interval)
+            await self.mark_user_online(user_id)
 
     @database_sync_to_async
-    def save_message_sync(self, user, room_name, content):
-        room = ChatRoom.objects.get(name=room_name)
-        return Message.objects.create(room=room, sender=user, content=content)
+    def get_room(self, room_name):
+        return room_cache.get_room(room_name)
+
+    async def save_message(self, user, room, content):
+        strict = moderation.is_strict(room)
+        # Outside strict rooms, scoring happens after the broadcast
+        if getattr(settings, 'CHAT_BATCHED_PERSISTENCE', False):
+            # Coalesced with messages from other consumers into one bulk insert. Awaited
+            # here rather than in database_sync_to_async, which runs every consumer's
+            # call on one shared thread, so the writer would only ever see one message
+            message = await asyncio.wrap_future(
+                get_message_writer().submit(PendingMessage(room.id, user, content, moderate=strict))
+            )
+        else:
+            message = await self.save_single_message(user, room, content, strict)
+        return message, await self.encode_message(message), strict
+
+    async def save_single_message(self, user, room, content, strict):
+        message = Message(room_id=room.id, sender=user, content=content)
+        result = None
+        if strict:
+            # Filtered and classified off the shared database thread, so messages
+            # from concurrent consumers reach the toxicity batcher together
+            await sync_to_async(message.filter_content, thread_sensitive=False)()
+            result = await aclassify_toxicity(message.content)
+        await database_sync_to_async(message.save)(moderate=strict, result=result)
+        return message
 
     @database_sync_to_async
-    def serialize_message_sync(self, message_obj):
-        serializer = MessageSerializer(message_obj, context={'request': None})
-        return serializer.data
+    def encode_message(self, message):
+        # Serialized and encoded once here; every consumer in the group forwards the same text
+        serializer = MessageSerializer(message, context={'request': None})
+        return encoded_event({'message': serializer.data})
 
     async def receive(self, text_data):
         data = json.loads(text_data)
@@ -72,21 +124,47 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         # Save message to DB
-        message_obj = await self.save_message_sync(user, self.room_name, message)
-        serialized_message = await self.serialize_message_sync(message_obj)
+        message_obj, event, strict = await self.save_message(user, self.room, message)
 
         # Send message to room group
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': serialized_message
-            }
-        )
+        await self.channel_layer.group_send(self.room_group_name, event)
+
+        if not strict:
+            moderation.schedule(message_obj.id)
 
+    async def chat_message_encoded(self, event):
+        # Already JSON; forwarded without decoding
+        await self.send(text_data=event['text'])
+
+    # chat_message still handles events sent by workers running code from
+    # before pre-encoded fan-out
     async def chat_message(self, event):
         message = event['message']
         # Send message to WebSocket
         await self.send(text_data=json.dumps({
             'message': message
         }))
+
+
+class ModerationConsumer(AsyncWebsocketConsumer):
+    """
+    Pushes newly flagged messages to admins and moderators (see
+    chatapp.moderation_feed) so the moderation queue does not have to poll.
+    """
+
+    async def connect(self):
+        user = self.scope["user"]
+        if not user.is_authenticated or user.role not in ['admin', 'moderator']:
+            self.joined = False
+            await self.close()
+            return
+        self.joined = True
+        await self.channel_layer.group_add(MODERATION_GROUP, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if getattr(self, 'joined', False):
+            await self.channel_layer.group_discard(MODERATION_GROUP, self.channel_name)
+
+    async def chat_message_encoded(self, event):
+        await self.send(text_data=event['text'])
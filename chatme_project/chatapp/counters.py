@@ -0,0 +1,157 @@
+# chatapp/counters.py
+"""
+Profile toxic/non-toxic message counters.
+
+Counters are only ever changed with F() expressions, so concurrent senders
+never overwrite each other's increments and no Profile instance is saved.
+With PROFILE_COUNTER_FLUSH_MS > 0 increments are buffered in memory and
+written in bulk by a background thread instead of one UPDATE per message.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+logger = logging.getLogger(__name__)
+
+
+def increment_profile_counts(user_id, toxic=0, non_toxic=0):
+    from .models import Profile
+
+    return Profile.objects.filter(user_id=user_id).update(
+        toxic_count=F('toxic_count') + toxic,
+        non_toxic_count=F('non_toxic_count') + non_toxic,
+    )
+
+
+def apply_profile_deltas(deltas):
+    """
+    Apply {user_id: (toxic, non_toxic)} in one transaction, with one UPDATE
+    per distinct delta rather than one per user.
+    """
+    from .models import Profile
+
+    by_delta = defaultdict(list)
+    for user_id, delta in deltas.items():
+        by_delta[tuple(delta)].append(user_id)
+
+    with transaction.atomic():
+        for (toxic, non_toxic), user_ids in by_delta.items():
+            Profile.objects.filter(user_id__in=user_ids).update(
+                toxic_count=F('toxic_count') + toxic,
+                non_toxic_count=F('non_toxic_count') + non_toxic,
+            )
+
+
+def recompute_profile_counts():
+    """
+    Reset every profile's counters to its stored messages, flagged ones
+    counting as toxic and the rest as non-toxic, in a single UPDATE.
+    """
+    from .models import Message, Profile
+
+    def count(is_flagged):
+        messages = (
+            Message.objects.filter(sender_id=OuterRef('user_id'), is_flagged=is_flagged)
+            .order_by()
+            .values('sender_id')
+            .annotate(count=Count('id'))
+            .values('count')
+        )
+        return Coalesce(Subquery(messages), Value(0))
+
+    return Profile.objects.update(toxic_count=count(True), non_toxic_count=count(False))
+
+
+class CounterAggregator:
+    """
+    Buffers (toxic, non_toxic) increments per key and flushes them every
+    `interval` seconds through `apply` ({key: (toxic, non_toxic)}), which
+    defaults to the profile counters.
+    """
+
+    def __init__(self, interval, apply=None, name='profile-counters'):
+        self.interval = interval
+        self.apply = apply or apply_profile_deltas
+        self.name = name
+        self._pending = defaultdict(lambda: [0, 0])
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, key, toxic=0, non_toxic=0):
+        with self._lock:
+            entry = self._pending[key]
+            entry[0] += toxic
+            entry[1] += non_toxic
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def flush(self):
+        with self._lock:
+            pending = dict(self._pending)
+            self._pending.clear()
+        if not pending:
+            return
+        try:
+            self.apply(pending)
+        except Exception:
+            logger.exception("Failed to flush %s; re-queueing %d keys.", self.name, len(pending))
+            with self._lock:
+                for key, (toxic, non_toxic) in pending.items():
+                    entry = self._pending[key]
+                    entry[0] += toxic
+                    entry[1] += non_toxic
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            close_old_connections()
+            self.flush()
+
+
+_aggregator = None
+_aggregator_lock = threading.Lock()
+
+
+def get_aggregator():
+    global _aggregator
+    with _aggregator_lock:
+        if _aggregator is None:
+            _aggregator = CounterAggregator(settings.PROFILE_COUNTER_FLUSH_MS / 1000.0)
+            atexit.register(_aggregator.flush)
+        return _aggregator
+
+
+def record_message(user_id, toxic):
+    """
+    Count one scored message for `user_id`.
+    """
+    toxic_delta, non_toxic_delta = (1, 0) if toxic else (0, 1)
+    if getattr(settings, 'PROFILE_COUNTER_FLUSH_MS', 0) > 0:
+        get_aggregator().add(user_id, toxic_delta, non_toxic_delta)
+    else:
+        increment_profile_counts(user_id, toxic_delta, non_toxic_delta)
+
+
+def record_messages(results):
+    """
+    Count many scored messages at once. `results` yields (user_id, toxic) pairs.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    for user_id, toxic in results:
+        deltas[user_id][0 if toxic else 1] += 1
+    if not deltas:
+        return
+    if getattr(settings, 'PROFILE_COUNTER_FLUSH_MS', 0) > 0:
+        aggregator = get_aggregator()
+        for user_id, (toxic, non_toxic) in deltas.items():
+            aggregator.add(user_id, toxic, non_toxic)
+    else:
+        apply_profile_deltas(deltas)
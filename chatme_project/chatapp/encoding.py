@@ -0,0 +1,34 @@
+# chatapp/encoding.py
+"""
+One-time encoding of WebSocket events for group fan-out.
+
+An event is serialized once by the sender and broadcast as a
+'chat_message_encoded' group message; every ChatConsumer in the group
+forwards the text frame as is instead of re-encoding the same payload.
+orjson is used when it is installed; the json fallback writes the same
+compact, non-ASCII-escaping text.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+ENCODED_EVENT = 'chat_message_encoded'
+
+
+def encode(payload):
+    """
+    Return `payload` as compact JSON text.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload).decode('utf-8')
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False)
+
+
+def encoded_event(payload):
+    """
+    A group message carrying `payload` pre-encoded for ChatConsumer.
+    """
+    return {'type': ENCODED_EVENT, 'text': encode(payload)}
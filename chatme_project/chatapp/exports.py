@@ -0,0 +1,185 @@
+# chatapp/exports.py
+"""
+Streaming exports of messages and moderation data as NDJSON or CSV.
+
+Rows are read with `.values_list(...).iterator(chunk_size=EXPORT_CHUNK_SIZE)`
+and encoded a chunk at a time, so an export holds one chunk in memory no
+matter how large the table is. ExportView streams them over HTTP
+(export/<dataset>/) and the `export_data` command writes them to a file.
+Under ASGI the chunks are pulled through `aiterate`, because Django reads a
+synchronous streaming iterator to the end before sending any of it there.
+"""
+import csv
+import io
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Sum
+
+from .encoding import encode
+
+FORMATS = ('ndjson', 'csv')
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+MESSAGE_COLUMNS = (
+    ('id', 'id'),
+    ('room_id', 'room_id'),
+    ('room', 'room__name'),
+    ('sender_id', 'sender_id'),
+    ('sender', 'sender__username'),
+    ('content', 'content'),
+    ('is_flagged', 'is_flagged'),
+    ('toxicity', 'toxicity'),
+    ('timestamp', 'timestamp'),
+)
+
+
+class Export:
+    """
+    One exportable dataset: `columns` pairs output names with value lookups
+    on the queryset built by `get_queryset`. `time_field` and `room_field`
+    are what the since/until and room filters apply to, None when the
+    dataset has no such field.
+    """
+    columns = ()
+    time_field = None
+    room_field = None
+    ordering = ()
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def group(self, queryset):
+        return queryset
+
+    def rows(self, since=None, until=None, room_id=None):
+        queryset = self.get_queryset()
+        if since is not None:
+            queryset = queryset.filter(**{f'{self.time_field}__gte': since})
+        if until is not None:
+            queryset = queryset.filter(**{f'{self.time_field}__lt': until})
+        if room_id is not None:
+            queryset = queryset.filter(**{self.room_field: room_id})
+        queryset = self.group(queryset).order_by(*self.ordering)
+        chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+        return queryset.values_list(*(lookup for _, lookup in self.columns)).iterator(chunk_size=chunk_size)
+
+
+class MessageExport(Export):
+    columns = MESSAGE_COLUMNS
+    time_field = 'timestamp'
+    room_field = 'room_id'
+    # Served by the (room, timestamp, id) index when filtering on a room
+    ordering = ('timestamp', 'id')
+
+    def get_queryset(self):
+        from .models import Message
+
+        return Message.objects.all()
+
+
+class FlaggedMessageExport(MessageExport):
+    def get_queryset(self):
+        # Matches the partial flagged-message indexes
+        return super().get_queryset().filter(is_flagged=True)
+
+
+class FeedbackExport(Export):
+    columns = (
+        ('id', 'id'),
+        ('user_id', 'user_id'),
+        ('username', 'user__username'),
+        ('feedback', 'content'),
+        ('timestamp', 'timestamp'),
+    )
+    time_field = 'timestamp'
+    ordering = ('timestamp', 'id')
+
+    def get_queryset(self):
+        from .models import Feedback
+
+        return Feedback.objects.all()
+
+
+class UserActivityExport(Export):
+    """
+    Toxic and non-toxic message counts per user, summed from the daily
+    toxicity aggregates, so the time range applies to whole UTC days.
+    """
+    columns = (
+        ('id', 'user_id'),
+        ('username', 'user__username'),
+        ('toxic_count', 'toxic'),
+        ('non_toxic_count', 'non_toxic'),
+        ('is_blocked', 'user__is_blocked'),
+    )
+    time_field = 'bucket_start'
+    room_field = 'room_id'
+    ordering = ('user_id',)
+
+    def get_queryset(self):
+        from .models import ToxicityAggregate
+
+        return ToxicityAggregate.objects.filter(granularity='day')
+
+    def group(self, queryset):
+        return queryset.values('user_id', 'user__username', 'user__is_blocked').annotate(
+            toxic=Sum('toxic_count'), non_toxic=Sum('non_toxic_count'),
+        )
+
+
+EXPORTS = {
+    'messages': MessageExport(),
+    'flagged-messages': FlaggedMessageExport(),
+    'feedback': FeedbackExport(),
+    'user-activity': UserActivityExport(),
+}
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def stream(export, output='ndjson', since=None, until=None, room_id=None):
+    """
+    Yield the rows of `export` encoded as `output`, one string per chunk.
+    """
+    chunk_size = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+    names = [name for name, _ in export.columns]
+    buffer = io.StringIO()
+    if output == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+        write = lambda row: writer.writerow([_plain(value) for value in row])
+    else:
+        write = lambda row: buffer.write(encode({name: _plain(value) for name, value in zip(names, row)}) + '\n')
+
+    for count, row in enumerate(export.rows(since, until, room_id), 1):
+        write(row)
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def aiterate(chunks):
+    """
+    Async iterator over a `stream` generator for ASGI responses. Each chunk
+    is produced on the shared sync thread, which owns the database cursor.
+    """
+    step = sync_to_async(next, thread_sensitive=True)
+    try:
+        while True:
+            chunk = await step(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close, thread_sensitive=True)()
@@ -0,0 +1,100 @@
+# chatapp/ingest.py
+"""
+Batched message persistence.
+
+`persist_messages` filters, scores and stores many messages at once: one
+batched classifier call, one `bulk_create` and one counter and aggregate
+update per batch.
+WebSocket consumers reach it through a process-wide MicroBatcher when
+CHAT_BATCHED_PERSISTENCE is enabled, so messages from every consumer in a
+worker are coalesced into a single write; the import endpoint feeds it
+chunks of a message backlog directly.
+"""
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from . import aggregates
+from .batching import MicroBatcher
+from .counters import record_messages
+from .models import Message
+from .moderation_feed import publish_flagged
+from .predict import classify_toxicity_batch
+
+
+class PendingMessage:
+    """
+    A message waiting to be stored. Messages with moderate=False are stored
+    unscored and left to chatapp.moderation.
+    """
+    __slots__ = ('room_id', 'sender', 'content', 'moderate')
+
+    def __init__(self, room_id, sender, content, moderate=True):
+        self.room_id = room_id
+        self.sender = sender
+        self.content = content
+        self.moderate = moderate
+
+
+def persist_messages(pending):
+    """
+    Store a list of PendingMessage and return the saved Message objects in
+    the same order.
+    """
+    messages = []
+    to_score = []
+    for item in pending:
+        message = Message(room_id=item.room_id, sender=item.sender, content=item.content)
+        message.filter_content()
+        messages.append(message)
+        if item.moderate:
+            to_score.append(message)
+
+    results = classify_toxicity_batch([message.content for message in to_score])
+    for message, result in zip(to_score, results):
+        message.apply_toxicity(result.label)
+        message.store_scores(result.probabilities)
+
+    with transaction.atomic():
+        Message.objects.bulk_create(messages)
+    publish_flagged(to_score)
+
+    record_messages(
+        (message.sender_id, result.is_toxic)
+        for message, result in zip(to_score, results)
+        if message.sender_id
+    )
+    aggregates.record_messages(
+        (message.sender_id, message.room_id, message.timestamp, result.is_toxic)
+        for message, result in zip(to_score, results)
+        if message.sender_id
+    )
+    return messages
+
+
+def _persist_from_batcher(pending):
+    # The batcher thread keeps its own database connection
+    close_old_connections()
+    return persist_messages(pending)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_message_writer():
+    """
+    Return the process-wide batcher that coalesces consumer messages into
+    persist_messages calls.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = MicroBatcher(
+                _persist_from_batcher,
+                max_batch_size=getattr(settings, 'CHAT_PERSIST_BATCH_SIZE', 64),
+                max_wait=getattr(settings, 'CHAT_PERSIST_MAX_WAIT_MS', 10) / 1000.0,
+                name='message-writer',
+            )
+        return _writer
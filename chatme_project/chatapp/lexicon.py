@@ -0,0 +1,131 @@
+# chatapp/lexicon.py
+import string
+
+
+def clean_word(word):
+    """
+    Strip surrounding punctuation and lowercase a word.
+    """
+    return word.strip(string.punctuation).lower()
+
+
+class ToxicLexicon:
+    """
+    Compiled matcher for the toxic-word list.
+
+    Single-word entries live in a set. Multi-word entries are compiled into an
+    Aho-Corasick automaton over cleaned tokens, so a message is matched in one
+    pass regardless of lexicon size and phrases only match on word boundaries.
+    """
+
+    def __init__(self, entries):
+        self.words = set()
+        self.phrases = set()
+
+        # Automaton state: goto transitions, failure links and, for every node,
+        # the lengths (in tokens) of the phrases that end there.
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+
+        for entry in entries:
+            if not isinstance(entry, str):
+                continue
+            tokens = tuple(token for token in (clean_word(t) for t in entry.split()) if token)
+            if len(tokens) == 1:
+                self.words.add(tokens[0])
+            elif tokens:
+                self.phrases.add(tokens)
+
+        for tokens in self.phrases:
+            self._add_phrase(tokens)
+        self._build_failure_links()
+
+    def __len__(self):
+        return len(self.words) + len(self.phrases)
+
+    def __contains__(self, entry):
+        tokens = tuple(token for token in (clean_word(t) for t in entry.split()) if token)
+        return (len(tokens) == 1 and tokens[0] in self.words) or tokens in self.phrases
+
+    def _add_phrase(self, tokens):
+        node = 0
+        for token in tokens:
+            next_node = self._goto[node].get(token)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][token] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = next_node
+        self._out[node] = self._out[node] + (len(tokens),)
+
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            node = queue[head]
+            head += 1
+            for token, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(token, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def find(self, tokens):
+        """
+        Return non-overlapping (start, end) token spans of lexicon entries,
+        preferring the leftmost and then the longest match.
+        """
+        matches = []
+        node = 0
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        words = self.words
+
+        for i, token in enumerate(tokens):
+            if token in words:
+                matches.append((i, i + 1))
+            while node and token not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(token, 0)
+            for length in out[node]:
+                matches.append((i + 1 - length, i + 1))
+
+        if not matches:
+            return []
+
+        matches.sort(key=lambda span: (span[0], span[0] - span[1]))
+        spans = []
+        last_end = 0
+        for start, end in matches:
+            if start >= last_end:
+                spans.append((start, end))
+                last_end = end
+        return spans
+
+    def replace(self, text, replacement):
+        """
+        Replace every lexicon entry in `text` with `replacement(entry)`, where
+        `entry` is the cleaned, space-joined matched words. Words are rejoined
+        with single spaces, as the original word-by-word filter did.
+        """
+        words = text.split()
+        tokens = [clean_word(word) for word in words]
+        spans = self.find(tokens)
+        if not spans:
+            return ' '.join(words)
+
+        result = []
+        position = 0
+        for start, end in spans:
+            result.extend(words[position:start])
+            result.append(replacement(' '.join(tokens[start:end])))
+            position = end
+        result.extend(words[position:])
+        return ' '.join(result)
@@ -0,0 +1,55 @@
+# chatapp/management/commands/backfill_toxicity_aggregates.py
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from chatapp.aggregates import add_message, apply_aggregate_deltas
+from chatapp.models import Message, ToxicityAggregate
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the hourly/daily toxicity aggregates from the stored messages. "
+        "Messages are streamed in id order and counted in chunks, so memory stays "
+        "flat however long the history is. Flagged messages count as toxic, all "
+        "others as non-toxic."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000,
+                            help="Messages read per database round-trip and counted per write.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        # Messages stored after this point are counted live by the pipeline
+        last_id = Message.objects.aggregate(last_id=Max('id'))['last_id']
+        deleted, _ = ToxicityAggregate.objects.all().delete()
+        self.stdout.write(f"Removed {deleted} aggregate rows.")
+        if last_id is None:
+            return
+
+        rows = (
+            Message.objects.filter(id__lte=last_id)
+            .order_by('id')
+            .values_list('sender_id', 'room_id', 'timestamp', 'is_flagged')
+            .iterator(chunk_size=chunk_size)
+        )
+        started = time.perf_counter()
+        counted = 0
+        deltas = defaultdict(lambda: [0, 0])
+        for sender_id, room_id, timestamp, is_flagged in rows:
+            add_message(deltas, sender_id, room_id, timestamp, is_flagged)
+            counted += 1
+            if counted % chunk_size == 0:
+                apply_aggregate_deltas(deltas)
+                deltas.clear()
+                self.stdout.write(f"{counted} messages counted")
+        apply_aggregate_deltas(deltas)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Counted {counted} messages into {ToxicityAggregate.objects.count()} aggregate rows "
+            f"in {elapsed:.1f}s."
+        ))
@@ -0,0 +1,97 @@
+# chatapp/management/commands/benchmark_backends.py
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from chatapp import registry
+from chatapp.backends import BACKENDS, create_backend
+
+CORPUS_PATH = Path(__file__).resolve().parents[2] / 'testdata' / 'parity_corpus.txt'
+
+
+def _rss_mb():
+    """
+    Current resident set size of this process.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Command(BaseCommand):
+    help = "Report p50/p99 latency and RSS for each toxicity inference backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', nargs='+', default=['tensorflow', 'onnx'],
+                            choices=sorted(BACKENDS))
+        parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['child']:
+            # Measure one backend in this fresh process and report as JSON
+            self.stdout.write(json.dumps(self._measure(options['backends'][0], options)))
+            return
+
+        self.stdout.write(
+            f"{'backend':<14} {'batch':>5} {'p50 ms':>9} {'p99 ms':>9} {'msgs/s':>9} {'RSS MB':>8}"
+        )
+        for backend in options['backends']:
+            # Each backend runs in its own process so RSS is not shared between them
+            result = subprocess.run(
+                [sys.executable, sys.argv[0], 'benchmark_backends', '--child',
+                 '--backends', backend,
+                 '--iterations', str(options['iterations']),
+                 '--batch-sizes', *map(str, options['batch_sizes'])],
+                capture_output=True, text=True,
+            )
+            if result.returncode != 0:
+                raise CommandError(f"{backend} benchmark failed:\n{result.stderr}")
+            report = json.loads(result.stdout.strip().splitlines()[-1])
+            for row in report['rows']:
+                self.stdout.write(
+                    f"{backend:<14} {row['batch_size']:>5} {row['p50']:>9.2f} {row['p99']:>9.2f} "
+                    f"{row['throughput']:>9.1f} {report['rss_mb']:>8.0f}"
+                )
+
+    def _measure(self, name, options):
+        corpus = CORPUS_PATH.read_text().splitlines()
+        tokenizer = registry.get('tokenizer')
+        backend = create_backend(name)
+
+        rows = []
+        for batch_size in options['batch_sizes']:
+            texts = [corpus[i % len(corpus)] for i in range(batch_size)]
+            encodings = tokenizer(texts, padding=True, truncation=True, max_length=128, return_tensors='np')
+            input_ids = encodings['input_ids'].astype(np.int32)
+            attention_mask = encodings['attention_mask'].astype(np.int32)
+
+            backend.predict_proba(input_ids, attention_mask)  # warm-up
+            timings = []
+            for _ in range(options['iterations']):
+                started = time.perf_counter()
+                backend.predict_proba(input_ids, attention_mask)
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            rows.append({
+                'batch_size': batch_size,
+                'p50': statistics.median(timings) * 1000,
+                'p99': timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000,
+                'throughput': batch_size / statistics.mean(timings),
+            })
+        return {'rows': rows, 'rss_mb': _rss_mb()}
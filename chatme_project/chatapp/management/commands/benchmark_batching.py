@@ -0,0 +1,98 @@
+# chatapp/management/commands/benchmark_batching.py
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from chatapp.batching import MicroBatcher
+
+
+class Command(BaseCommand):
+    help = "Measure throughput and latency of the toxicity micro-batcher at different sender counts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--senders', type=int, nargs='+', default=[1, 8, 32, 128],
+                            help="Concurrent sender counts to benchmark.")
+        parser.add_argument('--messages', type=int, default=50,
+                            help="Messages sent by each sender.")
+        parser.add_argument('--max-batch-size', type=int, default=32)
+        parser.add_argument('--max-wait-ms', type=float, default=5)
+        parser.add_argument('--simulate-ms', type=float, default=None,
+                            help="Replace the model with a fixed cost per batch (in ms) "
+                                 "plus --simulate-item-ms per item.")
+        parser.add_argument('--simulate-item-ms', type=float, default=0.5)
+
+    def handle(self, *args, **options):
+        handler = self._make_handler(options)
+
+        self.stdout.write(
+            f"max_batch_size={options['max_batch_size']} max_wait_ms={options['max_wait_ms']}"
+        )
+        self.stdout.write(
+            f"{'senders':>8} {'msgs/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'avg batch':>10}"
+        )
+        for senders in options['senders']:
+            result = self._run(handler, senders, options)
+            self.stdout.write(
+                f"{senders:>8} {result['throughput']:>10.1f} {result['p50']:>9.2f} "
+                f"{result['p99']:>9.2f} {result['avg_batch']:>10.1f}"
+            )
+
+    def _make_handler(self, options):
+        if options['simulate_ms'] is None:
+            from chatapp.predict import predict_toxicity_batch
+            return predict_toxicity_batch
+
+        batch_cost = options['simulate_ms'] / 1000.0
+        item_cost = options['simulate_item_ms'] / 1000.0
+
+        def simulated(items):
+            time.sleep(batch_cost + item_cost * len(items))
+            return ['non-toxic'] * len(items)
+
+        return simulated
+
+    def _run(self, handler, senders, options):
+        batch_sizes = []
+
+        def counting_handler(items):
+            batch_sizes.append(len(items))
+            return handler(items)
+
+        batcher = MicroBatcher(
+            counting_handler,
+            max_batch_size=options['max_batch_size'],
+            max_wait=options['max_wait_ms'] / 1000.0,
+            name='benchmark-batcher',
+        )
+        latencies = []
+        latencies_lock = threading.Lock()
+        start_barrier = threading.Barrier(senders)
+
+        def sender(index):
+            own = []
+            start_barrier.wait()
+            for n in range(options['messages']):
+                started = time.perf_counter()
+                batcher.process(f"sender {index} message {n}")
+                own.append(time.perf_counter() - started)
+            with latencies_lock:
+                latencies.extend(own)
+
+        threads = [threading.Thread(target=sender, args=(i,)) for i in range(senders)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        batcher.stop()
+
+        latencies.sort()
+        return {
+            'throughput': len(latencies) / elapsed,
+            'p50': statistics.median(latencies) * 1000,
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+            'avg_batch': sum(batch_sizes) / len(batch_sizes),
+        }
@@ -0,0 +1,112 @@
+# chatapp/management/commands/benchmark_broadcast.py
+import asyncio
+import statistics
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from chatapp.consumers import ChatConsumer
+from chatapp.encoding import encoded_event
+
+# Shaped like MessageSerializer output
+SAMPLE_MESSAGE = {
+    'id': 123456,
+    'room': 42,
+    'sender': {
+        'id': 7,
+        'username': 'alice',
+        'image_url': 'http://localhost:8000/media/profile_images/7/avatar.png',
+        'is_online': True,
+    },
+    'sender_username': 'alice',
+    'sender_profile': {
+        'display_name': 'Alice',
+        'phone_number': '+1 555 0100',
+        'image': 'http://localhost:8000/media/profile_images/7/avatar.png',
+    },
+    'content': 'See you all at the meeting tomorrow, bring the slides please! ' * 2,
+    'timestamp': '2024-05-01T12:34:56.789012Z',
+    'is_flagged': False,
+    'toxicity': '',
+}
+
+
+class Recipient(ChatConsumer):
+    """
+    A ChatConsumer whose WebSocket writes are counted instead of sent.
+    """
+
+    def __init__(self):
+        self.frames = 0
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        self.frames += 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare broadcasting a chat message as a dict re-encoded by every recipient "
+        "with broadcasting it pre-encoded once, at different room sizes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room-sizes', type=int, nargs='+', default=[10, 100, 500, 1000])
+        parser.add_argument('--messages', type=int, default=50, help="Broadcasts per room size.")
+
+    def handle(self, *args, **options):
+        for title, run in (
+            ("Consumer handlers only (encoding cost)", self._run_handlers),
+            ("group_send plus delivery through the in-memory channel layer", self._run_layer),
+        ):
+            self.stdout.write(f"{title}, ms per broadcast:")
+            self.stdout.write(f"{'members':>8} {'per-recipient':>14} {'pre-encoded':>12} {'speed-up':>9}")
+            for size in options['room_sizes']:
+                legacy, encoded = asyncio.run(run(size, options['messages']))
+                self.stdout.write(f"{size:>8} {legacy:>14.3f} {encoded:>12.3f} {legacy / encoded:>8.1f}x")
+
+    def _legacy_event(self):
+        return {'type': 'chat_message', 'message': SAMPLE_MESSAGE}
+
+    def _encoded_event(self):
+        return encoded_event({'message': SAMPLE_MESSAGE})
+
+    async def _run_handlers(self, size, messages):
+        recipient = Recipient()
+
+        async def broadcast(make_event):
+            event = make_event()
+            handler = getattr(recipient, event['type'])
+            for _ in range(size):
+                await handler(event)
+
+        return (
+            await self._time(broadcast, self._legacy_event, messages),
+            await self._time(broadcast, self._encoded_event, messages),
+        )
+
+    async def _run_layer(self, size, messages):
+        layer = InMemoryChannelLayer(capacity=messages * 2 + 10)
+        channels = [await layer.new_channel() for _ in range(size)]
+        for channel in channels:
+            await layer.group_add('benchmark', channel)
+        recipient = Recipient()
+
+        async def broadcast(make_event):
+            await layer.group_send('benchmark', make_event())
+            for channel in channels:
+                event = await layer.receive(channel)
+                await getattr(recipient, event['type'])(event)
+
+        return (
+            await self._time(broadcast, self._legacy_event, messages),
+            await self._time(broadcast, self._encoded_event, messages),
+        )
+
+    async def _time(self, broadcast, make_event, messages):
+        timings = []
+        for _ in range(messages):
+            started = time.perf_counter()
+            await broadcast(make_event)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
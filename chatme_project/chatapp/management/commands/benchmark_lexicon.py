@@ -0,0 +1,82 @@
+# chatapp/management/commands/benchmark_lexicon.py
+import random
+import string
+import time
+
+from django.core.management.base import BaseCommand
+
+from chatapp.lexicon import ToxicLexicon, clean_word
+
+
+def legacy_replace(text, toxic_words, replacement):
+    """
+    The original word-by-word filter: a linear scan of the word list per token.
+    """
+    words = text.split()
+    for i, word in enumerate(words):
+        clean_word_check = clean_word(word)
+        if clean_word_check in toxic_words:
+            words[i] = replacement(clean_word_check)
+    return ' '.join(words)
+
+
+class Command(BaseCommand):
+    help = "Compare the compiled toxic-word matcher with the original list scan."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=10000, help="Lexicon size.")
+        parser.add_argument('--phrase-ratio', type=float, default=0.1,
+                            help="Fraction of lexicon entries that are multi-word phrases.")
+        parser.add_argument('--words', type=int, default=1000, help="Words per message.")
+        parser.add_argument('--messages', type=int, default=20)
+        parser.add_argument('--hit-ratio', type=float, default=0.05,
+                            help="Fraction of message words drawn from the lexicon.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        def random_word():
+            return ''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10)))
+
+        entries = []
+        for _ in range(options['entries']):
+            if rng.random() < options['phrase_ratio']:
+                entries.append(' '.join(random_word() for _ in range(rng.randint(2, 3))))
+            else:
+                entries.append(random_word())
+
+        messages = []
+        for _ in range(options['messages']):
+            words = []
+            while len(words) < options['words']:
+                if rng.random() < options['hit_ratio']:
+                    words.extend(rng.choice(entries).split())
+                else:
+                    words.append(random_word() + rng.choice(['', '', ',', '.']))
+            messages.append(' '.join(words))
+
+        def replacement(entry):
+            return entry.upper()
+
+        started = time.perf_counter()
+        lexicon = ToxicLexicon(entries)
+        build_time = time.perf_counter() - started
+
+        legacy_time = self._time(lambda text: legacy_replace(text, entries, replacement), messages)
+        compiled_time = self._time(lambda text: lexicon.replace(text, replacement), messages)
+
+        self.stdout.write(
+            f"lexicon: {len(entries)} entries ({len(lexicon.phrases)} phrases), "
+            f"messages: {len(messages)} x {options['words']} words"
+        )
+        self.stdout.write(f"compiled lexicon build: {build_time * 1000:.1f} ms")
+        self.stdout.write(f"legacy list scan:       {legacy_time * 1000:.2f} ms/message")
+        self.stdout.write(f"compiled matcher:       {compiled_time * 1000:.2f} ms/message")
+        self.stdout.write(f"speed-up:               {legacy_time / compiled_time:.0f}x")
+
+    def _time(self, replace, messages):
+        started = time.perf_counter()
+        for text in messages:
+            replace(text)
+        return (time.perf_counter() - started) / len(messages)
@@ -0,0 +1,100 @@
+# chatapp/management/commands/benchmark_message_pages.py
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from chatapp.models import ChatRoom, Message, User
+from chatapp.pagination import MessageCursorPagination, encode_cursor
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a room with a large message history and compare keyset page fetches "
+        "with OFFSET pagination at increasing depths."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1_000_000,
+                            help="Messages in the benchmark room (seeded once, reused on later runs).")
+        parser.add_argument('--room', default='benchmark-history')
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--depths', type=float, nargs='+', default=[0, 0.1, 0.5, 0.9, 0.999],
+                            help="Positions to page from, as a fraction of the history (0 = newest).")
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed-batch-size', type=int, default=10_000)
+        parser.add_argument('--delete', action='store_true',
+                            help="Delete the benchmark room and its messages when done.")
+
+    def handle(self, *args, **options):
+        room = self._seed(options)
+        total = Message.objects.filter(room=room).count()
+        page_size = options['page_size']
+        factory = APIRequestFactory()
+
+        self.stdout.write(f"room '{room.name}': {total} messages, page size {page_size}")
+        self.stdout.write(f"{'depth':>8} {'offset':>10} {'keyset ms':>10} {'OFFSET ms':>10}")
+        newest_first = Message.objects.filter(room=room).order_by('-timestamp', '-id')
+        for depth in options['depths']:
+            offset = min(int(total * depth), max(total - page_size, 0))
+            params = {'page_size': page_size}
+            if offset:
+                # The cursor a client holds after scrolling back `offset` messages
+                params['before'] = encode_cursor(newest_first[offset - 1])
+            request = Request(factory.get('/', params))
+
+            def keyset():
+                return MessageCursorPagination().paginate_queryset(
+                    Message.objects.filter(room=room), request
+                )
+
+            def by_offset():
+                return list(newest_first[offset:offset + page_size])
+
+            self.stdout.write(
+                f"{depth:>8.3f} {offset:>10} {self._time(keyset, options):>10.2f} "
+                f"{self._time(by_offset, options):>10.2f}"
+            )
+
+        if options['delete']:
+            room.delete()
+            User.objects.filter(username='benchmark-history-sender').delete()
+
+    def _seed(self, options):
+        room, _ = ChatRoom.objects.get_or_create(name=options['room'], defaults={'is_group': True})
+        sender, _ = User.objects.get_or_create(
+            username='benchmark-history-sender',
+            defaults={'email': 'benchmark-history@example.com'},
+        )
+        existing = Message.objects.filter(room=room).count()
+        missing = options['messages'] - existing
+        if missing <= 0:
+            return room
+
+        self.stdout.write(f"Seeding {missing} messages...")
+        started = time.perf_counter()
+        batch_size = options['seed_batch_size']
+        while missing > 0:
+            count = min(batch_size, missing)
+            # bulk_create skips Message.save(), so nothing is scored
+            with transaction.atomic():
+                Message.objects.bulk_create(
+                    Message(room=room, sender=sender, content=f'message {existing + i}',
+                            updated_content=f'message {existing + i}', toxicity='')
+                    for i in range(count)
+                )
+            existing += count
+            missing -= count
+        self.stdout.write(f"Seeded in {time.perf_counter() - started:.1f}s")
+        return room
+
+    def _time(self, fetch, options):
+        timings = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            fetch()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
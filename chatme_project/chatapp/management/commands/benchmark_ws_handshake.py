@@ -0,0 +1,84 @@
+# chatapp/management/commands/benchmark_ws_handshake.py
+import asyncio
+import time
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from jwt import decode as jwt_decode
+from rest_framework_simplejwt.tokens import AccessToken, UntypedToken
+
+from chatapp import token_cache
+from chatapp.middleware import TokenAuthMiddleware
+from chatapp.models import User
+
+
+@database_sync_to_async
+def legacy_get_user(token):
+    """
+    The original handshake: two decodes and a database fetch every time.
+    """
+    UntypedToken(token)
+    decoded_data = jwt_decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+    return User.objects.get(id=decoded_data.get('user_id'))
+
+
+async def accept(scope, receive, send):
+    return scope['user']
+
+
+class Command(BaseCommand):
+    help = "Measure WebSocket handshake authentication rate with and without the token cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--handshakes', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=50,
+                            help="Distinct users (tokens) reconnecting.")
+        parser.add_argument('--concurrency', type=int, default=100)
+
+    def handle(self, *args, **options):
+        users = [
+            User.objects.get_or_create(
+                username=f'benchmark-ws-{i}', defaults={'email': f'benchmark-ws-{i}@example.com'}
+            )[0]
+            for i in range(options['users'])
+        ]
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+        middleware = TokenAuthMiddleware(accept)
+
+        async def cached_handshake(token):
+            scope = {'type': 'websocket', 'query_string': f'token={token}'.encode()}
+            return await middleware(scope, None, None)
+
+        async def cold_handshake(token):
+            token_cache.clear()
+            return await cached_handshake(token)
+
+        try:
+            self.stdout.write(
+                f"{options['handshakes']} handshakes from {len(tokens)} users, "
+                f"{options['concurrency']} at a time"
+            )
+            for label, handshake in (
+                ("original (2 decodes + DB)", legacy_get_user),
+                ("cache disabled (1 decode + DB)", cold_handshake),
+                ("token cache", cached_handshake),
+            ):
+                token_cache.clear()
+                rate = asyncio.run(self._run(handshake, tokens, options))
+                self.stdout.write(f"{label:<32} {rate:>10.0f} handshakes/s")
+        finally:
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+            token_cache.clear()
+
+    async def _run(self, handshake, tokens, options):
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def one(i):
+            async with semaphore:
+                user = await handshake(tokens[i % len(tokens)])
+                assert user.is_authenticated
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(options['handshakes'])))
+        return options['handshakes'] / (time.perf_counter() - started)
@@ -0,0 +1,26 @@
+# chatapp/management/commands/build_antonym_table.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chatapp import registry
+from chatapp.antonyms import build_table, save_table, source_signature
+from chatapp.utils import get_antonym
+
+
+class Command(BaseCommand):
+    help = "Precompute the antonym replacement for every toxic-word lexicon entry."
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        lexicon = registry.get('toxic_lexicon')
+        table = build_table(lexicon, get_antonym)
+        save_table(settings.ANTONYM_TABLE_PATH, table, source_signature(settings.TOXIC_WORDS_PATH))
+        registry.reset('antonym_table')
+
+        replaced = sum(1 for entry, antonym in table.items() if entry != antonym)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(table)} entries ({replaced} with an antonym) to "
+            f"{settings.ANTONYM_TABLE_PATH} in {time.perf_counter() - started:.2f}s."
+        ))
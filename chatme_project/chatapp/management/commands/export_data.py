@@ -0,0 +1,40 @@
+# chatapp/management/commands/export_data.py
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from chatapp.exports import EXPORTS, FORMATS, stream
+from chatapp.views import parse_time_bound
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream messages, flagged messages, feedback or user activity as NDJSON or CSV "
+        "to a file or stdout, with the same filters as the export/<dataset>/ endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(EXPORTS))
+        parser.add_argument('--output', choices=FORMATS, default='ndjson')
+        parser.add_argument('--since', help="ISO date or datetime, inclusive.")
+        parser.add_argument('--until', help="ISO date or datetime, exclusive.")
+        parser.add_argument('--room', type=int, help="Room id.")
+        parser.add_argument('--file', help="Write to this path instead of stdout.")
+
+    def handle(self, *args, **options):
+        export = EXPORTS[options['dataset']]
+        if options['room'] is not None and export.room_field is None:
+            raise CommandError(f"{options['dataset']} cannot be filtered by room.")
+        try:
+            since = parse_time_bound('since', options['since']) if options['since'] else None
+            until = parse_time_bound('until', options['until']) if options['until'] else None
+        except ValidationError as exc:
+            raise CommandError(exc.detail)
+
+        chunks = stream(export, options['output'], since, until, options['room'])
+        if options['file']:
+            with open(options['file'], 'w', encoding='utf-8', newline='') as out:
+                for chunk in chunks:
+                    out.write(chunk)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,50 @@
+# chatapp/management/commands/export_onnx.py
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Convert the BERT SavedModel to ONNX and quantize its weights to int8."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None,
+                            help="Destination .onnx file (default: TOXICITY_ONNX_MODEL_PATH).")
+        parser.add_argument('--opset', type=int, default=13)
+        parser.add_argument('--no-quantize', action='store_true',
+                            help="Keep float32 weights instead of dynamic int8 quantization.")
+
+    def handle(self, *args, **options):
+        try:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+        except ImportError:
+            raise CommandError("export_onnx needs onnxruntime and tf2onnx installed.")
+
+        output = Path(options['output'] or settings.TOXICITY_ONNX_MODEL_PATH)
+        output.parent.mkdir(parents=True, exist_ok=True)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            fp32_path = Path(tmp) / 'model.fp32.onnx'
+            self.stdout.write(f"Converting {settings.TOXICITY_MODEL_PATH} (opset {options['opset']})...")
+            result = subprocess.run([
+                sys.executable, '-m', 'tf2onnx.convert',
+                '--saved-model', str(settings.TOXICITY_MODEL_PATH),
+                '--signature_def', 'serving_default',
+                '--opset', str(options['opset']),
+                '--output', str(fp32_path),
+            ])
+            if result.returncode != 0:
+                raise CommandError("tf2onnx conversion failed.")
+
+            if options['no_quantize']:
+                output.write_bytes(fp32_path.read_bytes())
+            else:
+                self.stdout.write("Applying dynamic int8 quantization...")
+                quantize_dynamic(str(fp32_path), str(output), weight_type=QuantType.QInt8)
+
+        size_mb = output.stat().st_size / (1024 * 1024)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {output} ({size_mb:.1f} MB)."))
@@ -0,0 +1,151 @@
+# chatapp/management/commands/rescore_messages.py
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from chatapp import registry
+from chatapp.counters import recompute_profile_counts
+from chatapp.models import Message
+from chatapp.predict import labels_from_probabilities, predict_probabilities_batch
+from chatapp.scores import pack
+
+
+def _init_worker():
+    # Spawned workers start from a fresh interpreter
+    django.setup()
+
+
+def _score(texts):
+    return predict_probabilities_batch(texts)
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-run the toxicity classifier over stored messages, for example after a model "
+        "update, and write back is_flagged/toxicity and the stored per-label scores. "
+        "Content is not re-filtered. Messages are read in id-ordered chunks and scored "
+        "in batches across a process pool. "
+        "Progress is checkpointed after every chunk, so an interrupted run resumes where "
+        "it stopped. Profile counters and toxicity aggregates are recomputed once at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=4096,
+                            help="Messages read, scored and written per step.")
+        parser.add_argument('--batch-size', type=int, default=256,
+                            help="Messages per classifier call in a worker.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Scoring processes; 0 scores in this process.")
+        parser.add_argument('--checkpoint', default='rescore_messages.checkpoint.json',
+                            help="Progress file used to resume an interrupted run.")
+        parser.add_argument('--restart', action='store_true',
+                            help="Ignore an existing checkpoint and start from the first message.")
+
+    def handle(self, *args, **options):
+        checkpoint_path = options['checkpoint']
+        state = None if options['restart'] else self._load_checkpoint(checkpoint_path)
+        if state is None:
+            # Messages stored after this point are scored by the live pipeline
+            max_id = Message.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+            state = {'last_id': 0, 'max_id': max_id, 'scored': 0, 'changed': 0}
+        else:
+            self.stdout.write(f"Resuming after message {state['last_id']} of {state['max_id']}.")
+
+        executor = None
+        if options['workers'] > 0:
+            # Spawned, not forked: the pool starts its workers lazily, by which time
+            # this process has reopened its database connection, and forked children
+            # would share it
+            executor = ProcessPoolExecutor(
+                max_workers=options['workers'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+        started = time.perf_counter()
+        scored_before = state['scored']
+        try:
+            while state['last_id'] < state['max_id']:
+                rows = list(
+                    Message.objects.filter(id__gt=state['last_id'], id__lte=state['max_id'])
+                    .order_by('id')
+                    .values_list('id', 'content', 'is_flagged', 'toxicity')[:options['chunk_size']]
+                )
+                if not rows:
+                    state['last_id'] = state['max_id']
+                    break
+                state['changed'] += self._rescore(rows, executor, options['batch_size'])
+                state['scored'] += len(rows)
+                state['last_id'] = rows[-1][0]
+                self._save_checkpoint(checkpoint_path, state)
+
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{state['scored']} scored, {state['changed']} changed, up to id {state['last_id']} "
+                    f"({(state['scored'] - scored_before) / elapsed:.0f} msgs/s)"
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        elapsed = time.perf_counter() - started
+        rate = (state['scored'] - scored_before) / elapsed if elapsed else 0.0
+
+        self.stdout.write("Recomputing profile counters and toxicity aggregates...")
+        recompute_profile_counts()
+        call_command('backfill_toxicity_aggregates', chunk_size=options['chunk_size'], stdout=self.stdout)
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rescored {state['scored']} messages ({state['changed']} changed) at {rate:.0f} msgs/s."
+        ))
+
+    def _rescore(self, rows, executor, batch_size):
+        """
+        Score one chunk and bulk_update it with the new scores and labels.
+        Returns how many labels changed.
+        """
+        model_version = registry.get('model_version')
+        texts = [content for _, content, _, _ in rows]
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        score = executor.map if executor is not None else map
+        labels = []
+        scores = []
+        for probabilities in score(_score, batches):
+            labels.extend(labels_from_probabilities(probabilities))
+            scores.extend(pack(row) for row in probabilities)
+
+        messages = []
+        changed = 0
+        for (message_id, _, is_flagged, toxicity), label, packed in zip(rows, labels, scores):
+            flagged = label != 'non-toxic'
+            new_toxicity = label if flagged else ''
+            changed += (flagged, new_toxicity) != (is_flagged, toxicity)
+            messages.append(Message(id=message_id, is_flagged=flagged, toxicity=new_toxicity,
+                                    toxicity_scores=packed, model_version=model_version))
+        with transaction.atomic():
+            Message.objects.bulk_update(
+                messages, ['is_flagged', 'toxicity', 'toxicity_scores', 'model_version'], batch_size=500,
+            )
+        return changed
+
+    def _load_checkpoint(self, path):
+        try:
+            with open(path, encoding='utf-8') as checkpoint:
+                return json.load(checkpoint)
+        except FileNotFoundError:
+            return None
+
+    def _save_checkpoint(self, path, state):
+        # Written to a temporary file first so a crash never leaves half a checkpoint
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as checkpoint:
+            json.dump(state, checkpoint)
+        os.replace(f'{path}.tmp', path)
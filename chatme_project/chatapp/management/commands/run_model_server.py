@@ -0,0 +1,28 @@
+# chatapp/management/commands/run_model_server.py
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chatapp.model_server import ModelServer
+
+
+class Command(BaseCommand):
+    help = "Serve the toxicity model to web workers from a pool of model processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=None,
+                            help="Unix socket path (default: TOXICITY_MODEL_SERVER_SOCKET).")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Number of model replicas (default: TOXICITY_MODEL_SERVER_WORKERS).")
+
+    def handle(self, *args, **options):
+        socket_path = options['socket'] or getattr(settings, 'TOXICITY_MODEL_SERVER_SOCKET', None)
+        if not socket_path:
+            raise CommandError("Pass --socket or set TOXICITY_MODEL_SERVER_SOCKET.")
+        workers = options['workers'] or getattr(settings, 'TOXICITY_MODEL_SERVER_WORKERS', 2)
+
+        self.stdout.write(f"Starting {workers} model workers on {socket_path}. Press CTRL-C to stop.")
+        server = ModelServer(socket_path, workers=workers)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
@@ -0,0 +1,21 @@
+# chatapp/management/commands/warmup_models.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from chatapp import registry
+
+
+class Command(BaseCommand):
+    help = "Load the toxicity model, tokenizer and lexicons and run one prediction."
+
+    def add_arguments(self, parser):
+        parser.add_argument('resources', nargs='*',
+                            help="Resources to load (default: all registered resources).")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        registry.warm_up(options['resources'] or None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Warm-up finished in {time.perf_counter() - started:.2f}s."
+        ))
@@ -3,22 +3,29 @@
 from urllib.parse import parse_qs
 from django.contrib.auth.models import AnonymousUser
 from channels.db import database_sync_to_async
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import UntypedToken
-from jwt import decode as jwt_decode
-from jwt import exceptions
-from django.conf import settings
+from . import token_cache
 
 @database_sync_to_async
-def get_user(token):
+def load_user(token):
+    """
+    Verify the token (signature and expiry, one decode) and fetch its user.
+    """
+    from .models import User
     try:
-        untoken = UntypedToken(token)
-        decoded_data = jwt_decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        user_id = decoded_data.get('user_id')
-        from .models import User
-        user = User.objects.get(id=user_id)
-        return user
-    except (exceptions.DecodeError, User.DoesNotExist):
-        return AnonymousUser()
+        payload = UntypedToken(token).payload
+        user = User.objects.get(id=payload[api_settings.USER_ID_CLAIM])
+    except (TokenError, KeyError, User.DoesNotExist):
+        return None
+    token_cache.put(token, user, payload['exp'])
+    return user
+
+async def get_user(token):
+    # Cache hits are answered on the event loop, without a database thread
+    user = token_cache.get(token) or await load_user(token)
+    return user if user is not None else AnonymousUser()
 
 class TokenAuthMiddleware:
     def __init__(self, inner):
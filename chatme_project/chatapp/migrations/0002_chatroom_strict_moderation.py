@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='strict_moderation',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatapp', '0002_chatroom_strict_moderation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', 'timestamp', 'id'], name='chatapp_msg_room_ts_id'),
+        ),
+    ]
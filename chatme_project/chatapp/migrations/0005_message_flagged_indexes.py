@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatapp', '0004_roomreadmarker'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('is_flagged', True)), fields=['timestamp', 'id'], name='chatapp_msg_flagged_ts_id'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('is_flagged', True)), fields=['toxicity', 'timestamp', 'id'], name='chatapp_msg_flagged_label'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatapp', '0005_message_flagged_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ToxicityAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=4)),
+                ('bucket_start', models.DateTimeField()),
+                ('toxic_count', models.PositiveIntegerField(default=0)),
+                ('non_toxic_count', models.PositiveIntegerField(default=0)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='toxicity_aggregates', to='chatapp.chatroom')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='toxicity_aggregates', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['granularity', 'user', 'bucket_start'], name='chatapp_toxagg_user'), models.Index(fields=['granularity', 'room', 'bucket_start'], name='chatapp_toxagg_room')],
+                'unique_together': {('granularity', 'bucket_start', 'user', 'room')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatapp', '0006_toxicity_aggregate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='model_version',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='toxicity_scores',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,211 @@
+# chatapp/model_server.py
+"""
+Out-of-process toxicity scoring.
+
+`run_model_server` starts a pool of worker processes, each holding one copy
+of the classifier (TOXICITY_MODEL_SERVER_BACKEND), behind a Unix socket. Web workers tokenize locally,
+write the token ids into a shared-memory block and send only its name over
+the socket; a model worker reads the tensors in place and writes the
+probabilities back into the same block. N web workers therefore share M
+model replicas instead of each loading BERT.
+"""
+import logging
+import os
+import sys
+import threading
+from multiprocessing import get_context, resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+NUM_LABELS = 6
+
+
+def _authkey():
+    key = getattr(settings, 'TOXICITY_MODEL_SERVER_AUTHKEY', None) or settings.SECRET_KEY
+    return key.encode('utf-8')
+
+
+def _block_size(batch_size, seq_len):
+    # input_ids and attention_mask (int32) followed by the probabilities (float32)
+    return 4 * (2 * batch_size * seq_len + batch_size * NUM_LABELS)
+
+
+def _views(buffer, batch_size, seq_len):
+    ids_end = batch_size * seq_len * 4
+    mask_end = ids_end * 2
+    probabilities_end = mask_end + batch_size * NUM_LABELS * 4
+    input_ids = np.ndarray((batch_size, seq_len), dtype=np.int32, buffer=buffer[:ids_end])
+    attention_mask = np.ndarray((batch_size, seq_len), dtype=np.int32, buffer=buffer[ids_end:mask_end])
+    probabilities = np.ndarray((batch_size, NUM_LABELS), dtype=np.float32,
+                               buffer=buffer[mask_end:probabilities_end])
+    return input_ids, attention_mask, probabilities
+
+
+def _attach(name):
+    """
+    Open a block created by another process without letting this process's
+    resource tracker unlink it on exit.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    block = shared_memory.SharedMemory(name=name)
+    resource_tracker.unregister(block._name, 'shared_memory')
+    return block
+
+
+# --- model worker processes ----------------------------------------------------
+
+_backend = None
+
+
+def _init_worker():
+    global _backend
+    import django
+
+    django.setup()
+    from .backends import create_backend
+
+    _backend = create_backend(getattr(settings, 'TOXICITY_MODEL_SERVER_BACKEND', 'tensorflow'))
+
+
+def _score_block(name, batch_size, seq_len):
+    block = _attach(name)
+    input_ids = attention_mask = probabilities = None
+    try:
+        input_ids, attention_mask, probabilities = _views(block.buf, batch_size, seq_len)
+        probabilities[:] = _backend.predict_proba(input_ids, attention_mask)
+    finally:
+        # The views must be released before the block can be closed
+        input_ids = attention_mask = probabilities = None
+        block.close()
+
+
+class ModelServer:
+    """
+    Accepts connections on `socket_path` and scores requests on `workers`
+    model processes.
+    """
+
+    def __init__(self, socket_path, workers=2):
+        self.socket_path = socket_path
+        self.workers = workers
+        self._pool = None
+        self._listener = None
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        self._pool = get_context('spawn').Pool(self.workers, initializer=_init_worker)
+        self._listener = Listener(self.socket_path, family='AF_UNIX', authkey=_authkey())
+        logger.info("Model server listening on %s with %d workers.", self.socket_path, self.workers)
+        try:
+            while True:
+                try:
+                    conn = self._listener.accept()
+                except OSError:
+                    # Listener closed by shutdown()
+                    break
+                except Exception:
+                    logger.warning("Rejected model server connection.", exc_info=True)
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def _handle(self, conn):
+        with conn:
+            while True:
+                try:
+                    name, batch_size, seq_len = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    self._pool.apply(_score_block, (name, batch_size, seq_len))
+                except Exception as exc:
+                    logger.exception("Model server request failed.")
+                    conn.send(('error', str(exc)))
+                else:
+                    conn.send(('ok', None))
+
+
+# --- web worker side -------------------------------------------------------------
+
+class ModelServerError(RuntimeError):
+    pass
+
+
+class ModelServerClient:
+    """
+    Scores tokenized batches on a running model server. Each thread keeps
+    its own connection.
+    """
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = Client(self.socket_path, family='AF_UNIX', authkey=_authkey())
+            self._local.conn = conn
+        return conn
+
+    def _reset(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            conn.close()
+
+    def predict_proba(self, input_ids, attention_mask):
+        """
+        Return a (batch, 6) float32 array of probabilities for the given
+        (batch, seq_len) token ids and attention mask.
+        """
+        batch_size, seq_len = input_ids.shape
+        block = shared_memory.SharedMemory(create=True, size=_block_size(batch_size, seq_len))
+        ids_view = mask_view = probabilities = None
+        try:
+            ids_view, mask_view, probabilities = _views(block.buf, batch_size, seq_len)
+            ids_view[:] = input_ids
+            mask_view[:] = attention_mask
+
+            try:
+                status, detail = self._request((block.name, batch_size, seq_len))
+            except (EOFError, OSError):
+                # The server restarted since this thread connected; retry once
+                self._reset()
+                status, detail = self._request((block.name, batch_size, seq_len))
+            if status != 'ok':
+                raise ModelServerError(detail)
+
+            return probabilities.copy()
+        finally:
+            ids_view = mask_view = probabilities = None
+            block.close()
+            block.unlink()
+
+    def _request(self, message):
+        conn = self._connection()
+        try:
+            conn.send(message)
+            return conn.recv()
+        except (EOFError, OSError):
+            self._reset()
+            raise
@@ -2,11 +2,15 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.conf import settings
 from PIL import Image  # optional if you want to process images
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
-from .predict import *
-from .utils import *
-from .predict import *
+from django.utils import timezone
+from . import aggregates, registry, room_cache, token_cache
+from .counters import record_message
+from .moderation_feed import publish_flagged
+from .predict import classify_toxicity
+from .scores import pack as pack_scores
+from .utils import replace_toxic_with_antonyms
 
 class User(AbstractUser):
     ROLE_CHOICES = (
@@ -39,10 +43,19 @@ class Profile(models.Model):
     def __str__(self):
         return f"{self.user.username}'s profile"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored image so save() can tell when it changes
+        instance._saved_image_name = instance.__dict__.get('image')
+        return instance
+
     # Optional: If you want to resize images or process them
     def save(self, *args, **kwargs):
+        image_changed = bool(self.image) and self.image.name != getattr(self, '_saved_image_name', None)
         super().save(*args, **kwargs)
-        if self.image:
+        self._saved_image_name = self.image.name if self.image else None
+        if image_changed:
             # Example: resizing image
             img_path = self.image.path
             img = Image.open(img_path)
@@ -60,15 +73,42 @@ def create_user_profile(sender, instance, created, **kwargs):
 def save_user_profile(sender, instance, **kwargs):
     instance.profile.save()
 
+# Cached WebSocket logins carry a copy of the user (including is_blocked)
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_tokens(sender, instance, created, **kwargs):
+    if not created:
+        token_cache.invalidate_user(instance.pk)
+
 
 class ChatRoom(models.Model):
     name = models.CharField(max_length=255, unique=True)
     participants = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='chat_rooms')
     is_group = models.BooleanField(default=False)
+    # Always score messages before broadcasting them, even when CHAT_MODERATION_MODE is 'async'
+    strict_moderation = models.BooleanField(default=False)
 
     def __str__(self):
         return self.name
 
+# Keep the consumers' room cache in step with the database
+@receiver(post_save, sender=ChatRoom)
+@receiver(post_delete, sender=ChatRoom)
+def invalidate_cached_room(sender, instance, **kwargs):
+    room_cache.invalidate(room_id=instance.pk)
+
+@receiver(m2m_changed, sender=ChatRoom.participants.through)
+def invalidate_cached_participants(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        room_cache.invalidate(room_id=instance.pk)
+    elif pk_set:
+        # Changed from the user side (user.chat_rooms.add(...))
+        for room_id in pk_set:
+            room_cache.invalidate(room_id=room_id)
+    else:
+        room_cache.invalidate()
+
 class Message(models.Model):
     room = models.ForeignKey(ChatRoom, related_name='messages', on_delete=models.CASCADE)
     sender = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='sent_messages', on_delete=models.CASCADE)
@@ -79,49 +119,136 @@ class Message(models.Model):
      # **New Fields for Flagging System**
     is_flagged = models.BooleanField(default=False)
     toxicity = models.TextField() #it will store "toxic","severe_toxic","Obscene" and soon
+    # Every label's probability, packed by chatapp.scores, and the model that produced them
+    toxicity_scores = models.BinaryField(null=True, blank=True, editable=False)
+    model_version = models.CharField(max_length=64, blank=True, default='')
     
     class Meta:
         ordering = ('timestamp',)
+        indexes = [
+            # Keyset pagination of a room's history (chatapp.pagination)
+            models.Index(fields=['room', 'timestamp', 'id'], name='chatapp_msg_room_ts_id'),
+            # The moderation queue, newest first, optionally by label; only
+            # flagged rows are indexed
+            models.Index(fields=['timestamp', 'id'], condition=models.Q(is_flagged=True),
+                         name='chatapp_msg_flagged_ts_id'),
+            models.Index(fields=['toxicity', 'timestamp', 'id'], condition=models.Q(is_flagged=True),
+                         name='chatapp_msg_flagged_label'),
+        ]
 
-    def save(self, *args, **kwargs):
+    def save(self, *args, moderate=True, result=None, **kwargs):
+            """
+            Filter toxic words and, unless `moderate` is False, classify the
+            message and update the sender's counters before saving. Messages
+            saved with moderate=False are scored later by chatapp.moderation.
+            A `result` means the caller has already filtered and classified
+            the content (see ChatConsumer.save_single_message).
+            """
             # Preprocess the text
             # Debugging: print the messageupdated value
             
             print(f"messageupdated: {self.content}")
 
-            self.content = replace_toxic_with_antonyms(self.content, toxic_words)
-
-            self.updated_content = self.content
+            if result is None:
+                self.filter_content()
     
             # Debugging: print the messageupdated value
             print(f"messageupdated: {self.updated_content}")
             print(f"message: {self.content}")
 
-            toxicity_check = predict_toxicity(self.content)
-            if toxicity_check != "non-toxic":
-                self.is_flagged = True
-                self.toxicity=toxicity_check
-
-             # Update the user's profile toxic/non-toxic message count
-            if self.sender:
-                profile = getattr(self.sender, 'profile', None)
-                if profile:
-                    if toxicity_check == 'non-toxic':
-                        profile.non_toxic_count += 1
-                    else:
-                        profile.toxic_count += 1
-                    profile.save()
-                else:
-                    print("Warning: Profile does not exist for this user.")
-            else:
-                print("Warning: Message from None user.")
+            if moderate:
+                if result is None:
+                    result = classify_toxicity(self.content)
+                self.apply_toxicity(result.label)
+                self.store_scores(result.probabilities)
+                self.update_sender_counts(result.label)
 
             super(Message, self).save(*args, **kwargs)
 
+            if moderate:
+                publish_flagged([self])
+
+    def filter_content(self):
+        """
+        Replace toxic words with their antonyms.
+        """
+        self.content = replace_toxic_with_antonyms(self.content)
+        self.updated_content = self.content
+
+    def apply_toxicity(self, toxicity_check):
+        """
+        Flag the message if the classifier returned a toxic label.
+        """
+        if toxicity_check != "non-toxic":
+            self.is_flagged = True
+            self.toxicity = toxicity_check
+
+    def store_scores(self, probabilities):
+        """
+        Keep every label's probability, so thresholds can be changed later
+        without re-running the model (chatapp.scores.rethreshold).
+        """
+        self.toxicity_scores = pack_scores(probabilities)
+        self.model_version = registry.get('model_version')
+
+    def update_sender_counts(self, toxicity_check):
+        """
+        Update the sender's profile toxic/non-toxic message count and the
+        hourly/daily toxicity aggregates.
+        """
+        if self.sender_id:
+            toxic = toxicity_check != 'non-toxic'
+            record_message(self.sender_id, toxic=toxic)
+            # Not saved yet on the Message.save path
+            aggregates.record_message(self.sender_id, self.room_id, self.timestamp or timezone.now(), toxic)
+        else:
+            print("Warning: Message from None user.")
+
 
     def __str__(self):
         return f'{self.sender.username}: {self.content}'
 
+class RoomReadMarker(models.Model):
+    """
+    How far a user has read in a room; later messages from others are unread.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='read_markers')
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='read_markers')
+    last_read_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'room')
+
+    def __str__(self):
+        return f'{self.user.username} read {self.room.name} up to {self.last_read_at}'
+
+class ToxicityAggregate(models.Model):
+    """
+    Scored messages a user sent in a room during one hour or day (UTC),
+    kept up to date by chatapp.aggregates.
+    """
+    GRANULARITY_CHOICES = (
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    )
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='toxicity_aggregates')
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name='toxicity_aggregates')
+    toxic_count = models.PositiveIntegerField(default=0)
+    non_toxic_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('granularity', 'bucket_start', 'user', 'room')
+        indexes = [
+            # Per-user and per-room trends over a time range
+            models.Index(fields=['granularity', 'user', 'bucket_start'], name='chatapp_toxagg_user'),
+            models.Index(fields=['granularity', 'room', 'bucket_start'], name='chatapp_toxagg_room'),
+        ]
+
+    def __str__(self):
+        return f'{self.user.username} in {self.room.name}, {self.granularity} of {self.bucket_start}'
+
 class Feedback(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='feedbacks')
     content = models.TextField()
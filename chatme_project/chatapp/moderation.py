@@ -0,0 +1,107 @@
+# chatapp/moderation.py
+"""
+Background toxicity scoring for chat messages.
+
+In 'async' mode a message is saved and broadcast straight away with
+`Message.save(moderate=False)`, and `schedule()` scores it on a worker thread.
+The result is written back and announced to the room as a pre-encoded
+`{"moderation": ...}` frame (see chatapp.encoding). Rooms with `strict_moderation` set (or every room, when
+CHAT_MODERATION_MODE is 'strict') keep scoring inside `Message.save()`,
+before the message is broadcast.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections
+
+from .encoding import encoded_event
+from .models import Message
+from .moderation_feed import publish_flagged
+from .predict import classify_toxicity
+
+logger = logging.getLogger(__name__)
+
+STRICT = 'strict'
+ASYNC = 'async'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'CHAT_MODERATION_WORKERS', 4),
+                thread_name_prefix='moderation',
+            )
+        return _executor
+
+
+def is_strict(room):
+    """
+    Return True if messages in `room` must be scored before they are broadcast.
+    """
+    if room.strict_moderation:
+        return True
+    return getattr(settings, 'CHAT_MODERATION_MODE', STRICT) != ASYNC
+
+
+def schedule(message_id):
+    """
+    Score a message saved with moderate=False on the moderation worker pool.
+    """
+    return get_executor().submit(_moderate, message_id)
+
+
+def _moderate(message_id):
+    close_old_connections()
+    try:
+        moderate_message(message_id)
+    except Exception:
+        logger.exception("Moderation failed for message %s.", message_id)
+    finally:
+        close_old_connections()
+
+
+def moderate_message(message_id):
+    """
+    Classify a stored message, persist the result, update the sender's
+    counters and tell the room about it.
+    """
+    try:
+        message = Message.objects.select_related('room', 'sender__profile').get(pk=message_id)
+    except Message.DoesNotExist:
+        # Deleted before it could be scored.
+        return None
+
+    result = classify_toxicity(message.content)
+    message.apply_toxicity(result.label)
+    message.store_scores(result.probabilities)
+    Message.objects.filter(pk=message.pk).update(
+        is_flagged=message.is_flagged,
+        toxicity=message.toxicity,
+        toxicity_scores=message.toxicity_scores,
+        model_version=message.model_version,
+    )
+    message.update_sender_counts(result.label)
+    publish_flagged([message])
+
+    channel_layer = get_channel_layer()
+    if channel_layer is not None:
+        async_to_sync(channel_layer.group_send)(
+            f'chat_{message.room.name}',
+            encoded_event({
+                'moderation': {
+                    'id': message.pk,
+                    'is_flagged': message.is_flagged,
+                    'toxicity': message.toxicity,
+                }
+            })
+        )
+    return message
@@ -0,0 +1,45 @@
+# chatapp/moderation_feed.py
+"""
+Live feed of newly flagged messages for moderators.
+
+Every write path that can flag a message (Message.save, batched
+persistence and background moderation) calls `publish_flagged` once the
+transaction commits. The messages are serialized and encoded once and sent
+to the MODERATION_GROUP channel group, which ModerationConsumer connections
+(ws/moderation/) join.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from .encoding import encoded_event
+
+logger = logging.getLogger(__name__)
+
+MODERATION_GROUP = 'moderation'
+
+
+def publish_flagged(messages):
+    """
+    Announce the flagged messages among `messages` after the current
+    transaction commits.
+    """
+    flagged = [message for message in messages if message.is_flagged]
+    if flagged:
+        transaction.on_commit(lambda: _send(flagged))
+
+
+def _send(messages):
+    from .serializers import MessageSerializer
+
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        data = MessageSerializer(messages, many=True, context={'request': None}).data
+        async_to_sync(channel_layer.group_send)(MODERATION_GROUP, encoded_event({'flagged': data}))
+    except Exception:
+        # The feed is best effort; the queue endpoint stays authoritative
+        logger.exception("Failed to publish %d flagged messages.", len(messages))
@@ -1,27 +1,19 @@
 # chatapp/online_users.py
-import redis
-from django.conf import settings
+from .presence import get_presence
 
-# Initialize Redis client
-redis_client = redis.Redis(host='localhost', port=6379, db=0)  # Adjust if using a different host/port
+# Blocking facade over chatapp.presence for sync code such as the DRF
+# serializers; ChatConsumer awaits the asyncio methods directly
 
-ONLINE_USERS_SET = 'online_users'
-
-def set_user_online(user_id):
-    """
-    Add the user ID to the online users set.
-    """
-    redis_client.sadd(ONLINE_USERS_SET, user_id)
-
-def set_user_offline(user_id):
+def is_user_online(user_id):
     """
-    Remove the user ID from the online users set.
+    Check if the user has at least one live connection.
+    Returns True if online, False otherwise.
     """
-    redis_client.srem(ONLINE_USERS_SET, user_id)
+    return get_presence().is_online(user_id)
 
-def is_user_online(user_id):
+def online_statuses(user_ids):
     """
-    Check if the user ID is in the online users set.
-    Returns True if online, False otherwise.
+    Check many user IDs in one round-trip per presence shard.
+    Returns a dict mapping each user ID to True/False.
     """
-    return redis_client.sismember(ONLINE_USERS_SET, user_id)
+    return get_presence().are_online(user_ids)
@@ -0,0 +1,123 @@
+# chatapp/pagination.py
+"""
+Keyset pagination for room message history.
+
+Pages are addressed by a (timestamp, id) cursor instead of an OFFSET, so the
+database seeks straight to the cursor through the (room, timestamp, id)
+index and every page costs the same no matter how deep into the history it
+is. `?before=<cursor>` walks towards older messages (infinite scroll up),
+`?after=<cursor>` towards newer ones; with neither, the latest page is
+returned. Room history pages are in chronological order, moderation queue
+pages newest first.
+
+The toxicity dashboard pages through small grouped aggregates and uses
+plain page numbers (ToxicityPagination).
+"""
+import base64
+import binascii
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+
+
+def encode_cursor(message):
+    raw = f'{message.timestamp.isoformat()}|{message.id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, message_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise NotFound("Invalid cursor.")
+
+
+class MessageCursorPagination(BasePagination):
+    """
+    Keyset pagination on (timestamp, id). The queryset must already be
+    narrowed to an indexed subset (one room, or the flagged messages).
+    """
+    page_size_query_param = 'page_size'
+    chronological = True
+
+    def get_page_size(self, request):
+        page_size = getattr(settings, 'MESSAGE_PAGE_SIZE', 50)
+        max_page_size = getattr(settings, 'MESSAGE_PAGE_MAX_SIZE', 200)
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return page_size
+        return max(1, min(requested, max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        before = request.query_params.get('before')
+        after = request.query_params.get('after')
+
+        if after:
+            timestamp, message_id = decode_cursor(after)
+            # The plain range bound gives the planner an index range to scan
+            queryset = queryset.filter(timestamp__gte=timestamp).filter(
+                Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=message_id)
+            )
+            rows = list(queryset.order_by('timestamp', 'id')[:page_size + 1])
+            self.has_newer = len(rows) > page_size
+            self.has_older = True
+            page = rows[:page_size]
+        else:
+            if before:
+                timestamp, message_id = decode_cursor(before)
+                queryset = queryset.filter(timestamp__lte=timestamp).filter(
+                    Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id)
+                )
+            rows = list(queryset.order_by('-timestamp', '-id')[:page_size + 1])
+            self.has_older = len(rows) > page_size
+            self.has_newer = bool(before)
+            page = rows[:page_size][::-1]
+
+        self.oldest = page[0] if page else None
+        self.newest = page[-1] if page else None
+        return page if self.chronological else page[::-1]
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('before', encode_cursor(self.oldest) if self.oldest and self.has_older else None),
+            ('after', encode_cursor(self.newest) if self.newest and self.has_newer else None),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'before': {'type': 'string', 'nullable': True},
+                'after': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class FlaggedMessageCursorPagination(MessageCursorPagination):
+    """
+    The moderation queue: newest flags first, `?before=` for older ones.
+    """
+    chronological = False
+
+
+class ToxicityPagination(PageNumberPagination):
+    """
+    ?page=<n>&page_size=<n> over the toxicity dashboard rows.
+    """
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        self.max_page_size = getattr(settings, 'TOXICITY_PAGE_MAX_SIZE', 200)
+        self.page_size = getattr(settings, 'TOXICITY_PAGE_SIZE', 25)
+        return super().get_page_size(request)
@@ -1,63 +1,192 @@
-import tensorflow as tf
-from transformers import BertTokenizer
+import asyncio
+import threading
 
-# Load the SavedModel
-model = tf.saved_model.load(r'model\bert_toxic_comment_classifier')
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
 
-infer = model.signatures['serving_default']
+from . import registry
+from .batching import MicroBatcher
 
-# Initialize the tokenizer
-tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
+# Define the labels corresponding to the model's output columns
+labels = ['toxic', 'severe_toxic', 'obscene', 'identity_hate', 'threat', 'insult']
 
-def predict_toxicity(comment):
-    # Tokenize the input comment
-    encodings = tokenizer(
-        [comment],  # Wrap comment in a list
-        padding=True,
+# Longest tokenized input the model sees
+MAX_LENGTH = 128
+
+
+# The 'toxic' column is never reported on its own; a message gets the most
+# likely of the specific labels, if any of them clears the threshold
+_label_array = np.array(labels)
+_candidate_columns = np.array([label != 'toxic' for label in labels])
+
+
+class ToxicityResult:
+    """
+    The label chosen for one comment plus the probability of every label.
+    """
+    __slots__ = ('label', 'probabilities')
+
+    def __init__(self, label, probabilities):
+        self.label = label
+        self.probabilities = probabilities
+
+    @property
+    def is_toxic(self):
+        return self.label != 'non-toxic'
+
+    def as_dict(self):
+        return {'label': self.label, 'probabilities': dict(zip(labels, map(float, self.probabilities)))}
+
+    def __repr__(self):
+        return f"ToxicityResult(label={self.label!r})"
+
+
+def label_thresholds(threshold=None):
+    """
+    Per-column thresholds from a single value or a {label: threshold}
+    mapping; unmapped labels use TOXICITY_THRESHOLD.
+    """
+    default = getattr(settings, 'TOXICITY_THRESHOLD', 0.5)
+    if threshold is None:
+        threshold = default
+    if isinstance(threshold, dict):
+        unknown = set(threshold) - set(labels)
+        if unknown:
+            raise ValueError(f"Unknown toxicity labels: {', '.join(sorted(unknown))}")
+        return np.array([threshold.get(label, default) for label in labels], dtype=np.float32)
+    return np.full(len(labels), threshold, dtype=np.float32)
+
+
+def labels_from_probabilities(probabilities, threshold=None):
+    """
+    Vectorized label selection over a (batch, 6) probability matrix: the
+    highest-scoring non-'toxic' column among those exceeding their threshold
+    (see label_thresholds), otherwise 'non-toxic'.
+    """
+    probabilities = np.asarray(probabilities, dtype=np.float32).reshape(-1, len(labels))
+    passing = _candidate_columns & (probabilities > label_thresholds(threshold))
+    candidates = np.where(passing, probabilities, -np.inf)
+    best = candidates.argmax(axis=1)
+    flagged = passing[np.arange(len(candidates)), best]
+    return np.where(flagged, _label_array[best], 'non-toxic').tolist()
+
+
+def predict_probabilities_batch(comments):
+    """
+    Tokenize a list of comments and return a (len(comments), len(labels))
+    array of sigmoid probabilities from the configured inference backend
+    (TOXICITY_BACKEND). Comments are grouped into length buckets so short
+    messages are not padded to the longest one in the batch.
+    """
+    tokenizer = registry.get('tokenizer')
+    backend = registry.get('backend')
+
+    # Tokenize without padding; each bucket pads to its own boundary
+    sequences = tokenizer(
+        list(comments),
         truncation=True,
-        max_length=128,
-        return_tensors="tf"
-    )
-    
-    # Prepare inputs for the model
-    inputs = {
-        'input_ids': encodings['input_ids'],
-        'attention_mask': encodings['attention_mask'],
-        'token_type_ids': encodings.get('token_type_ids', tf.zeros_like(encodings['input_ids']))  # Use zeros if not provided
-    }
-
-    # Make predictions using the model
-    logits = infer(**inputs)['logits']
-    
-    # Apply sigmoid to get probabilities
-    probabilities = tf.sigmoid(logits).numpy()
-    
-    # Define the labels corresponding to the classes
-    labels = ['toxic', 'severe_toxic', 'obscene', 'identity_hate', 'threat', 'insult']
-    
-    # Define indices to skip toxic class
-    toxic_class_index = labels.index('toxic')
-    non_toxic_class_indices = [i for i in range(len(labels)) if i != toxic_class_index]
-    non_toxic_labels = [labels[i] for i in non_toxic_class_indices]
-    
-    # Extract non-toxic probabilities
-    non_toxic_probabilities = [probabilities[0][j] for j in non_toxic_class_indices]
-    
-    if max(non_toxic_probabilities) > 0.5:  # Use a threshold to determine if a class should be considered
-        # Find the index of the highest probability in the non-toxic classes
-        best_non_toxic_index = non_toxic_probabilities.index(max(non_toxic_probabilities))
-        best_non_toxic_label = non_toxic_labels[best_non_toxic_index]
-        return best_non_toxic_label
-    else:
-        # If no non-toxic class has a high probability, classify as non-toxic
-        return 'non-toxic'
-
-# Example usage
-print(predict_toxicity("you are idiot"))
-
-print(predict_toxicity("you bloody americans"))
-print(predict_toxicity("fuck off"))
-
-print(predict_toxicity("you bitch"))
-
-print(predict_toxicity("you are cute"))
\ No newline at end of file
+        max_length=MAX_LENGTH,
+    )['input_ids']
+
+    probabilities = np.empty((len(sequences), len(labels)), dtype=np.float32)
+    for indices, input_ids, attention_mask in registry.get('length_buckets').split(sequences):
+        probabilities[indices] = backend.predict_proba(input_ids, attention_mask)
+    return probabilities
+
+
+def predict_probabilities_cached(comments):
+    """
+    Like predict_probabilities_batch, but served from the prediction cache
+    where possible. Only cache misses reach the model, in a single batch.
+    """
+    comments = list(comments)
+    cache = registry.get('prediction_cache')
+    cached = cache.get_many(comments)
+
+    probabilities = np.empty((len(comments), len(labels)), dtype=np.float32)
+    missing = []
+    for i, row in enumerate(cached):
+        if row is None:
+            missing.append(i)
+        else:
+            probabilities[i] = row
+
+    if missing:
+        # Score each distinct missing text once
+        unique_texts = list(dict.fromkeys(comments[i] for i in missing))
+        scored = predict_probabilities_batch(unique_texts)
+        cache.set_many(unique_texts, scored)
+        position = {text: row for row, text in enumerate(unique_texts)}
+        probabilities[missing] = scored[[position[comments[i]] for i in missing]]
+    return probabilities
+
+
+def classify_toxicity_batch(comments):
+    """
+    Classify a list of comments and return one ToxicityResult per comment.
+    """
+    if not comments:
+        return []
+    probabilities = predict_probabilities_cached(comments)
+    return [
+        ToxicityResult(label, row)
+        for label, row in zip(labels_from_probabilities(probabilities), probabilities)
+    ]
+
+
+def predict_toxicity_batch(comments):
+    """
+    Classify a list of comments and return one label per comment.
+    """
+    return [result.label for result in classify_toxicity_batch(comments)]
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """
+    Return the process-wide batcher that feeds classify_toxicity_batch.
+    """
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher(
+                classify_toxicity_batch,
+                max_batch_size=getattr(settings, 'TOXICITY_BATCH_MAX_SIZE', 32),
+                max_wait=getattr(settings, 'TOXICITY_BATCH_MAX_WAIT_MS', 5) / 1000.0,
+                name='toxicity-batcher',
+            )
+        return _batcher
+
+
+def classify_toxicity(comment):
+    """
+    Classify a single comment and return its ToxicityResult. Concurrent
+    callers are coalesced into one batched forward pass; batching is
+    bypassed when TOXICITY_BATCH_MAX_SIZE is 1.
+    """
+    if getattr(settings, 'TOXICITY_BATCH_MAX_SIZE', 32) <= 1:
+        return classify_toxicity_batch([comment])[0]
+    return get_batcher().process(comment)
+
+
+async def aclassify_toxicity(comment):
+    """
+    classify_toxicity for async callers. The batcher's future is awaited on
+    the event loop, so consumers classifying at the same time share a batch
+    instead of queueing behind one another on a database_sync_to_async thread.
+    """
+    if getattr(settings, 'TOXICITY_BATCH_MAX_SIZE', 32) <= 1:
+        results = await sync_to_async(classify_toxicity_batch, thread_sensitive=False)([comment])
+        return results[0]
+    return await asyncio.wrap_future(get_batcher().submit(comment))
+
+
+def predict_toxicity(comment):
+    """
+    Classify a single comment and return its label.
+    """
+    return classify_toxicity(comment).label
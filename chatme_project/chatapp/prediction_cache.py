@@ -0,0 +1,155 @@
+# chatapp/prediction_cache.py
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import redis
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text):
+    """
+    Collapse the differences the uncased BERT tokenizer ignores anyway
+    (case and runs of whitespace) so equivalent messages share an entry.
+    """
+    return ' '.join(text.lower().split())
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of per-label probabilities keyed by a hash of the
+    normalized text and the model version, so swapping the model never serves
+    stale scores. Entries expire after `ttl` seconds (0 disables expiry).
+
+    When `redis_client` is given, misses fall through to a shared Redis tier
+    and new entries are written to both tiers.
+    """
+
+    def __init__(self, max_entries=10000, ttl=3600, model_version='', redis_client=None,
+                 redis_prefix='toxicity:prediction:'):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.model_version = model_version
+        self.redis_client = redis_client
+        self.redis_prefix = redis_prefix
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'redis_hits': 0,
+            'redis_errors': 0,
+        }
+
+    def key(self, text):
+        payload = f"{self.model_version}\0{normalize_text(text)}".encode('utf-8')
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    def get_many(self, texts):
+        """
+        Return a list with the cached probabilities for each text, or None
+        where there is no live entry.
+        """
+        keys = [self.key(text) for text in texts]
+        results = [None] * len(keys)
+        missing = []
+        now = time.monotonic()
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None and self.ttl and entry[1] <= now:
+                    del self._entries[key]
+                    self._counters['expirations'] += 1
+                    entry = None
+                if entry is None:
+                    missing.append(i)
+                    continue
+                self._entries.move_to_end(key)
+                results[i] = entry[0]
+                self._counters['hits'] += 1
+
+        if missing and self.redis_client is not None:
+            for i, probabilities in zip(missing, self._redis_get([keys[i] for i in missing])):
+                if probabilities is not None:
+                    results[i] = probabilities
+                    self._store(keys[i], probabilities)
+            with self._lock:
+                self._counters['redis_hits'] += sum(1 for i in missing if results[i] is not None)
+
+        with self._lock:
+            self._counters['misses'] += sum(1 for i in missing if results[i] is None)
+        return results
+
+    def get(self, text):
+        return self.get_many([text])[0]
+
+    def set_many(self, texts, probabilities):
+        keys = [self.key(text) for text in texts]
+        rows = [np.asarray(row, dtype=np.float32) for row in probabilities]
+        for key, row in zip(keys, rows):
+            self._store(key, row)
+        if self.redis_client is not None:
+            self._redis_set(keys, rows)
+
+    def set(self, text, probabilities):
+        self.set_many([text], [probabilities])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['redis_hits'] + self._counters['misses']
+            hits = self._counters['hits'] + self._counters['redis_hits']
+            return {
+                **self._counters,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'model_version': self.model_version,
+            }
+
+    def _store(self, key, probabilities):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (probabilities, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+    def _redis_get(self, keys):
+        try:
+            raw = self.redis_client.mget([self.redis_prefix + key for key in keys])
+        except redis.RedisError:
+            logger.warning("Prediction cache: Redis read failed.", exc_info=True)
+            with self._lock:
+                self._counters['redis_errors'] += 1
+            return [None] * len(keys)
+        return [np.frombuffer(value, dtype='<f4').copy() if value else None for value in raw]
+
+    def _redis_set(self, keys, rows):
+        try:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, row in zip(keys, rows):
+                value = row.astype('<f4').tobytes()
+                if self.ttl:
+                    # Milliseconds, so a fractional TTL never rounds down to an invalid 0
+                    pipe.psetex(self.redis_prefix + key, max(1, math.ceil(self.ttl * 1000)), value)
+                else:
+                    pipe.set(self.redis_prefix + key, value)
+            pipe.execute()
+        except redis.RedisError:
+            logger.warning("Prediction cache: Redis write failed.", exc_info=True)
+            with self._lock:
+                self._counters['redis_errors'] += 1
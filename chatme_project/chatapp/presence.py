@@ -0,0 +1,232 @@
+# chatapp/presence.py
+"""
+Who is online, and who is in which room.
+
+Every WebSocket connection is tracked separately, so a user with several
+tabs open stays online until the last one closes. Each user has a sorted
+set of connection ids scored by expiry time, and each room a sorted set of
+"<user id>:<connection id>" members. Consumers refresh their entries every
+PRESENCE_HEARTBEAT_INTERVAL seconds. Entries that stop being refreshed,
+for example because their worker crashed, expire after PRESENCE_TTL
+seconds.
+
+Keys are spread over the Redis servers in PRESENCE_REDIS_URLS by a hash
+of the user or room id. Batch lookups send one pipeline per shard. Online
+status reads are cached in-process for PRESENCE_CACHE_TTL seconds.
+
+Every operation has a blocking form for sync code (the DRF serializers
+reach it through chatapp.online_users) and an asyncio form prefixed with
+"a" (aconnect, adisconnect, aare_online) that ChatConsumer awaits
+directly on the event loop.
+"""
+import asyncio
+import math
+import threading
+import time
+import zlib
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+
+class PresenceService:
+    def __init__(self, clients, async_clients=None, ttl=90, cache_ttl=2.0, cache_max_entries=10000,
+                 prefix='presence'):
+        self.clients = list(clients)
+        self.async_clients = list(async_clients) if async_clients is not None else None
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl
+        self.cache_max_entries = cache_max_entries
+        self.prefix = prefix
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+
+    def _shard(self, key_id):
+        return zlib.crc32(str(key_id).encode('utf-8')) % len(self.clients)
+
+    def _user_key(self, user_id):
+        return f'{self.prefix}:user:{user_id}'
+
+    def _room_key(self, room_id):
+        return f'{self.prefix}:room:{room_id}'
+
+    # Commands are queued on sync or asyncio pipelines by the same helpers;
+    # only executing them differs between the two forms
+
+    def _connect_pipelines(self, clients, user_id, connection_id, room_id):
+        now = time.time()
+        expiry = now + self.ttl
+        key_ttl = math.ceil(self.ttl)
+
+        pipeline = clients[self._shard(user_id)].pipeline(transaction=False)
+        # Drop connections whose heartbeats stopped (e.g. a crashed worker), so
+        # the set of a user who keeps reconnecting does not grow without bound
+        pipeline.zremrangebyscore(self._user_key(user_id), '-inf', now)
+        pipeline.zadd(self._user_key(user_id), {connection_id: expiry})
+        pipeline.expire(self._user_key(user_id), key_ttl)
+        pipelines = [pipeline]
+
+        if room_id is not None:
+            pipeline = clients[self._shard(room_id)].pipeline(transaction=False)
+            pipeline.zadd(self._room_key(room_id), {f'{user_id}:{connection_id}': expiry})
+            pipeline.expire(self._room_key(room_id), key_ttl)
+            pipelines.append(pipeline)
+        return pipelines
+
+    def _disconnect_pipelines(self, clients, user_id, connection_id, room_id):
+        # The first pipeline's second reply is the user's remaining live connections
+        pipeline = clients[self._shard(user_id)].pipeline(transaction=False)
+        pipeline.zrem(self._user_key(user_id), connection_id)
+        pipeline.zcount(self._user_key(user_id), time.time(), '+inf')
+        pipelines = [pipeline]
+
+        if room_id is not None:
+            pipeline = clients[self._shard(room_id)].pipeline(transaction=False)
+            pipeline.zrem(self._room_key(room_id), f'{user_id}:{connection_id}')
+            pipelines.append(pipeline)
+        return pipelines
+
+    def _online_pipelines(self, clients, user_ids):
+        by_shard = {}
+        for user_id in user_ids:
+            by_shard.setdefault(self._shard(user_id), []).append(user_id)
+
+        now = time.time()
+        pipelines = []
+        for shard, shard_ids in by_shard.items():
+            pipeline = clients[shard].pipeline(transaction=False)
+            for user_id in shard_ids:
+                pipeline.zcount(self._user_key(user_id), now, '+inf')
+            pipelines.append((shard_ids, pipeline))
+        return pipelines
+
+    # Writes
+
+    def connect(self, user_id, connection_id, room_id=None):
+        """
+        Register a connection. Also used as the heartbeat.
+        """
+        for pipeline in self._connect_pipelines(self.clients, user_id, connection_id, room_id):
+            pipeline.execute()
+        self._remember(user_id, True)
+
+    heartbeat = connect
+
+    def disconnect(self, user_id, connection_id, room_id=None):
+        """
+        Drop a connection. The user stays online while other connections remain.
+        """
+        replies = [
+            pipeline.execute()
+            for pipeline in self._disconnect_pipelines(self.clients, user_id, connection_id, room_id)
+        ]
+        self._remember(user_id, replies[0][1] > 0)
+
+    async def aconnect(self, user_id, connection_id, room_id=None):
+        pipelines = self._connect_pipelines(self.async_clients, user_id, connection_id, room_id)
+        await asyncio.gather(*(pipeline.execute() for pipeline in pipelines))
+        self._remember(user_id, True)
+
+    aheartbeat = aconnect
+
+    async def adisconnect(self, user_id, connection_id, room_id=None):
+        pipelines = self._disconnect_pipelines(self.async_clients, user_id, connection_id, room_id)
+        replies = await asyncio.gather(*(pipeline.execute() for pipeline in pipelines))
+        self._remember(user_id, replies[0][1] > 0)
+
+    # Reads
+
+    def are_online(self, user_ids):
+        """
+        Return {user_id: bool} for `user_ids`, with one round-trip per shard
+        for the ids that are not cached.
+        """
+        result, misses = self._cached(user_ids)
+        for shard_ids, pipeline in self._online_pipelines(self.clients, misses):
+            self._collect(result, shard_ids, pipeline.execute())
+        return result
+
+    async def aare_online(self, user_ids):
+        result, misses = self._cached(user_ids)
+        pipelines = self._online_pipelines(self.async_clients, misses)
+        replies = await asyncio.gather(*(pipeline.execute() for _, pipeline in pipelines))
+        for (shard_ids, _), counts in zip(pipelines, replies):
+            self._collect(result, shard_ids, counts)
+        return result
+
+    def is_online(self, user_id):
+        return self.are_online([user_id])[user_id]
+
+    def room_members(self, room_id):
+        """
+        Return the ids of users with a live connection to the room.
+        """
+        now = time.time()
+        pipeline = self.clients[self._shard(room_id)].pipeline(transaction=False)
+        # Expired members are pruned on read
+        pipeline.zremrangebyscore(self._room_key(room_id), '-inf', now)
+        pipeline.zrangebyscore(self._room_key(room_id), now, '+inf')
+        _, members = pipeline.execute()
+        return {int(member.split(b':', 1)[0]) for member in members}
+
+    # In-process read cache
+
+    def _cached(self, user_ids):
+        result = {}
+        misses = []
+        now = time.monotonic()
+        with self._cache_lock:
+            for user_id in dict.fromkeys(user_ids):
+                entry = self._cache.get(user_id)
+                if entry is not None and entry[1] > now:
+                    result[user_id] = entry[0]
+                else:
+                    misses.append(user_id)
+        return result, misses
+
+    def _collect(self, result, user_ids, counts):
+        for user_id, live in zip(user_ids, counts):
+            result[user_id] = live > 0
+            self._remember(user_id, live > 0)
+
+    def _remember(self, user_id, online):
+        if self.cache_ttl <= 0:
+            return
+        with self._cache_lock:
+            if len(self._cache) >= self.cache_max_entries:
+                self._cache.clear()
+            self._cache[user_id] = (online, time.monotonic() + self.cache_ttl)
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_presence():
+    """
+    Return the process-wide PresenceService configured from settings.
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            urls = getattr(settings, 'PRESENCE_REDIS_URLS', ['redis://localhost:6379/0'])
+            pool_options = {
+                'max_connections': getattr(settings, 'PRESENCE_REDIS_MAX_CONNECTIONS', 50),
+                'socket_timeout': getattr(settings, 'PRESENCE_REDIS_SOCKET_TIMEOUT', 5),
+            }
+            _service = PresenceService(
+                [redis.Redis(connection_pool=redis.ConnectionPool.from_url(url, **pool_options))
+                 for url in urls],
+                async_clients=[
+                    redis.asyncio.Redis(connection_pool=redis.asyncio.ConnectionPool.from_url(url, **pool_options))
+                    for url in urls
+                ],
+                ttl=getattr(settings, 'PRESENCE_TTL', 90),
+                cache_ttl=getattr(settings, 'PRESENCE_CACHE_TTL', 2.0),
+            )
+        return _service
@@ -0,0 +1,216 @@
+# chatapp/registry.py
+"""
+Lazily loaded, process-wide singletons for the moderation pipeline.
+
+Nothing heavy (TensorFlow, the BERT tokenizer, NLTK corpora, the toxic-word
+spreadsheet) is imported or read until the first call to `get(name)`, so
+`manage.py` commands and migrations never pay for it. ASGI workers call
+`warm_up()` once at startup to move that cost off the first chat message.
+"""
+import logging
+import threading
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_loaders = {}
+_instances = {}
+_lock = threading.RLock()
+
+
+def register(name):
+    """
+    Decorator registering `loader` as the factory for the resource `name`.
+    """
+    def decorator(loader):
+        _loaders[name] = loader
+        return loader
+    return decorator
+
+
+def get(name):
+    """
+    Return the resource `name`, loading it on first use.
+    """
+    try:
+        return _instances[name]
+    except KeyError:
+        pass
+
+    with _lock:
+        if name not in _instances:
+            if name not in _loaders:
+                raise KeyError(f"No loader registered for '{name}'.")
+            logger.info("Loading %s", name)
+            _instances[name] = _loaders[name]()
+        return _instances[name]
+
+
+def is_loaded(name):
+    return name in _instances
+
+
+def reset(name=None):
+    """
+    Drop one loaded resource (or all of them) so the next `get` reloads it.
+    """
+    with _lock:
+        if name is None:
+            _instances.clear()
+        else:
+            _instances.pop(name, None)
+
+
+def warm_up(names=None):
+    """
+    Load the given resources (all registered ones by default) and run one
+    prediction so the first real message does not pay for graph tracing.
+    """
+    run_prediction = names is None or 'backend' in names
+    if names is None:
+        # The backend loads whatever model files it needs itself
+        names = [name for name in _loaders if name not in ('model', 'infer')]
+
+    for name in names:
+        get(name)
+
+    if run_prediction:
+        from .predict import predict_toxicity_batch
+        predict_toxicity_batch(["warm up"])
+
+
+def _ensure_nltk_resource(resource, package):
+    import nltk
+
+    try:
+        nltk.data.find(resource)
+    except LookupError:
+        nltk.download(package, quiet=True)
+
+
+@register('model')
+def _load_model():
+    import tensorflow as tf
+
+    return tf.saved_model.load(str(settings.TOXICITY_MODEL_PATH))
+
+
+@register('infer')
+def _load_infer():
+    return get('model').signatures['serving_default']
+
+
+@register('model_version')
+def _load_model_version():
+    """
+    "<backend>:<version>" for the backend that produces the probabilities,
+    so cached and stored scores never mix backends. The version is
+    TOXICITY_MODEL_VERSION if set, otherwise a digest of the backend's model
+    file: the SavedModel fingerprint, or the ONNX export itself.
+    """
+    import hashlib
+    from pathlib import Path
+
+    backend = getattr(settings, 'TOXICITY_BACKEND', 'tensorflow')
+    if backend == 'model_server':
+        # The server's workers run this backend
+        backend = getattr(settings, 'TOXICITY_MODEL_SERVER_BACKEND', 'tensorflow')
+
+    version = getattr(settings, 'TOXICITY_MODEL_VERSION', None)
+    if not version:
+        if backend == 'onnx':
+            model_file = Path(settings.TOXICITY_ONNX_MODEL_PATH)
+        else:
+            model_file = Path(settings.TOXICITY_MODEL_PATH) / 'fingerprint.pb'
+        digest = hashlib.sha256()
+        with open(model_file, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        version = digest.hexdigest()[:16]
+    return f'{backend}:{version}'
+
+
+@register('prediction_cache')
+def _load_prediction_cache():
+    from .prediction_cache import PredictionCache
+
+    redis_client = None
+    if getattr(settings, 'TOXICITY_CACHE_REDIS', False):
+        from .presence import get_presence
+        redis_client = get_presence().clients[0]
+
+    return PredictionCache(
+        max_entries=getattr(settings, 'TOXICITY_CACHE_MAX_ENTRIES', 10000),
+        ttl=getattr(settings, 'TOXICITY_CACHE_TTL', 3600),
+        model_version=get('model_version'),
+        redis_client=redis_client,
+    )
+
+
+@register('length_buckets')
+def _load_length_buckets():
+    from .bucketing import LengthBuckets
+    from .predict import MAX_LENGTH
+
+    return LengthBuckets(getattr(settings, 'TOXICITY_LENGTH_BUCKETS', [16, 32, 64, 128]), MAX_LENGTH)
+
+
+@register('backend')
+def _load_backend():
+    from .backends import create_backend
+
+    return create_backend(getattr(settings, 'TOXICITY_BACKEND', 'tensorflow'))
+
+
+@register('tokenizer')
+def _load_tokenizer():
+    # The Rust-backed tokenizer encodes a whole batch in one call
+    from transformers import BertTokenizerFast
+
+    return BertTokenizerFast.from_pretrained(settings.TOXICITY_TOKENIZER)
+
+
+@register('stop_words')
+def _load_stop_words():
+    _ensure_nltk_resource('corpora/stopwords', 'stopwords')
+    from nltk.corpus import stopwords
+
+    return frozenset(stopwords.words('english'))
+
+
+@register('wordnet')
+def _load_wordnet():
+    _ensure_nltk_resource('corpora/wordnet', 'wordnet')
+    from nltk.corpus import wordnet
+
+    wordnet.ensure_loaded()
+    return wordnet
+
+
+@register('toxic_words')
+def _load_toxic_words():
+    import pandas as pd
+
+    df = pd.read_excel(settings.TOXIC_WORDS_PATH)
+    # Convert toxic words to lowercase for case-insensitive matching
+    return df['comments_text'].str.lower().tolist()
+
+
+@register('toxic_lexicon')
+def _load_toxic_lexicon():
+    from .lexicon import ToxicLexicon
+
+    return ToxicLexicon(get('toxic_words'))
+
+
+@register('antonym_table')
+def _load_antonym_table():
+    from .antonyms import build_table, load_or_build
+    from .utils import get_antonym
+
+    return load_or_build(
+        settings.ANTONYM_TABLE_PATH,
+        settings.TOXIC_WORDS_PATH,
+        lambda: build_table(get('toxic_lexicon'), get_antonym),
+    )
@@ -0,0 +1,88 @@
+# chatapp/room_cache.py
+"""
+Process-wide cache of chat rooms by name.
+
+A WebSocket connection resolves its room once in `connect()` instead of
+querying ChatRoom on every message. Entries are dropped when a room is
+deleted, saved or its participants change (see the receivers in
+chatapp.models), and expire after ROOM_CACHE_TTL seconds so other worker
+processes converge too.
+"""
+import threading
+import time
+
+from django.conf import settings
+
+
+class RoomInfo:
+    __slots__ = ('id', 'name', 'is_group', 'strict_moderation', 'participant_ids')
+
+    def __init__(self, id, name, is_group, strict_moderation, participant_ids):
+        self.id = id
+        self.name = name
+        self.is_group = is_group
+        self.strict_moderation = strict_moderation
+        self.participant_ids = participant_ids
+
+    def can_join(self, user):
+        """
+        Direct chats are limited to their participants; group rooms are open.
+        """
+        return self.is_group or user.id in self.participant_ids
+
+
+_rooms = {}
+_lock = threading.Lock()
+
+
+def _load(name):
+    from .models import ChatRoom
+
+    row = ChatRoom.objects.filter(name=name).values('id', 'name', 'is_group', 'strict_moderation').first()
+    if row is None:
+        return None
+    participant_ids = frozenset(
+        ChatRoom.participants.through.objects.filter(chatroom_id=row['id']).values_list('user_id', flat=True)
+    )
+    return RoomInfo(participant_ids=participant_ids, **row)
+
+
+def get_cached(name):
+    """
+    Return the cached RoomInfo for `name` without touching the database, or
+    None on a miss. Safe to call from the event loop.
+    """
+    with _lock:
+        entry = _rooms.get(name)
+    if entry is not None and entry[1] > time.monotonic():
+        return entry[0]
+    return None
+
+
+def get_room(name):
+    """
+    Return the RoomInfo for `name`, or None if no such room exists.
+    """
+    room = get_cached(name)
+    if room is not None:
+        return room
+
+    now = time.monotonic()
+    room = _load(name)
+    if room is not None:
+        with _lock:
+            _rooms[name] = (room, now + getattr(settings, 'ROOM_CACHE_TTL', 60))
+    return room
+
+
+def invalidate(name=None, room_id=None):
+    """
+    Drop a room by name or id; with neither, clear the whole cache.
+    """
+    with _lock:
+        if name is None and room_id is None:
+            _rooms.clear()
+            return
+        for key, (room, _) in list(_rooms.items()):
+            if key == name or room.id == room_id:
+                del _rooms[key]
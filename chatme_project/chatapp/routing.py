@@ -4,4 +4,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/chat/(?P<room_name>[\w\s]+)/$', consumers.ChatConsumer.as_asgi()),
+    re_path(r'ws/moderation/$', consumers.ModerationConsumer.as_asgi()),
 ]
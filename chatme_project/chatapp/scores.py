@@ -0,0 +1,99 @@
+# chatapp/scores.py
+"""
+Compact storage of per-label toxicity probabilities.
+
+Every scored message keeps the classifier's six sigmoid outputs in
+Message.toxicity_scores as six bytes, each probability quantized to 1/255
+in `predict.labels` order, next to the model_version that produced them.
+Moving the flagging threshold is then a NumPy pass over stored rows
+(`rethreshold`) instead of another round of inference.
+"""
+from collections import defaultdict
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .aggregates import add_message, apply_aggregate_deltas
+from .counters import apply_profile_deltas
+from .predict import label_thresholds, labels, labels_from_probabilities
+
+SCALE = 255
+
+
+def pack(probabilities):
+    """
+    Quantize one row of probabilities to len(labels) bytes.
+    """
+    row = np.clip(np.asarray(probabilities, dtype=np.float32).reshape(len(labels)), 0.0, 1.0)
+    return np.rint(row * SCALE).astype(np.uint8).tobytes()
+
+
+def unpack(blob):
+    return unpack_many([blob])[0]
+
+
+def unpack_many(blobs):
+    """
+    Decode packed rows into a (len(blobs), len(labels)) float32 array.
+    """
+    packed = np.frombuffer(b''.join(bytes(blob) for blob in blobs), dtype=np.uint8)
+    return packed.reshape(-1, len(labels)).astype(np.float32) / SCALE
+
+
+def rethreshold(queryset, threshold=None, dry_run=False, chunk_size=None):
+    """
+    Re-label the messages in `queryset` that have stored scores under
+    `threshold` (a value or a {label: threshold} mapping, see
+    predict.label_thresholds), without running the model. Changed messages
+    are bulk-updated in id-ordered chunks, and the profile counters and
+    toxicity aggregates are adjusted by the difference in the same
+    transaction. Nothing is written when `dry_run` is set.
+
+    Returns counts of scanned, changed, newly flagged and unflagged messages.
+    """
+    from .models import Message
+
+    # Rejects unknown labels before anything is read
+    label_thresholds(threshold)
+    chunk_size = chunk_size or getattr(settings, 'RETHRESHOLD_CHUNK_SIZE', 5000)
+    stats = {'scanned': 0, 'changed': 0, 'flagged': 0, 'unflagged': 0}
+    queryset = queryset.exclude(toxicity_scores=None)
+    last_id = 0
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id)
+            .order_by('id')
+            .values_list('id', 'sender_id', 'room_id', 'timestamp', 'is_flagged', 'toxicity', 'toxicity_scores')
+            [:chunk_size]
+        )
+        if not rows:
+            return stats
+        last_id = rows[-1][0]
+        stats['scanned'] += len(rows)
+
+        new_labels = labels_from_probabilities(unpack_many([row[6] for row in rows]), threshold)
+        changed = []
+        profile_deltas = defaultdict(lambda: [0, 0])
+        aggregate_deltas = defaultdict(lambda: [0, 0])
+        for (message_id, sender_id, room_id, timestamp, is_flagged, toxicity, _), label in zip(rows, new_labels):
+            flagged = label != 'non-toxic'
+            new_toxicity = label if flagged else ''
+            if (flagged, new_toxicity) == (is_flagged, toxicity):
+                continue
+            changed.append(Message(id=message_id, is_flagged=flagged, toxicity=new_toxicity))
+            if flagged == is_flagged:
+                # Only the label changed; the counts stay the same
+                continue
+            stats['flagged' if flagged else 'unflagged'] += 1
+            profile_deltas[sender_id][0 if flagged else 1] += 1
+            profile_deltas[sender_id][1 if flagged else 0] -= 1
+            add_message(aggregate_deltas, sender_id, room_id, timestamp, flagged)
+            add_message(aggregate_deltas, sender_id, room_id, timestamp, is_flagged, count=-1)
+        stats['changed'] += len(changed)
+
+        if changed and not dry_run:
+            with transaction.atomic():
+                Message.objects.bulk_update(changed, ['is_flagged', 'toxicity'], batch_size=500)
+                apply_profile_deltas(profile_deltas)
+                apply_aggregate_deltas(aggregate_deltas)
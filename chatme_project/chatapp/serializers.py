@@ -1,9 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.db import models
 from django.contrib.auth.password_validation import validate_password
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .models import *
-from chatapp.online_users import is_user_online
+from chatapp.online_users import is_user_online, online_statuses
 
 User = get_user_model()
 
@@ -61,6 +62,27 @@ class ProfileSerializer(serializers.ModelSerializer):
         model = Profile
         fields = ['display_name', 'phone_number', 'image']
 
+class OnlineStatusListSerializer(serializers.ListSerializer):
+    """
+    Looks up the online status of every user on the page with one Redis call
+    before serializing, instead of one SISMEMBER per row. The child serializer
+    lists the users it shows through `online_user_ids(instance)`.
+    """
+
+    def to_representation(self, data):
+        items = data.all() if isinstance(data, models.manager.BaseManager) else data
+        items = list(items)
+        statuses = self.context.setdefault('online_status', {})
+        user_ids = {
+            user_id
+            for item in items
+            for user_id in self.child.online_user_ids(item)
+            if user_id not in statuses
+        }
+        statuses.update(online_statuses(user_ids))
+        return super().to_representation(items)
+
+
 class UserSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
     is_online = serializers.SerializerMethodField()
@@ -68,6 +90,10 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'image_url', 'is_online']
+        list_serializer_class = OnlineStatusListSerializer
+
+    def online_user_ids(self, obj):
+        return [obj.id]
 
     def get_image_url(self, obj):
         request = self.context.get('request')
@@ -79,6 +105,9 @@ class UserSerializer(serializers.ModelSerializer):
         return None
 
     def get_is_online(self, obj):
+        statuses = self.context.get('online_status', {})
+        if obj.id in statuses:
+            return statuses[obj.id]
         return is_user_online(obj.id)
 
 class MessageSerializer(serializers.ModelSerializer):
@@ -100,14 +129,46 @@ class MessageSerializer(serializers.ModelSerializer):
             'toxicity',
         ]
         read_only_fields = ['id', 'sender', 'timestamp', 'is_flagged', 'toxicity']
+        list_serializer_class = OnlineStatusListSerializer
+
+    def online_user_ids(self, obj):
+        return [obj.sender_id]
 
 class ChatRoomSerializer(serializers.ModelSerializer):
+    # Message history is served by the paginated messages endpoint
     participants = UserSerializer(many=True, read_only=True)
-    messages = MessageSerializer(many=True, read_only=True)
     
     class Meta:
         model = ChatRoom
-        fields = ('id', 'name', 'participants', 'is_group', 'messages')
+        fields = ('id', 'name', 'participants', 'is_group')
+        list_serializer_class = OnlineStatusListSerializer
+
+    def online_user_ids(self, obj):
+        # Uses the prefetched participants
+        return [user.id for user in obj.participants.all()]
+
+class ChatRoomSummarySerializer(serializers.ModelSerializer):
+    """
+    Room list entry. Reads the annotations added by
+    ChatRoomListCreateView.get_queryset, so it never touches the messages.
+    """
+    participant_count = serializers.IntegerField(read_only=True)
+    unread_count = serializers.IntegerField(read_only=True)
+    last_message = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ChatRoom
+        fields = ('id', 'name', 'is_group', 'participant_count', 'last_message', 'unread_count')
+
+    def get_last_message(self, obj):
+        if obj.last_message_id is None:
+            return None
+        return {
+            'id': obj.last_message_id,
+            'content': obj.last_message_preview,
+            'sender_username': obj.last_message_sender,
+            'timestamp': serializers.DateTimeField().to_representation(obj.last_message_timestamp),
+        }
 
 # serializers.py (add in the existing UserActivitySerializer)
 class UserActivitySerializer(serializers.ModelSerializer):
@@ -118,6 +179,22 @@ class UserActivitySerializer(serializers.ModelSerializer):
         model = User
         fields = ['id', 'username', 'toxic_count', 'non_toxic_count', 'is_blocked']
 
+class ToxicityRankingSerializer(serializers.Serializer):
+    """
+    A user or room with its scored message counts summed over the requested buckets.
+    """
+    id = serializers.IntegerField(source='key')
+    name = serializers.CharField(source='label')
+    toxic_count = serializers.IntegerField(source='toxic')
+    non_toxic_count = serializers.IntegerField(source='non_toxic')
+    total = serializers.IntegerField()
+    toxic_ratio = serializers.FloatField()
+
+class ToxicityTrendSerializer(serializers.Serializer):
+    bucket_start = serializers.DateTimeField()
+    toxic_count = serializers.IntegerField(source='toxic')
+    non_toxic_count = serializers.IntegerField(source='non_toxic')
+
 class UserBlockSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
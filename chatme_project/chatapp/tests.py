@@ -1,3 +1,1544 @@
-from django.test import TestCase
+import csv
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timezone as dt_timezone
+from io import BytesIO, StringIO
+from multiprocessing.pool import ThreadPool
+from unittest import mock
+from pathlib import Path
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.core.management import call_command
+from asgiref.sync import SyncToAsync, async_to_sync, sync_to_async
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from . import aggregates, antonyms, encoding, ingest, model_server, predict, moderation, moderation_feed, presence, registry, room_cache, scores, token_cache
+from .batching import MicroBatcher
+from .prediction_cache import PredictionCache
+from .presence import PresenceService
+from .counters import CounterAggregator, record_message
+from .consumers import ChatConsumer, ModerationConsumer
+from .lexicon import ToxicLexicon, clean_word
+from .middleware import get_user
+from .models import ChatRoom, Message, Profile, ToxicityAggregate, User
+from .bucketing import LengthBuckets
+from .predict import ToxicityResult, labels, labels_from_probabilities, predict_probabilities_batch
+
+TESTDATA_DIR = Path(__file__).resolve().parent / 'testdata'
+
+
+def _has_module(name):
+    return importlib.util.find_spec(name) is not None
+
+
+def _use_fake_presence(test, **kwargs):
+    """
+    Point chatapp.presence at a PresenceService over an empty fakeredis.
+    """
+    import fakeredis
+
+    server = fakeredis.FakeServer()
+    service = PresenceService(
+        [fakeredis.FakeRedis(server=server)],
+        async_clients=[fakeredis.FakeAsyncRedis(server=server)],
+        **{'cache_ttl': 0, **kwargs},
+    )
+    patcher = mock.patch.object(presence, '_service', service)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    return service
+
+
+@unittest.skipUnless(
+    _has_module('tensorflow') and _has_module('onnxruntime') and _has_module('transformers'),
+    "TensorFlow, ONNX Runtime and transformers are needed for the parity check.",
+)
+class BackendParityTests(SimpleTestCase):
+    """
+    The ONNX (int8) export must give the same labels as the SavedModel.
+    """
+    min_label_agreement = 0.95
+
+    def setUp(self):
+        if not (Path(settings.TOXICITY_MODEL_PATH) / 'saved_model.pb').exists():
+            self.skipTest("The SavedModel is not available.")
+        if not Path(settings.TOXICITY_ONNX_MODEL_PATH).exists():
+            self.skipTest("Run manage.py export_onnx first.")
+
+    def test_label_agreement(self):
+        from .backends import OnnxBackend, TensorFlowBackend
+
+        corpus = (TESTDATA_DIR / 'parity_corpus.txt').read_text().splitlines()
+        encodings = registry.get('tokenizer')(
+            corpus, padding=True, truncation=True, max_length=128, return_tensors='np'
+        )
+        input_ids = encodings['input_ids'].astype(np.int32)
+        attention_mask = encodings['attention_mask'].astype(np.int32)
+
+        reference = TensorFlowBackend().predict_proba(input_ids, attention_mask)
+        candidate = OnnxBackend().predict_proba(input_ids, attention_mask)
+
+        self.assertEqual(reference.shape, candidate.shape)
+        reference_labels = np.array(labels_from_probabilities(reference))
+        candidate_labels = np.array(labels_from_probabilities(candidate))
+        agreement = np.mean(reference_labels == candidate_labels)
+        self.assertGreaterEqual(
+            agreement, self.min_label_agreement,
+            f"Label agreement {agreement:.2%}; max probability difference "
+            f"{np.abs(reference - candidate).max():.3f}.",
+        )
+
+
+class ProfileCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='alice', email='alice@example.com')
+
+    def test_record_message_updates_counts_atomically(self):
+        record_message(self.user.id, toxic=True)
+        record_message(self.user.id, toxic=False)
+        record_message(self.user.id, toxic=False)
+
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual((profile.toxic_count, profile.non_toxic_count), (1, 2))
+
+    def test_aggregator_flushes_buffered_increments(self):
+        other = User.objects.create(username='bob', email='bob@example.com')
+        aggregator = CounterAggregator(interval=3600)
+        aggregator.add(self.user.id, toxic=1)
+        aggregator.add(self.user.id, non_toxic=1)
+        aggregator.add(other.id, toxic=1)
+        self.assertEqual(Profile.objects.get(user=self.user).toxic_count, 0)
+
+        with self.assertNumQueries(4):
+            # SAVEPOINT, one UPDATE per distinct delta, RELEASE
+            aggregator.flush()
+
+        self.assertEqual(
+            list(Profile.objects.order_by('user_id').values_list('toxic_count', 'non_toxic_count')),
+            [(1, 1), (1, 0)],
+        )
+
+
+class RoomCacheTests(TestCase):
+    def setUp(self):
+        room_cache.invalidate()
+        self.alice = User.objects.create(username='alice', email='alice@example.com')
+        self.bob = User.objects.create(username='bob', email='bob@example.com')
+        self.room = ChatRoom.objects.create(name='alice_bob')
+        self.room.participants.add(self.alice)
+
+    def test_room_is_loaded_once(self):
+        room = room_cache.get_room('alice_bob')
+        with self.assertNumQueries(0):
+            self.assertIs(room_cache.get_room('alice_bob'), room)
+        self.assertIsNone(room_cache.get_room('missing'))
+
+    def test_participant_changes_invalidate(self):
+        self.assertFalse(room_cache.get_room('alice_bob').can_join(self.bob))
+        self.room.participants.add(self.bob)
+        self.assertTrue(room_cache.get_room('alice_bob').can_join(self.bob))
+        self.bob.chat_rooms.remove(self.room)
+        self.assertFalse(room_cache.get_room('alice_bob').can_join(self.bob))
+
+    def test_deleted_room_is_dropped(self):
+        room_cache.get_room('alice_bob')
+        self.room.delete()
+        self.assertIsNone(room_cache.get_room('alice_bob'))
+
+
+@unittest.skipUnless(_has_module('fakeredis'), "fakeredis stands in for the presence Redis.")
+class MessagePaginationTests(TestCase):
+    def setUp(self):
+        _use_fake_presence(self)
+        self.user = User.objects.create(username='alice', email='alice@example.com')
+        self.room = ChatRoom.objects.create(name='history', is_group=True)
+        Message.objects.bulk_create(
+            Message(room=self.room, sender=self.user, content=str(i), updated_content=str(i))
+            for i in range(7)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f'/api/rooms/{self.room.id}/messages/'
+
+    def _page(self, **params):
+        response = self.client.get(self.url, {'page_size': 3, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_scrolls_back_from_latest_page(self):
+        page = self._page()
+        self.assertEqual([m['content'] for m in page['results']], ['4', '5', '6'])
+        self.assertIsNone(page['after'])
+
+        page = self._page(before=page['before'])
+        self.assertEqual([m['content'] for m in page['results']], ['1', '2', '3'])
+
+        page = self._page(before=page['before'])
+        self.assertEqual([m['content'] for m in page['results']], ['0'])
+        self.assertIsNone(page['before'])
+
+        page = self._page(after=page['after'])
+        self.assertEqual([m['content'] for m in page['results']], ['1', '2', '3'])
+        self.assertIsNotNone(page['after'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'before': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+@unittest.skipUnless(_has_module('fakeredis'), "fakeredis stands in for the presence Redis.")
+class ListQueryCountTests(TestCase):
+    """
+    List endpoints must not issue queries or Redis calls per row.
+    """
+
+    def setUp(self):
+        self.presence = _use_fake_presence(self)
+
+        self.admin = User.objects.create(username='admin', email='admin@example.com', role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def _seed(self, rooms, senders, messages_per_room):
+        users = [
+            User.objects.create(username=f'user{i}', email=f'user{i}@example.com')
+            for i in range(senders)
+        ]
+        self.presence.connect(users[0].id, 'test-connection')
+        for r in range(rooms):
+            room = ChatRoom.objects.create(name=f'room{r}', is_group=True)
+            room.participants.add(*users)
+            Message.objects.bulk_create(
+                Message(room=room, sender=users[i % senders], content=str(i), updated_content=str(i),
+                        is_flagged=bool(i % 2), toxicity='toxic' if i % 2 else '')
+                for i in range(messages_per_room)
+            )
+        return room
+
+    def _assert_constant(self, url, seed, queries):
+        for size in (1, 3):
+            with self.subTest(size=size):
+                ChatRoom.objects.all().delete()
+                User.objects.exclude(pk=self.admin.pk).delete()
+                seed(size)
+                with self.assertNumQueries(queries), \
+                        mock.patch.object(self.presence, 'is_online', side_effect=AssertionError):
+                    response = self.client.get(url())
+                self.assertEqual(response.status_code, 200)
+
+    def test_message_list(self):
+        rooms = []
+        self._assert_constant(
+            lambda: f'/api/rooms/{rooms[-1].id}/messages/',
+            lambda size: rooms.append(self._seed(1, size + 1, size * 10)),
+            queries=1,
+        )
+
+    def test_flagged_list(self):
+        self._assert_constant('/api/flagged-messages/'.format, lambda size: self._seed(size, size + 1, size * 10), 1)
+
+    def test_room_list(self):
+        # Summaries are annotated subqueries; no presence lookups at all
+        with mock.patch.object(self.presence, 'are_online', side_effect=AssertionError):
+            self._assert_constant('/api/rooms/'.format, lambda size: self._seed(size, size + 1, size * 10), 1)
+
+    def test_room_summary(self):
+        room = self._seed(1, 2, 3)
+        reader = User.objects.get(username='user1')
+        self.client.force_authenticate(reader)
+
+        summary = self.client.get('/api/rooms/', {'name': room.name}).data[0]
+        self.assertEqual(summary['participant_count'], 2)
+        self.assertEqual(summary['last_message']['content'], '2')
+        # Messages 0 and 2 are from user0
+        self.assertEqual(summary['unread_count'], 2)
+
+        self.assertEqual(self.client.post(f'/api/rooms/{room.id}/read/').status_code, 204)
+        self.assertEqual(self.client.get('/api/rooms/').data[0]['unread_count'], 0)
+
+    def test_online_status_is_resolved(self):
+        room = self._seed(1, 2, 2)
+        response = self.client.get(f'/api/rooms/{room.id}/messages/')
+        self.assertEqual(
+            {m['sender']['username']: m['sender']['is_online'] for m in response.data['results']},
+            {'user0': True, 'user1': False},
+        )
+
+
+@unittest.skipUnless(_has_module('fakeredis'), "fakeredis stands in for the presence Redis.")
+class PresenceTests(SimpleTestCase):
+    def setUp(self):
+        self.presence = _use_fake_presence(self, ttl=60)
+
+    def test_user_stays_online_until_last_connection_closes(self):
+        self.presence.connect(1, 'tab-a', room_id=10)
+        self.presence.connect(1, 'tab-b', room_id=11)
+        self.presence.disconnect(1, 'tab-a', room_id=10)
+        self.assertEqual(self.presence.are_online([1, 2]), {1: True, 2: False})
+        self.assertEqual(self.presence.room_members(10), set())
+        self.assertEqual(self.presence.room_members(11), {1})
+
+        self.presence.disconnect(1, 'tab-b', room_id=11)
+        self.assertFalse(self.presence.is_online(1))
+
+    def test_connections_without_heartbeat_expire(self):
+        self.presence.connect(1, 'crashed-worker', room_id=10)
+        with mock.patch('chatapp.presence.time.time', return_value=presence.time.time() + 61):
+            self.assertFalse(self.presence.is_online(1))
+            self.assertEqual(self.presence.room_members(10), set())
+
+    def test_heartbeats_prune_expired_connections(self):
+        self.presence.connect(1, 'crashed-worker')
+        self.presence.connect(1, 'tab-a')
+        key = self.presence._user_key(1)
+        later = presence.time.time() + 61
+        with mock.patch('chatapp.presence.time.time', return_value=later):
+            self.presence.heartbeat(1, 'tab-b')
+        self.assertEqual(self.presence.clients[0].zrange(key, 0, -1), [b'tab-b'])
+
+        with mock.patch('chatapp.presence.time.time', return_value=later + 61):
+            async_to_sync(self.presence.aheartbeat)(1, 'tab-c')
+        self.assertEqual(self.presence.clients[0].zrange(key, 0, -1), [b'tab-c'])
+
+    def test_reads_are_cached(self):
+        self.presence.cache_ttl = 60
+        self.presence.connect(1, 'tab-a')
+        with mock.patch.object(self.presence.clients[0], 'pipeline', side_effect=AssertionError):
+            self.assertTrue(self.presence.is_online(1))
+
+
+@unittest.skipUnless(
+    _has_module('fakeredis') and _has_module('daphne'),
+    "fakeredis stands in for the presence Redis; channels.testing needs daphne.",
+)
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ConsumerPresenceTests(TestCase):
+    def setUp(self):
+        self.presence = _use_fake_presence(self)
+        room_cache.invalidate()
+        self.user = User.objects.create(username='alice', email='alice@example.com')
+        ChatRoom.objects.create(name='lobby', is_group=True)
+        # Warm the room cache, as any earlier connection to the room would
+        room_cache.get_room('lobby')
+
+    async def test_connect_and_disconnect_stay_on_the_event_loop(self):
+        from channels.testing import WebsocketCommunicator
+
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/lobby/')
+        communicator.scope['user'] = self.user
+        communicator.scope['url_route'] = {'kwargs': {'room_name': 'lobby'}}
+
+        hops = []
+        original_call = SyncToAsync.__call__
+
+        def record_hop(wrapper, *args, **kwargs):
+            hops.append(f'{wrapper.func.__module__}.{wrapper.func.__qualname__}')
+            return original_call(wrapper, *args, **kwargs)
+
+        with mock.patch.object(SyncToAsync, '__call__', record_hop):
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            self.assertEqual(await self.presence.aare_online([self.user.id]), {self.user.id: True})
+
+            await communicator.disconnect()
+            self.assertEqual(await self.presence.aare_online([self.user.id]), {self.user.id: False})
+
+        # Channels itself still closes stale DB connections on a thread around each event
+        self.assertEqual([hop for hop in hops if hop.startswith('chatapp.')], [])
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        token_cache.clear()
+        self.user = User.objects.create(username='alice', email='alice@example.com')
+        self.token = str(AccessToken.for_user(self.user))
+
+    def test_repeat_handshakes_skip_the_database(self):
+        with self.assertNumQueries(1):
+            user = async_to_sync(get_user)(self.token)
+        self.assertEqual(user.pk, self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(async_to_sync(get_user)(self.token).pk, self.user.pk)
+
+    def test_invalid_token_is_anonymous(self):
+        self.assertFalse(async_to_sync(get_user)(self.token[:-2] + 'xx').is_authenticated)
+
+    def test_blocking_invalidates_cached_tokens(self):
+        self.assertFalse(async_to_sync(get_user)(self.token).is_blocked)
+        admin = User.objects.create(username='admin', email='admin@example.com', role='admin')
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.patch(f'/api/user-block/{self.user.id}/', {'is_blocked': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        # The next handshake reloads the user and sees the new status
+        with self.assertNumQueries(1):
+            user = async_to_sync(get_user)(self.token)
+        self.assertTrue(user.is_authenticated)
+        self.assertTrue(user.is_blocked)
+
+    @override_settings(WS_AUTH_CACHE_TTL=60)
+    def test_entries_expire_after_the_ttl(self):
+        async_to_sync(get_user)(self.token)
+        with mock.patch('chatapp.token_cache.time.time', return_value=token_cache.time.time() + 61):
+            with self.assertNumQueries(1):
+                async_to_sync(get_user)(self.token)
+
+
+@unittest.skipUnless(
+    _has_module('fakeredis') and _has_module('daphne'),
+    "fakeredis stands in for the presence Redis; channels.testing needs daphne.",
+)
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ModerationQueueTests(TestCase):
+    def setUp(self):
+        _use_fake_presence(self)
+        self.moderator = User.objects.create(username='mod', email='mod@example.com', role='moderator')
+        self.sender = User.objects.create(username='bob', email='bob@example.com')
+        self.room = ChatRoom.objects.create(name='queue', is_group=True)
+        labels = ['toxic', 'obscene', '', 'obscene', 'insult', 'obscene']
+        Message.objects.bulk_create(
+            Message(room=self.room, sender=self.sender, content=str(i), updated_content=str(i),
+                    is_flagged=bool(label), toxicity=label)
+            for i, label in enumerate(labels)
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.moderator)
+
+    def test_queue_is_newest_first_and_filtered(self):
+        page = self.client.get('/api/flagged-messages/', {'label': 'obscene', 'page_size': 2}).data
+        self.assertEqual([m['content'] for m in page['results']], ['5', '3'])
+        page = self.client.get('/api/flagged-messages/', {'label': 'obscene', 'before': page['before']}).data
+        self.assertEqual([m['content'] for m in page['results']], ['1'])
+        self.assertIsNone(page['before'])
+
+        other = ChatRoom.objects.create(name='other', is_group=True)
+        self.assertEqual(self.client.get('/api/flagged-messages/', {'room': other.id}).data['results'], [])
+        self.assertEqual(self.client.get('/api/flagged-messages/', {'room': 'x'}).status_code, 400)
+
+    async def test_feed_pushes_flags_to_moderators_only(self):
+        from channels.db import database_sync_to_async
+        from channels.testing import WebsocketCommunicator
+
+        regular = WebsocketCommunicator(ModerationConsumer.as_asgi(), '/ws/moderation/')
+        regular.scope['user'] = self.sender
+        connected, _ = await regular.connect()
+        self.assertFalse(connected)
+
+        communicator = WebsocketCommunicator(ModerationConsumer.as_asgi(), '/ws/moderation/')
+        communicator.scope['user'] = self.moderator
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        message = await Message.objects.select_related('sender__profile').filter(is_flagged=True).alast()
+        await database_sync_to_async(moderation_feed._send)([message])
+        frame = await communicator.receive_json_from()
+        self.assertEqual([m['id'] for m in frame['flagged']], [message.id])
+        await communicator.disconnect()
+
+
+class ToxicityAggregateTests(TestCase):
+    def setUp(self):
+        self.moderator = User.objects.create(username='mod', email='mod@example.com', role='moderator')
+        self.alice = User.objects.create(username='alice', email='alice@example.com')
+        self.bob = User.objects.create(username='bob', email='bob@example.com')
+        self.room = ChatRoom.objects.create(name='stats', is_group=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.moderator)
+
+    def _at(self, day, hour, minute=0):
+        return datetime(2024, 5, day, hour, minute, tzinfo=dt_timezone.utc)
+
+    def test_increments_land_in_hour_and_day_buckets(self):
+        aggregates.record_messages([
+            (self.alice.id, self.room.id, self._at(1, 9, 5), True),
+            (self.alice.id, self.room.id, self._at(1, 9, 55), False),
+            (self.alice.id, self.room.id, self._at(1, 10), True),
+        ])
+        aggregates.record_message(self.alice.id, self.room.id, self._at(1, 10, 30), True)
+
+        rows = ToxicityAggregate.objects.order_by('granularity', 'bucket_start').values_list(
+            'granularity', 'bucket_start', 'toxic_count', 'non_toxic_count')
+        self.assertEqual(list(rows), [
+            ('day', self._at(1, 0), 3, 1),
+            ('hour', self._at(1, 9), 1, 1),
+            ('hour', self._at(1, 10), 2, 0),
+        ])
+
+    def test_ranking_and_trends(self):
+        aggregates.record_messages(
+            [(self.alice.id, self.room.id, self._at(1, 9), True)] * 3
+            + [(self.bob.id, self.room.id, self._at(2, 9), True)]
+            + [(self.bob.id, self.room.id, self._at(2, 9), False)] * 3
+        )
+
+        ranking = self.client.get('/api/toxicity/ranking/').data
+        self.assertEqual([(row['name'], row['toxic_count']) for row in ranking['results']],
+                         [('alice', 3), ('bob', 1)])
+        ranking = self.client.get('/api/toxicity/ranking/', {'ordering': '-total', 'page_size': 1}).data
+        self.assertEqual(ranking['count'], 2)
+        self.assertEqual([(row['name'], row['toxic_ratio']) for row in ranking['results']], [('bob', 0.25)])
+        ranking = self.client.get('/api/toxicity/ranking/', {'by': 'room', 'since': '2024-05-02'}).data
+        self.assertEqual([(row['id'], row['total']) for row in ranking['results']], [(self.room.id, 4)])
+
+        trend = self.client.get('/api/toxicity/trends/', {'user': self.bob.id, 'granularity': 'hour'}).data
+        self.assertEqual(
+            [(row['bucket_start'], row['toxic_count'], row['non_toxic_count']) for row in trend['results']],
+            [('2024-05-02T09:00:00Z', 1, 3)],
+        )
+        self.assertEqual(self.client.get('/api/toxicity/trends/', {'granularity': 'week'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/toxicity/ranking/', {'ordering': 'name'}).status_code, 400)
+
+        self.client.force_authenticate(self.alice)
+        self.assertEqual(self.client.get('/api/toxicity/ranking/').status_code, 403)
+
+    def test_backfill_rebuilds_from_messages(self):
+        Message.objects.bulk_create(
+            Message(room=self.room, sender=sender, content='x', updated_content='x',
+                    is_flagged=flagged, toxicity='toxic' if flagged else '')
+            for sender, flagged in [(self.alice, True), (self.alice, False), (self.bob, True)]
+        )
+        ToxicityAggregate.objects.create(granularity='day', bucket_start=self._at(1, 0), user=self.bob,
+                                         room=self.room, toxic_count=99)
+
+        call_command('backfill_toxicity_aggregates', chunk_size=2, stdout=StringIO())
+
+        totals = ToxicityAggregate.objects.filter(granularity='day').order_by('user_id').values_list(
+            'user_id', 'toxic_count', 'non_toxic_count')
+        self.assertEqual(list(totals), [(self.alice.id, 1, 1), (self.bob.id, 1, 0)])
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.moderator = User.objects.create(username='mod', email='mod@example.com', role='moderator')
+        self.room = ChatRoom.objects.create(name='export', is_group=True)
+        other = ChatRoom.objects.create(name='elsewhere', is_group=True)
+        Message.objects.bulk_create(
+            Message(room=room, sender=self.moderator, content=str(i), updated_content=str(i),
+                    is_flagged=i % 2 == 0, toxicity='toxic' if i % 2 == 0 else '')
+            for i, room in enumerate([self.room, self.room, other, self.room, self.room])
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.moderator)
+
+    def _content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_streams_ndjson_and_csv_with_filters(self):
+        response = self.client.get('/api/export/messages/', {'room': self.room.id})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in self._content(response).splitlines()]
+        self.assertEqual([row['content'] for row in rows], ['0', '1', '3', '4'])
+
+        response = self.client.get('/api/export/flagged-messages/', {'output': 'csv'})
+        rows = list(csv.DictReader(self._content(response).splitlines()))
+        self.assertEqual([(row['content'], row['toxicity']) for row in rows],
+                         [('0', 'toxic'), ('2', 'toxic'), ('4', 'toxic')])
+
+        response = self.client.get('/api/export/messages/', {'since': '2999-01-01'})
+        self.assertEqual(self._content(response), '')
+
+    async def test_asgi_response_streams_asynchronously(self):
+        from django.test import AsyncClient
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        token = await sync_to_async(AccessToken.for_user)(self.moderator)
+        response = await AsyncClient().get('/api/export/messages/', headers={'Authorization': f'Bearer {token}'})
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(b''.join(chunks).splitlines()), 5)
+
+    def test_rejects_bad_parameters(self):
+        self.assertEqual(self.client.get('/api/export/passwords/').status_code, 404)
+        self.assertEqual(self.client.get('/api/export/feedback/', {'room': self.room.id}).status_code, 400)
+        self.assertEqual(self.client.get('/api/export/messages/', {'output': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/export/messages/', {'since': 'yesterday'}).status_code, 400)
+
+    def test_command_writes_user_activity(self):
+        aggregates.record_messages([(self.moderator.id, self.room.id, datetime(2024, 5, 1, tzinfo=dt_timezone.utc), True)])
+        out = StringIO()
+        call_command('export_data', 'user-activity', output='csv', stdout=out)
+        rows = list(csv.DictReader(out.getvalue().splitlines()))
+        self.assertEqual([(row['username'], row['toxic_count']) for row in rows], [('mod', '1')])
+
+
+class RescoreMessagesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='alice', email='alice@example.com')
+        self.room = ChatRoom.objects.create(name='history', is_group=True)
+        Message.objects.bulk_create(
+            Message(room=self.room, sender=self.user, content=content, updated_content=content,
+                    is_flagged=flagged, toxicity='insult' if flagged else '')
+            for content, flagged in [('fine', True), ('rude', False), ('ok', False), ('mean', True)]
+        )
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'rescore.json')
+
+    def _probabilities(self, texts):
+        # 'obscene' for the rude and mean messages, nothing otherwise
+        return np.array([[0, 0, 0.9 if text in ('rude', 'mean') else 0.1, 0, 0, 0] for text in texts])
+
+    def test_rescores_in_chunks_and_recomputes_counters(self):
+        with mock.patch('chatapp.management.commands.rescore_messages.predict_probabilities_batch',
+                        side_effect=self._probabilities) as predict:
+            call_command('rescore_messages', workers=0, chunk_size=3, batch_size=2,
+                         checkpoint=self.checkpoint, stdout=StringIO())
+
+        self.assertEqual([len(call.args[0]) for call in predict.call_args_list], [2, 1, 1])
+        self.assertEqual(
+            list(Message.objects.order_by('id').values_list('content', 'is_flagged', 'toxicity')),
+            [('fine', False, ''), ('rude', True, 'obscene'), ('ok', False, ''), ('mean', True, 'obscene')],
+        )
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual((profile.toxic_count, profile.non_toxic_count), (2, 2))
+        self.assertEqual(ToxicityAggregate.objects.get(granularity='day').toxic_count, 2)
+        self.assertFalse(os.path.exists(self.checkpoint))
+        stored = scores.unpack(Message.objects.get(content='rude').toxicity_scores)
+        np.testing.assert_allclose(stored, [0, 0, 0.9, 0, 0, 0], atol=1 / scores.SCALE)
+
+    def test_resumes_from_checkpoint(self):
+        first, *_, last = Message.objects.order_by('id').values_list('id', flat=True)
+        with open(self.checkpoint, 'w') as checkpoint:
+            json.dump({'last_id': last - 1, 'max_id': last, 'scored': 3, 'changed': 0}, checkpoint)
+
+        with mock.patch('chatapp.management.commands.rescore_messages.predict_probabilities_batch',
+                        side_effect=self._probabilities) as predict:
+            call_command('rescore_messages', workers=0, checkpoint=self.checkpoint, stdout=StringIO())
+
+        self.assertEqual(predict.call_args.args[0], ['mean'])
+        self.assertTrue(Message.objects.get(id=first).is_flagged)
+
+
+class StoredScoreTests(TestCase):
+    def setUp(self):
+        self.moderator = User.objects.create(username='mod', email='mod@example.com', role='moderator')
+        self.user = User.objects.create(username='alice', email='alice@example.com')
+        self.room = ChatRoom.objects.create(name='scores', is_group=True)
+        # (toxic, severe_toxic, obscene, identity_hate, threat, insult)
+        rows = [[0.9, 0, 0.7, 0, 0, 0.2], [0.9, 0, 0.2, 0, 0, 0.45], [0.1, 0, 0.1, 0, 0, 0.1]]
+        messages = []
+        for i, row in enumerate(rows):
+            label = labels_from_probabilities([row])[0]
+            messages.append(Message(
+                room=self.room, sender=self.user, content=str(i), updated_content=str(i),
+                is_flagged=label != 'non-toxic', toxicity='' if label == 'non-toxic' else label,
+                toxicity_scores=scores.pack(row), model_version='v1',
+            ))
+        Message.objects.bulk_create(messages)
+        aggregates.record_messages((self.user.id, self.room.id, m.timestamp, m.is_flagged) for m in messages)
+        Profile.objects.filter(user=self.user).update(toxic_count=1, non_toxic_count=2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.moderator)
+
+    def test_pack_round_trip_and_label_thresholds(self):
+        packed = scores.pack([0.0, 0.25, 0.5, 0.75, 1.0, 0.333])
+        self.assertEqual(len(packed), 6)
+        np.testing.assert_allclose(scores.unpack(packed), [0.0, 0.25, 0.5, 0.75, 1.0, 0.333], atol=0.5 / scores.SCALE)
+
+        row = [0.9, 0, 0.7, 0, 0, 0.6]
+        self.assertEqual(labels_from_probabilities([row]), ['obscene'])
+        self.assertEqual(labels_from_probabilities([row], {'obscene': 0.8}), ['insult'])
+        self.assertEqual(labels_from_probabilities([row], 0.95), ['non-toxic'])
+
+    def test_rethreshold_reflags_history_and_adjusts_counts(self):
+        response = self.client.post('/api/toxicity/rethreshold/', {'threshold': 0.4, 'dry_run': True}, format='json')
+        self.assertEqual(response.data, {'dry_run': True, 'scanned': 3, 'changed': 1, 'flagged': 1, 'unflagged': 0})
+        self.assertFalse(Message.objects.get(content='1').is_flagged)
+
+        response = self.client.post('/api/toxicity/rethreshold/',
+                                    {'threshold': {'insult': 0.4, 'obscene': 0.8}}, format='json')
+        self.assertEqual(response.data['changed'], 2)
+        self.assertEqual(
+            list(Message.objects.order_by('id').values_list('is_flagged', 'toxicity')),
+            [(False, ''), (True, 'insult'), (False, '')],
+        )
+        # One message moved each way, so the totals are unchanged
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual((profile.toxic_count, profile.non_toxic_count), (1, 2))
+
+        response = self.client.post('/api/toxicity/rethreshold/', {'threshold': 0.99}, format='json')
+        self.assertEqual((response.data['flagged'], response.data['unflagged']), (0, 1))
+        profile.refresh_from_db()
+        self.assertEqual((profile.toxic_count, profile.non_toxic_count), (0, 3))
+        self.assertEqual(ToxicityAggregate.objects.get(granularity='day').toxic_count, 0)
+
+        for bad in ({'threshold': 2}, {'threshold': {'rude': 0.5}}, {}, {'threshold': 0.5, 'dry_run': 'maybe'}):
+            self.assertEqual(self.client.post('/api/toxicity/rethreshold/', bad, format='json').status_code, 400)
+
+    def test_dry_run_strings_are_parsed(self):
+        for value, dry_run in (('false', False), ('0', False), ('true', True), ('1', True)):
+            response = self.client.post('/api/toxicity/rethreshold/', {'threshold': 0.4, 'dry_run': value},
+                                        format='json')
+            self.assertEqual(response.data['dry_run'], dry_run, value)
+        self.assertTrue(Message.objects.get(content='1').is_flagged)
+
+
+class MicroBatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.batches = []
+
+    def _batcher(self, handler=None, **kwargs):
+        def record(items):
+            self.batches.append(list(items))
+            return [item * 2 for item in items]
+
+        batcher = MicroBatcher(handler or record, **kwargs)
+        self.addCleanup(batcher.stop)
+        return batcher
+
+    def test_flushes_when_batch_is_full(self):
+        batcher = self._batcher(max_batch_size=3, max_wait=60)
+        futures = [batcher.submit(i) for i in range(3)]
+        self.assertEqual([future.result(timeout=5) for future in futures], [0, 2, 4])
+        self.assertEqual(self.batches, [[0, 1, 2]])
+
+    def test_flushes_partial_batch_after_max_wait(self):
+        batcher = self._batcher(max_batch_size=100, max_wait=0.05)
+        futures = [batcher.submit(i) for i in range(2)]
+        self.assertEqual([future.result(timeout=5) for future in futures], [0, 2])
+        self.assertEqual(self.batches, [[0, 1]])
+
+    def test_concurrent_callers_get_their_own_results(self):
+        batcher = self._batcher(max_batch_size=8, max_wait=0.05)
+        results = {}
+
+        def send(i):
+            results[i] = batcher.process(i, timeout=5)
+
+        threads = [threading.Thread(target=send, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {i: i * 2 for i in range(20)})
+        self.assertTrue(all(len(batch) <= 8 for batch in self.batches))
+
+    def test_handler_exception_reaches_every_waiter(self):
+        def fail(items):
+            raise ValueError("model failed")
+
+        batcher = self._batcher(fail, max_batch_size=2, max_wait=60)
+        futures = [batcher.submit(i) for i in range(2)]
+        for future in futures:
+            with self.assertRaisesMessage(ValueError, "model failed"):
+                future.result(timeout=5)
+        # The worker keeps serving later batches
+        batcher.handler = lambda items: items
+        futures = [batcher.submit(i) for i in ('a', 'b')]
+        self.assertEqual([future.result(timeout=5) for future in futures], ['a', 'b'])
+
+    def test_wrong_result_count_fails_the_batch(self):
+        batcher = self._batcher(lambda items: items[:-1], max_batch_size=2, max_wait=60)
+        futures = [batcher.submit(i) for i in range(2)]
+        for future in futures:
+            with self.assertRaisesMessage(RuntimeError, "returned 1 results for 2 items"):
+                future.result(timeout=5)
+
+
+class RegistryLazinessTests(SimpleTestCase):
+    def test_importing_the_app_loads_no_resources(self):
+        # A fresh interpreter, since this one may already have loaded some
+        script = (
+            "import sys, django; django.setup(); "
+            "import chatapp.models, chatapp.views, chatapp.consumers, chatme_project.asgi; "
+            "from chatapp import registry; "
+            "heavy = [name for name in ('tensorflow', 'transformers', 'nltk', 'pandas') if name in sys.modules]; "
+            "print(sorted(registry._instances), heavy)"
+        )
+        output = subprocess.run(
+            [sys.executable, '-c', script],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'chatme_project.settings'},
+        ).stdout
+        self.assertEqual(output.strip().splitlines()[-1], '[] []')
+
+
+@unittest.skipUnless(_has_module('fakeredis'), "fakeredis stands in for the presence Redis.")
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class BackgroundModerationTests(TestCase):
+    def setUp(self):
+        # The moderation feed serializes flagged messages with online status
+        _use_fake_presence(self)
+        self.user = User.objects.create(username='alice', email='alice@example.com')
+        self.room = ChatRoom.objects.create(name='lobby', is_group=True)
+        # Stored as Message.save(moderate=False) leaves it: filtered, not scored
+        self.message, = Message.objects.bulk_create([
+            Message(room=self.room, sender=self.user, content='you idiot', updated_content='you idiot'),
+        ])
+
+    def test_moderate_message_stores_result_counts_and_announces(self):
+        from channels.layers import get_channel_layer
+
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)('chat_lobby', channel)
+        result = ToxicityResult('insult', np.array([0.9, 0, 0.1, 0, 0, 0.8], dtype=np.float32))
+
+        with mock.patch.object(moderation, 'classify_toxicity', return_value=result) as classify, \
+                self.captureOnCommitCallbacks(execute=True):
+            moderation.moderate_message(self.message.id)
+
+        classify.assert_called_once_with('you idiot')
+        self.message.refresh_from_db()
+        self.assertEqual((self.message.is_flagged, self.message.toxicity), (True, 'insult'))
+        self.assertEqual(scores.unpack(self.message.toxicity_scores)[5], round(0.8 * 255) / 255)
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual((profile.toxic_count, profile.non_toxic_count), (1, 0))
+
+        event = async_to_sync(layer.receive)(channel)
+        self.assertEqual(event['type'], 'chat_message_encoded')
+        self.assertEqual(json.loads(event['text']), {
+            'moderation': {'id': self.message.id, 'is_flagged': True, 'toxicity': 'insult'},
+        })
+
+    def test_missing_message_is_skipped(self):
+        with mock.patch.object(moderation, 'classify_toxicity') as classify:
+            self.assertIsNone(moderation.moderate_message(self.message.id + 1))
+        classify.assert_not_called()
+
+
+class PredictionCacheTests(SimpleTestCase):
+    row = np.arange(6, dtype=np.float32) / 10
+
+    def test_lru_bound_evicts_least_recently_used(self):
+        cache = PredictionCache(max_entries=2)
+        cache.set('a', self.row)
+        cache.set('b', self.row)
+        cache.get('a')
+        cache.set('c', self.row)
+        self.assertEqual([cache.get(text) is not None for text in 'abc'], [True, False, True])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_entries_expire_after_ttl(self):
+        cache = PredictionCache(ttl=10)
+        with mock.patch('chatapp.prediction_cache.time.monotonic', return_value=100.0):
+            cache.set('hello', self.row)
+        with mock.patch('chatapp.prediction_cache.time.monotonic', return_value=109.0):
+            np.testing.assert_array_equal(cache.get('  HELLO '), self.row)
+        with mock.patch('chatapp.prediction_cache.time.monotonic', return_value=110.0):
+            self.assertIsNone(cache.get('hello'))
+        self.assertEqual(cache.stats()['expirations'], 1)
+
+    def test_keys_depend_on_model_version(self):
+        old, new = PredictionCache(model_version='v1'), PredictionCache(model_version='v2')
+        self.assertEqual(old.key('Hi  there'), old.key('hi there'))
+        self.assertNotEqual(old.key('hi there'), new.key('hi there'))
+
+    @unittest.skipUnless(_has_module('fakeredis'), "fakeredis stands in for the shared Redis tier.")
+    def test_redis_tier_and_errors(self):
+        import fakeredis
+
+        server = fakeredis.FakeServer()
+        writer = PredictionCache(ttl=30.5, redis_client=fakeredis.FakeRedis(server=server))
+        writer.set('shared', self.row)
+        client = fakeredis.FakeRedis(server=server)
+        key, = client.keys('toxicity:prediction:*')
+        self.assertTrue(0 < client.pttl(key) <= 30500)
+
+        reader = PredictionCache(redis_client=client)
+        np.testing.assert_allclose(reader.get('shared'), self.row)
+        self.assertEqual(reader.stats()['redis_hits'], 1)
+
+        # An unreachable Redis is a miss, not an error
+        server.connected = False
+        offline = PredictionCache(redis_client=fakeredis.FakeRedis(server=server))
+        self.assertIsNone(offline.get('shared'))
+        offline.set('other', self.row)
+        self.assertEqual(offline.stats()['redis_errors'], 2)
+
+
+class ToxicLexiconTests(SimpleTestCase):
+    def setUp(self):
+        self.lexicon = ToxicLexicon(['idiot', 'Shut up', 'shut up now', 'up yours', 'dumb', None])
+
+    def _tokens(self, text):
+        return [clean_word(word) for word in text.split()]
+
+    def test_matches_words_and_multi_word_phrases(self):
+        self.assertEqual(len(self.lexicon), 5)
+        self.assertIn('SHUT UP', self.lexicon)
+        self.assertEqual(self.lexicon.find(self._tokens('you idiot please shut up')), [(1, 2), (3, 5)])
+        # Phrases only match whole words in sequence
+        self.assertEqual(self.lexicon.find(self._tokens('shut the door, up there')), [])
+
+    def test_prefers_leftmost_longest_non_overlapping_matches(self):
+        self.assertEqual(self.lexicon.find(self._tokens('shut up now')), [(0, 3)])
+        # 'shut up' wins over the overlapping 'up yours' that starts later
+        self.assertEqual(self.lexicon.find(self._tokens('shut up yours dumb')), [(0, 2), (3, 4)])
+
+    def test_replace_ignores_case_and_surrounding_punctuation(self):
+        replaced = self.lexicon.replace('Hey, IDIOT!  Shut... up!', lambda entry: f'<{entry}>')
+        self.assertEqual(replaced, 'Hey, <idiot> <shut up>')
+
+    def test_explicit_word_list_matches_the_word_by_word_filter(self):
+        from . import utils
+
+        def legacy(text, toxic_words):
+            words = text.split()
+            for i, word in enumerate(words):
+                if clean_word(word) in toxic_words:
+                    words[i] = utils.get_antonym(clean_word(word))
+            return ' '.join(words)
+
+        toxic_words = ['idiot', 'dumb', 'bad']
+        texts = ['You are an idiot and a fornicator.', 'DUMB,  dumb! bad-ish Bad', 'nothing to see', '']
+        with mock.patch.object(utils, 'get_antonym', side_effect=lambda word: word.upper()):
+            for text in texts:
+                self.assertEqual(utils.replace_toxic_with_antonyms(text, toxic_words), legacy(text, toxic_words))
+
+
+class AntonymTableTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.source = Path(directory) / 'toxic_words.xlsx'
+        self.source.write_bytes(b'idiot,shut up')
+        self.table_path = Path(directory) / 'cache' / 'antonyms.pickle'
+        self.build = mock.Mock(side_effect=lambda: antonyms.build_table(
+            ToxicLexicon(['idiot', 'shut up']), lambda entry: entry.upper()))
+
+    def _load(self):
+        return antonyms.load_or_build(self.table_path, self.source, self.build)
+
+    def test_build_and_load_round_trip(self):
+        self.assertEqual(self._load(), {'idiot': 'IDIOT', 'shut up': 'SHUT UP'})
+        self.assertEqual(self._load(), {'idiot': 'IDIOT', 'shut up': 'SHUT UP'})
+        self.assertEqual(self.build.call_count, 1)
+        payload = antonyms.load_table(self.table_path)
+        self.assertEqual(payload['source'], antonyms.source_signature(self.source))
+
+    def test_rebuilds_when_the_spreadsheet_changes(self):
+        self._load()
+        self.source.write_bytes(b'idiot,shut up,dumb')
+        os.utime(self.source, ns=(0, self.source.stat().st_mtime_ns + 10 ** 9))
+        self._load()
+        self.assertEqual(self.build.call_count, 2)
+
+    def test_touching_the_spreadsheet_does_not_rebuild(self):
+        self._load()
+        mtime_ns = self.source.stat().st_mtime_ns + 10 ** 9
+        os.utime(self.source, ns=(0, mtime_ns))
+        with mock.patch.object(antonyms, 'source_signature', wraps=antonyms.source_signature) as signature:
+            self.assertEqual(self._load(), {'idiot': 'IDIOT', 'shut up': 'SHUT UP'})
+        self.assertEqual(self.build.call_count, 1)
+        self.assertIn(mock.call(self.source), signature.call_args_list)
+        # The new mtime is recorded, so the next load skips hashing
+        self.assertEqual(antonyms.load_table(self.table_path)['source']['mtime_ns'], mtime_ns)
+
+    def test_unreadable_table_is_rebuilt(self):
+        self.table_path.parent.mkdir(parents=True)
+        self.table_path.write_bytes(b'not a pickle')
+        self._load()
+        self.assertEqual(self.build.call_count, 1)
+
+
+class StubBackend:
+    def predict_proba(self, input_ids, attention_mask):
+        if not attention_mask.any():
+            raise ValueError("empty batch")
+        return np.repeat((input_ids * attention_mask).sum(axis=1, keepdims=True) / 100.0, 6, axis=1)
+
+
+class ModelServerTests(SimpleTestCase):
+    def setUp(self):
+        self.socket_path = os.path.join(tempfile.mkdtemp(), 'model.sock')
+        self.server = model_server.ModelServer(self.socket_path, workers=1)
+        self.client = model_server.ModelServerClient(self.socket_path)
+
+        # Model workers run as threads of the test process around a stub backend
+        context = mock.Mock()
+        context.Pool.side_effect = lambda workers, initializer: ThreadPool(workers)
+        patches = [
+            mock.patch.object(model_server, 'get_context', return_value=context),
+            mock.patch.object(model_server, '_backend', StubBackend()),
+            # They share this process's resource tracker with the client, which unlinks the blocks
+            mock.patch.object(model_server, 'resource_tracker'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        # Record the name of every block the client creates
+        self.blocks = []
+        create = model_server.shared_memory.SharedMemory
+
+        def shared_memory(*args, **kwargs):
+            block = create(*args, **kwargs)
+            if kwargs.get('create'):
+                self.blocks.append(block.name)
+            return block
+
+        patch = mock.patch.object(model_server.shared_memory, 'SharedMemory', side_effect=shared_memory)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def _start_server(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(self.client._reset)
+        deadline = time.monotonic() + 5
+        while not os.path.exists(self.socket_path):
+            self.assertLess(time.monotonic(), deadline, "model server did not start")
+            time.sleep(0.01)
+
+    def assertBlocksReleased(self):
+        self.assertTrue(self.blocks)
+        for name in self.blocks:
+            self.assertFalse(os.path.exists(os.path.join('/dev/shm', name.lstrip('/'))))
+
+    def test_round_trip_through_shared_memory(self):
+        self._start_server()
+        input_ids = np.array([[101, 7, 102, 0], [101, 9, 9, 102]], dtype=np.int32)
+        attention_mask = np.array([[1, 1, 1, 0], [1, 1, 1, 1]], dtype=np.int32)
+
+        probabilities = self.client.predict_proba(input_ids, attention_mask)
+
+        self.assertEqual(probabilities.shape, (2, 6))
+        self.assertEqual(probabilities.dtype, np.float32)
+        np.testing.assert_allclose(probabilities, StubBackend().predict_proba(input_ids, attention_mask))
+        # The connection is reused for the next request
+        self.client.predict_proba(input_ids, attention_mask)
+        self.assertEqual(len(self.blocks), 2)
+        self.assertBlocksReleased()
+
+    def test_block_is_released_when_the_backend_fails(self):
+        self._start_server()
+        empty = np.zeros((1, 4), dtype=np.int32)
+
+        with self.assertRaisesMessage(model_server.ModelServerError, "empty batch"):
+            self.client.predict_proba(empty, empty)
+        self.assertBlocksReleased()
+
+    def test_block_is_released_when_the_server_is_unreachable(self):
+        ids = np.ones((1, 4), dtype=np.int32)
+
+        with self.assertRaises(OSError):
+            self.client.predict_proba(ids, ids)
+        self.assertBlocksReleased()
+
+
+class LengthBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.buckets = LengthBuckets([16, 32, 64, 200], max_length=128)
+
+    def test_boundaries_are_capped_at_max_length(self):
+        self.assertEqual(self.buckets.boundaries, [16, 32, 64, 128])
+
+    def test_lengths_go_to_the_smallest_bucket_that_fits(self):
+        self.assertEqual(self.buckets.bucket_for(0), 16)
+        self.assertEqual(self.buckets.bucket_for(16), 16)
+        self.assertEqual(self.buckets.bucket_for(17), 32)
+        self.assertEqual(self.buckets.bucket_for(64), 64)
+        self.assertEqual(self.buckets.bucket_for(65), 128)
+        self.assertEqual(self.buckets.bucket_for(128), 128)
+
+    def test_lengths_above_the_largest_bucket_are_truncated(self):
+        self.assertEqual(self.buckets.bucket_for(500), 128)
+        [(indices, input_ids, attention_mask)] = self.buckets.split([list(range(1, 501))])
+        self.assertEqual(indices, [0])
+        self.assertEqual(input_ids.shape, (1, 128))
+        self.assertEqual(input_ids[0].tolist(), list(range(1, 129)))
+        self.assertTrue(attention_mask.all())
+
+    def test_each_bucket_is_padded_to_its_boundary(self):
+        sequences = [[1] * 5, [2] * 40, [3] * 16, [4] * 17, [5] * 3]
+        batches = list(self.buckets.split(sequences))
+
+        self.assertEqual([indices for indices, _, _ in batches], [[0, 2, 4], [3], [1]])
+        for (indices, input_ids, attention_mask), boundary in zip(batches, (16, 32, 64)):
+            self.assertEqual(input_ids.shape, (len(indices), boundary))
+            self.assertEqual(attention_mask.shape, (len(indices), boundary))
+            self.assertEqual(input_ids.dtype, np.int32)
+            for row, index in enumerate(indices):
+                length = len(sequences[index])
+                self.assertEqual(input_ids[row, :length].tolist(), sequences[index])
+                self.assertFalse(input_ids[row, length:].any())
+                self.assertEqual(attention_mask[row].sum(), length)
+
+        histogram = self.buckets.histogram()
+        self.assertEqual(histogram['16'], {
+            'sequences': 3, 'batches': 1, 'tokens': 24, 'padded_tokens': 48, 'fill_ratio': 0.5,
+        })
+        self.assertEqual(histogram['128']['batches'], 0)
+
+    def test_probabilities_come_back_in_input_order(self):
+        comments = ['a ' * 50, 'b', 'c ' * 20, 'd', 'e ' * 100]
+
+        def tokenizer(texts, truncation, max_length):
+            return {'input_ids': [[ord(text[0])] * min(len(text.split()), max_length) for text in texts]}
+
+        class FirstTokenBackend:
+            # Echoes the first token id so each row identifies its comment
+            def predict_proba(self, input_ids, attention_mask):
+                return np.repeat(input_ids[:, :1], 6, axis=1).astype(np.float32)
+
+        with mock.patch.dict(registry._instances, {
+            'tokenizer': tokenizer, 'backend': FirstTokenBackend(), 'length_buckets': self.buckets,
+        }):
+            probabilities = predict_probabilities_batch(comments)
+
+        self.assertEqual(probabilities[:, 0].tolist(), [ord(comment[0]) for comment in comments])
+
+
+def _legacy_label_from_probabilities(row):
+    # The per-row selection labels_from_probabilities replaced
+    toxic_class_index = labels.index('toxic')
+    non_toxic_class_indices = [i for i in range(len(labels)) if i != toxic_class_index]
+    non_toxic_labels = [labels[i] for i in non_toxic_class_indices]
+    non_toxic_probabilities = [row[j] for j in non_toxic_class_indices]
+    if max(non_toxic_probabilities) > 0.5:
+        return non_toxic_labels[non_toxic_probabilities.index(max(non_toxic_probabilities))]
+    return 'non-toxic'
+
+
+class LabelSelectionTests(SimpleTestCase):
+    # Columns: toxic, severe_toxic, obscene, identity_hate, threat, insult
+    PROBABILITIES = np.array([
+        [0.99, 0.10, 0.20, 0.05, 0.01, 0.30],
+        [0.90, 0.20, 0.85, 0.10, 0.05, 0.70],
+        [0.10, 0.50, 0.50, 0.50, 0.50, 0.50],
+        [0.60, 0.51, 0.10, 0.10, 0.10, 0.10],
+        [0.80, 0.10, 0.75, 0.10, 0.10, 0.75],
+        [0.00, 0.00, 0.00, 0.00, 0.97, 0.00],
+        [0.70, 0.30, 0.40, 0.55, 0.20, 0.10],
+    ], dtype=np.float32)
+
+    def test_toxic_column_is_never_reported(self):
+        self.assertEqual(labels_from_probabilities([[1.0, 0, 0, 0, 0, 0]]), ['non-toxic'])
+        self.assertEqual(labels_from_probabilities([[1.0, 0, 0, 0, 0, 0.6]]), ['insult'])
+
+    @override_settings(TOXICITY_THRESHOLD=0.5)
+    def test_threshold_is_exclusive(self):
+        self.assertEqual(labels_from_probabilities([[0, 0, 0.5, 0, 0, 0]]), ['non-toxic'])
+        self.assertEqual(labels_from_probabilities([[0, 0, 0.5, 0, 0, 0]], 0.4), ['obscene'])
+        self.assertEqual(labels_from_probabilities([[0, 0, 0.6, 0, 0, 0]], 0.6), ['non-toxic'])
+
+    @override_settings(TOXICITY_THRESHOLD=0.5)
+    def test_matches_the_per_row_selection(self):
+        expected = [_legacy_label_from_probabilities(row.tolist()) for row in self.PROBABILITIES]
+        self.assertEqual(expected, [
+            'non-toxic', 'obscene', 'non-toxic', 'severe_toxic', 'obscene', 'threat', 'identity_hate',
+        ])
+        self.assertEqual(labels_from_probabilities(self.PROBABILITIES), expected)
+
+    @override_settings(TOXICITY_THRESHOLD=0.5)
+    def test_matches_the_per_row_selection_on_random_rows(self):
+        rows = np.random.default_rng(0).random((500, len(labels)), dtype=np.float32)
+        self.assertEqual(
+            labels_from_probabilities(rows),
+            [_legacy_label_from_probabilities(row.tolist()) for row in rows],
+        )
+
+    def test_empty_batch(self):
+        self.assertEqual(labels_from_probabilities(np.empty((0, len(labels)))), [])
+
+
+def _fake_classify_batch(comments):
+    return [
+        ToxicityResult('insult' if 'idiot' in comment else 'non-toxic', np.zeros(len(labels), dtype=np.float32))
+        for comment in comments
+    ]
+
+
+class MessageImportTests(TestCase):
+    def setUp(self):
+        self.moderator = User.objects.create(username='mod', email='mod@example.com', role='moderator')
+        self.author = User.objects.create(username='author', email='author@example.com')
+        self.room = ChatRoom.objects.create(name='import', is_group=True)
+        self.url = f'/api/rooms/{self.room.id}/messages/import/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.moderator)
+
+        self.classify = mock.Mock(side_effect=_fake_classify_batch)
+        patches = [
+            mock.patch('chatapp.ingest.classify_toxicity_batch', self.classify),
+            mock.patch('chatapp.ingest.publish_flagged'),
+            # Content filtering needs the NLTK corpora and the toxic-word spreadsheet
+            mock.patch.object(Message, 'filter_content', lambda message: None),
+            mock.patch.dict(registry._instances, {'model_version': 'test'}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_imports_a_json_list(self):
+        response = self.client.post(self.url, [
+            {'content': 'hello', 'sender': self.author.id},
+            {'content': 'you idiot', 'sender': str(self.author.id)},
+            {'content': 'from the moderator'},
+        ], format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'imported': 3, 'flagged': 1, 'errors': []})
+        self.assertEqual(
+            list(Message.objects.filter(room=self.room).order_by('id').values_list(
+                'sender__username', 'content', 'is_flagged', 'toxicity', 'model_version')),
+            [('author', 'hello', False, '', 'test'), ('author', 'you idiot', True, 'insult', 'test'),
+             ('mod', 'from the moderator', False, '', 'test')],
+        )
+        self.author.profile.refresh_from_db()
+        self.assertEqual((self.author.profile.toxic_count, self.author.profile.non_toxic_count), (1, 1))
+
+    def test_accepts_a_messages_object(self):
+        response = self.client.post(self.url, {'messages': [{'content': 'hello'}]}, format='json')
+        self.assertEqual(response.data['imported'], 1)
+
+    @override_settings(MESSAGE_IMPORT_CHUNK_SIZE=2)
+    def test_ndjson_is_stored_in_chunks(self):
+        body = '\n'.join(
+            json.dumps({'content': f'idiot {i}' if i % 2 else f'message {i}', 'sender': self.author.id})
+            for i in range(5)
+        ) + '\n\n'
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.data, {'imported': 5, 'flagged': 2, 'errors': []})
+        self.assertEqual([len(call.args[0]) for call in self.classify.call_args_list], [2, 2, 1])
+        self.assertEqual(
+            list(Message.objects.filter(room=self.room).order_by('id').values_list('content', flat=True)),
+            ['message 0', 'idiot 1', 'message 2', 'idiot 3', 'message 4'],
+        )
+
+    @override_settings(MESSAGE_IMPORT_CHUNK_SIZE=3)
+    def test_bad_records_are_reported_and_skipped(self):
+        body = '\n'.join([
+            json.dumps({'content': 'kept'}),
+            '{not json',
+            json.dumps({'content': '   '}),
+            json.dumps({'content': 'unknown sender', 'sender': 999999}),
+            json.dumps({'content': 'list sender', 'sender': [self.author.id]}),
+            json.dumps({'content': 'object sender', 'sender': {'id': self.author.id}}),
+            json.dumps({'content': 'word sender', 'sender': 'author'}),
+            json.dumps(['not', 'an', 'object']),
+            json.dumps({'content': 'idiot', 'sender': f'{self.author.id}'}),
+        ])
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['imported'], 2)
+        self.assertEqual(response.data['flagged'], 1)
+        self.assertEqual(response.data['errors'], [
+            {'index': 1, 'detail': 'Invalid JSON.'},
+            {'index': 2, 'detail': 'Message content cannot be empty.'},
+            {'index': 3, 'detail': 'Sender not found.'},
+            {'index': 4, 'detail': 'Sender must be a user id.'},
+            {'index': 5, 'detail': 'Sender must be a user id.'},
+            {'index': 6, 'detail': 'Sender must be a user id.'},
+            {'index': 7, 'detail': 'Message content cannot be empty.'},
+        ])
+
+    def test_empty_or_malformed_bodies_are_rejected(self):
+        response = self.client.post(self.url, b'', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+        for body in ({'messages': {'content': 'hello'}}, {'messages': 'hello'}, {}, 'hello'):
+            response = self.client.post(self.url, body, format='json')
+            self.assertEqual(response.status_code, 400, body)
+            self.assertIn('messages', response.data)
+        self.assertFalse(Message.objects.exists())
+
+    def test_requires_a_moderator(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.post(self.url, [{'content': 'hello'}], format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Message.objects.exists())
+
+
+class EncodingTests(SimpleTestCase):
+    PAYLOAD = {
+        'message': {
+            'id': 42, 'content': 'héllo 👋 "quoted" \\ </script>', 'is_flagged': False,
+            'toxicity': None, 'sender': {'id': 7, 'username': 'ünï', 'is_online': True},
+            'timestamp': '2026-01-01T12:00:00.123456Z', 'scores': [0.1, 0.25, 3.0],
+        },
+    }
+
+    def test_fallback_is_compact(self):
+        with mock.patch.object(encoding, 'orjson', None):
+            text = encoding.encode(self.PAYLOAD)
+        self.assertNotIn(': ', text)
+        self.assertNotIn('\\u', text)
+        self.assertEqual(json.loads(text), self.PAYLOAD)
+
+    @unittest.skipUnless(_has_module('orjson'), "Compares the json fallback with orjson.")
+    def test_fallback_matches_orjson(self):
+        fast = encoding.encode(self.PAYLOAD)
+        with mock.patch.object(encoding, 'orjson', None):
+            fallback = encoding.encode(self.PAYLOAD)
+        self.assertEqual(fallback, fast)
+
+    def test_encoded_event(self):
+        event = encoding.encoded_event(self.PAYLOAD)
+        self.assertEqual(event['type'], 'chat_message_encoded')
+        self.assertEqual(json.loads(event['text']), self.PAYLOAD)
+
+
+@unittest.skipUnless(
+    _has_module('fakeredis') and _has_module('daphne'),
+    "fakeredis stands in for the presence Redis; channels.testing needs daphne.",
+)
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+                   CHAT_BATCHED_PERSISTENCE=False, CHAT_MODERATION_MODE=moderation.ASYNC)
+class EncodedFanOutTests(TestCase):
+    def setUp(self):
+        _use_fake_presence(self)
+        room_cache.invalidate()
+        self.users = [
+            User.objects.create(username=name, email=f'{name}@example.com') for name in ('alice', 'bob', 'carol')
+        ]
+        ChatRoom.objects.create(name='lobby', is_group=True)
+        room_cache.get_room('lobby')
+
+        patches = [
+            # Content filtering needs the NLTK corpora and the toxic-word spreadsheet
+            mock.patch.object(Message, 'filter_content', lambda message: None),
+            mock.patch.object(moderation, 'schedule'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def _connect(self, user):
+        from channels.testing import WebsocketCommunicator
+
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/lobby/')
+        communicator.scope['user'] = user
+        communicator.scope['url_route'] = {'kwargs': {'room_name': 'lobby'}}
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def test_every_member_receives_the_same_frame(self):
+        communicators = [await self._connect(user) for user in self.users]
+        try:
+            encoded = []
+            original_encode = encoding.encode
+
+            def encode(payload):
+                encoded.append(original_encode(payload))
+                return encoded[-1]
+
+            with mock.patch('chatapp.encoding.encode', encode):
+                await communicators[0].send_to(text_data=json.dumps({'message': 'héllo 👋'}))
+                frames = [await communicator.receive_from() for communicator in communicators]
+
+            # Encoded once by the sender; every member gets that exact text
+            self.assertEqual(len(encoded), 1)
+            self.assertEqual(frames, encoded * len(communicators))
+            self.assertEqual(json.loads(frames[0])['message']['content'], 'héllo 👋')
+        finally:
+            for communicator in communicators:
+                await communicator.disconnect()
+
+    async def test_pre_encoded_group_event_is_forwarded_unchanged(self):
+        from channels.layers import get_channel_layer
+
+        communicators = [await self._connect(user) for user in self.users[:2]]
+        try:
+            # Deliberately not what this process's encoder would produce
+            text = '{"message": {"id": 1,   "content": "sp  aced"}}'
+            await get_channel_layer().group_send('chat_lobby', {'type': 'chat_message_encoded', 'text': text})
+            self.assertEqual([await communicator.receive_from() for communicator in communicators], [text, text])
+        finally:
+            for communicator in communicators:
+                await communicator.disconnect()
+
+
+@unittest.skipUnless(
+    _has_module('fakeredis') and _has_module('daphne'),
+    "fakeredis stands in for the presence Redis; channels.testing needs daphne.",
+)
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ConcurrentSendTests(TransactionTestCase):
+    """
+    Several consumers sending at once must reach the batchers together. The
+    batchers run on their own threads, hence TransactionTestCase.
+    """
+    SENDERS = 4
+
+    def setUp(self):
+        _use_fake_presence(self)
+        room_cache.invalidate()
+        self.users = [
+            User.objects.create(username=f'user{i}', email=f'user{i}@example.com') for i in range(self.SENDERS)
+        ]
+        ChatRoom.objects.create(name='lobby', is_group=True)
+
+        self.classify = mock.Mock(side_effect=_fake_classify_batch)
+        patches = [
+            # Content filtering needs the NLTK corpora and the toxic-word spreadsheet
+            mock.patch.object(Message, 'filter_content', lambda message: None),
+            mock.patch.object(moderation, 'schedule'),
+            mock.patch('chatapp.ingest.publish_flagged'),
+            mock.patch.dict(registry._instances, {'model_version': 'test'}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def _send_all(self):
+        from channels.testing import WebsocketCommunicator
+
+        communicators = []
+        for user in self.users:
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/lobby/')
+            communicator.scope['user'] = user
+            communicator.scope['url_route'] = {'kwargs': {'room_name': 'lobby'}}
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            communicators.append(communicator)
+        try:
+            for i, communicator in enumerate(communicators):
+                await communicator.send_to(text_data=json.dumps({'message': f'hello {i}'}))
+            # Every member sees every message
+            for communicator in communicators:
+                frames = [json.loads(await communicator.receive_from(timeout=5)) for _ in communicators]
+                self.assertEqual(sorted(frame['message']['content'] for frame in frames),
+                                 [f'hello {i}' for i in range(self.SENDERS)])
+        finally:
+            for communicator in communicators:
+                await communicator.disconnect()
+
+    @override_settings(CHAT_BATCHED_PERSISTENCE=True, CHAT_MODERATION_MODE=moderation.STRICT,
+                       CHAT_PERSIST_BATCH_SIZE=SENDERS, CHAT_PERSIST_MAX_WAIT_MS=2000)
+    def test_batched_persistence_writes_concurrent_sends_together(self):
+        persist = mock.Mock(wraps=ingest.persist_messages)
+        with mock.patch.object(ingest, '_writer', None), \
+                mock.patch.object(ingest, 'persist_messages', persist), \
+                mock.patch('chatapp.ingest.classify_toxicity_batch', self.classify):
+            started = time.monotonic()
+            try:
+                async_to_sync(self._send_all)()
+            finally:
+                if ingest._writer is not None:
+                    ingest._writer.stop()
+
+        # One full batch, flushed without waiting for the deadline
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual([len(call.args[0]) for call in persist.call_args_list], [self.SENDERS])
+        self.assertEqual(self.classify.call_count, 1)
+        self.assertEqual(Message.objects.count(), self.SENDERS)
+
+    @override_settings(CHAT_BATCHED_PERSISTENCE=False, CHAT_MODERATION_MODE=moderation.STRICT,
+                       TOXICITY_BATCH_MAX_SIZE=SENDERS, TOXICITY_BATCH_MAX_WAIT_MS=2000)
+    def test_strict_sends_are_classified_together(self):
+        with mock.patch.object(predict, '_batcher', None), \
+                mock.patch.object(predict, 'classify_toxicity_batch', self.classify), \
+                mock.patch('chatapp.models.publish_flagged'):
+            started = time.monotonic()
+            try:
+                async_to_sync(self._send_all)()
+            finally:
+                if predict._batcher is not None:
+                    predict._batcher.stop()
+
+        # One full batch, scored without waiting for the deadline
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual([len(call.args[0]) for call in self.classify.call_args_list], [self.SENDERS])
+        self.assertEqual(Message.objects.filter(toxicity_scores__isnull=False).count(), self.SENDERS)
+
+
+class ModelVersionTests(SimpleTestCase):
+    def setUp(self):
+        directory = Path(tempfile.mkdtemp())
+        (directory / 'saved_model').mkdir()
+        (directory / 'saved_model' / 'fingerprint.pb').write_bytes(b'savedmodel fingerprint')
+        (directory / 'model.int8.onnx').write_bytes(b'quantized weights')
+        self.paths = {
+            'TOXICITY_MODEL_PATH': directory / 'saved_model',
+            'TOXICITY_ONNX_MODEL_PATH': directory / 'model.int8.onnx',
+            'TOXICITY_MODEL_VERSION': None,
+        }
+
+    def _version(self, **overrides):
+        with override_settings(**{**self.paths, **overrides}):
+            return registry._loaders['model_version']()
+
+    def test_version_names_the_backend_and_its_model_file(self):
+        tensorflow = self._version(TOXICITY_BACKEND='tensorflow')
+        onnx = self._version(TOXICITY_BACKEND='onnx')
+        self.assertTrue(tensorflow.startswith('tensorflow:'))
+        self.assertTrue(onnx.startswith('onnx:'))
+        self.assertNotEqual(tensorflow.split(':')[1], onnx.split(':')[1])
+        self.assertEqual(
+            self._version(TOXICITY_BACKEND='model_server', TOXICITY_MODEL_SERVER_BACKEND='onnx'), onnx,
+        )
+
+        self.paths['TOXICITY_ONNX_MODEL_PATH'].write_bytes(b'requantized weights')
+        self.assertNotEqual(self._version(TOXICITY_BACKEND='onnx'), onnx)
+        self.assertEqual(self._version(TOXICITY_BACKEND='tensorflow'), tensorflow)
+
+    def test_pinned_version_keeps_the_backend(self):
+        self.assertEqual(self._version(TOXICITY_BACKEND='onnx', TOXICITY_MODEL_VERSION='v3'), 'onnx:v3')
+
+    def test_switching_backends_changes_the_cache_key(self):
+        keys = {
+            PredictionCache(model_version=self._version(TOXICITY_BACKEND=backend)).key('you idiot')
+            for backend in ('tensorflow', 'onnx')
+        }
+        self.assertEqual(len(keys), 2)
+
+
+class ProfileImageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create(username='alice', email='alice@example.com')
+
+    def _upload(self, name, size=(600, 400)):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, format='PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_unchanged_image_is_processed_once(self):
+        from PIL import Image
+
+        with mock.patch('chatapp.models.Image.open', wraps=Image.open) as image_open:
+            profile = self.user.profile
+            profile.image = self._upload('avatar.png')
+            profile.save()
+            self.assertEqual(image_open.call_count, 1)
+
+            profile.display_name = 'Alice'
+            profile.save()
+            # Loaded from the database, as every later request does
+            Profile.objects.get(pk=profile.pk).save()
+            # Saving the user saves the profile too
+            User.objects.get(pk=self.user.pk).save()
+        self.assertEqual(image_open.call_count, 1)
+        with Image.open(profile.image.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (300, 200))
+
+    def test_new_image_is_processed(self):
+        from PIL import Image
+
+        profile = self.user.profile
+        profile.image = self._upload('first.png')
+        profile.save()
+
+        profile = Profile.objects.get(pk=profile.pk)
+        with mock.patch('chatapp.models.Image.open', wraps=Image.open) as image_open:
+            profile.image = self._upload('second.png', size=(400, 800))
+            profile.save()
+        self.assertEqual(image_open.call_count, 1)
+        with Image.open(profile.image.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (150, 300))
+
+    def test_profile_without_image_is_not_processed(self):
+        with mock.patch('chatapp.models.Image.open') as image_open:
+            self.user.profile.save()
+        image_open.assert_not_called()
@@ -0,0 +1,82 @@
+# chatapp/token_cache.py
+"""
+Process-wide cache of verified WebSocket tokens.
+
+TokenAuthMiddleware decodes a token and loads its user once; later
+handshakes with the same token (reconnects, extra tabs, a reconnect storm
+after a deploy) are answered from memory without touching the database.
+An entry never outlives its token's `exp` claim. The cache holds at most
+WS_AUTH_CACHE_MAX_ENTRIES tokens, evicting the least recently used.
+
+The cache is per process. Saving a user (for example when
+BlockUserAPIView changes is_blocked) drops that user's entries only in the
+process that saved it; other ASGI workers keep serving their copy for up
+to WS_AUTH_CACHE_TTL seconds, so keep that setting short.
+"""
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+
+def _key(token):
+    # Raw tokens are never kept in memory longer than the handshake
+    return hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+
+
+def get(token):
+    """
+    Return a copy of the cached user for `token`, or None on a miss or when
+    the entry has expired.
+    """
+    key = _key(token)
+    now = time.time()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return None
+        user, expires_at = entry
+        if expires_at <= now:
+            del _entries[key]
+            return None
+        _entries.move_to_end(key)
+    # Each connection gets its own instance
+    return copy.copy(user)
+
+
+def put(token, user, exp):
+    """
+    Cache `user` for `token` until the token's `exp` timestamp, or for
+    WS_AUTH_CACHE_TTL seconds if that comes first.
+    """
+    max_entries = getattr(settings, 'WS_AUTH_CACHE_MAX_ENTRIES', 10000)
+    if max_entries <= 0:
+        return
+    expires_at = min(exp, time.time() + getattr(settings, 'WS_AUTH_CACHE_TTL', 60))
+    key = _key(token)
+    with _lock:
+        _entries[key] = (copy.copy(user), expires_at)
+        _entries.move_to_end(key)
+        while len(_entries) > max_entries:
+            _entries.popitem(last=False)
+
+
+def invalidate_user(user_id):
+    """
+    Drop every cached token of `user_id`.
+    """
+    with _lock:
+        for key, (user, _) in list(_entries.items()):
+            if user.pk == user_id:
+                del _entries[key]
+
+
+def clear():
+    with _lock:
+        _entries.clear()
@@ -12,6 +12,9 @@ urlpatterns = [
     path('rooms/<int:pk>/', ChatRoomDetailView.as_view(), name='chat_room_detail'),
     path('all/', UserListView.as_view(), name='user_list'),
     path('rooms/<int:pk>/messages/', MessageListView.as_view(), name='room_messages'),
+    path('rooms/<int:pk>/messages/import/', MessageImportView.as_view(), name='room_messages_import'),
+    path('rooms/<int:pk>/read/', RoomReadView.as_view(), name='room_read'),
+    path('rooms/<int:pk>/presence/', RoomPresenceView.as_view(), name='room_presence'),
 
     # Flagged Messages
     path('flagged-messages/', FlaggedMessagesListView.as_view(), name='flagged-messages'),
@@ -24,7 +27,16 @@ urlpatterns = [
 
     # User Activity Tracker
     path('user-activity-list/', UserActivityListAPIView.as_view(), name='user-activity-list'),
+    path('toxicity/ranking/', ToxicityRankingView.as_view(), name='toxicity-ranking'),
+    path('toxicity/trends/', ToxicityTrendView.as_view(), name='toxicity-trends'),
+    path('toxicity/rethreshold/', RethresholdView.as_view(), name='toxicity-rethreshold'),
+
+    # Streaming exports
+    path('export/<str:dataset>/', ExportView.as_view(), name='export'),
 
     # Block Users
-    path('user-block/<int:user_id>/', BlockUserAPIView.as_view(), name='user-block')
+    path('user-block/<int:user_id>/', BlockUserAPIView.as_view(), name='user-block'),
+
+    # Inference diagnostics
+    path('inference-stats/', InferenceStatsView.as_view(), name='inference-stats'),
 ]
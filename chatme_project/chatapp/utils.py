@@ -15,23 +15,19 @@ def predict_toxicity(message_content):
     return random.choice(toxicity_types)
 """
 
-import pandas as pd
-from transformers import BertTokenizer
-from nltk.corpus import stopwords
-import string
-import nltk
+import logging
 
+from . import registry
+from .lexicon import ToxicLexicon
 
+logger = logging.getLogger(__name__)
 
-# Initialize NLTK stopwords
-nltk.download('stopwords')
-stop_words = set(stopwords.words('english'))
-
-# Initialize the BERT tokenizer
-tokenizer = BertTokenizer.from_pretrained('bert-base-uncased')
 
 def preprocess_text(text):
     try:
+        tokenizer = registry.get('tokenizer')
+        stop_words = registry.get('stop_words')
+
         # Lowercase the text
         text = text.lower()
         
@@ -39,8 +35,8 @@ def preprocess_text(text):
         text = ''.join(e for e in text if e.isalnum() or e.isspace())
         
         # Tokenize the text with BERT tokenizer
-        inputs = tokenizer(text, return_tensors='pt', padding=True, truncation=True, max_length=128)
-        tokens = tokenizer.convert_ids_to_tokens(inputs['input_ids'][0])
+        inputs = tokenizer(text, truncation=True, max_length=128)
+        tokens = tokenizer.convert_ids_to_tokens(inputs['input_ids'])
         
         # Remove NLTK stopwords and BERT special tokens
         preprocessed_tokens = [token for token in tokens if token.lower() not in stop_words and token not in ['[CLS]', '[SEP]']]
@@ -53,58 +49,28 @@ def preprocess_text(text):
         raise ValueError(f"Error preprocessing text: {e}")
 
 
-import nltk
-from nltk.corpus import wordnet
-import pandas as pd
-import string
-
-# Ensure WordNet is downloaded
-nltk.download('wordnet')
-
-# Load the toxic words file
-file_path = r'media\BERT_MODEL_DATA_TOXIC_WORDS.xlsx'
-df = pd.read_excel(file_path)
-
-# Extract the toxic words from the DataFrame
-toxic_words = df['comments_text'].str.lower().tolist()  # Convert toxic words to lowercase for case-insensitive matching
-
-# Debugging: Print the toxic words list
-print("Toxic words loaded:", toxic_words)
-
-# Function to find antonyms for a word
+# Function to find antonyms for a word (or a multi-word phrase)
 def get_antonym(word):
+    wordnet = registry.get('wordnet')
     antonyms = []
-    for syn in wordnet.synsets(word):
+    for syn in wordnet.synsets(word.replace(' ', '_')):
         for lemma in syn.lemmas():
             if lemma.antonyms():
-                antonyms.append(lemma.antonyms()[0].name())
-    # Debugging: Print whether an antonym was found or not
-    print(f"Word: {word}, Antonym found: {antonyms[0] if antonyms else 'None'}")
+                antonyms.append(lemma.antonyms()[0].name().replace('_', ' '))
+    logger.debug("Word: %s, Antonym found: %s", word, antonyms[0] if antonyms else 'None')
     return antonyms[0] if antonyms else word  # Return the word itself if no antonym found
 
-# Function to clean text (remove punctuation and make lowercase)
-def clean_word(word):
-    return word.strip(string.punctuation).lower()
-
-# Function to replace toxic words with their antonyms
-def replace_toxic_with_antonyms(text, toxic_words):
-    words = text.split()  # Split text into individual words
-    for i, word in enumerate(words):
-        clean_word_check = clean_word(word)  # Clean the word to remove punctuation and make lowercase
-        # Debugging: Print each word and whether it is considered toxic
-        print(f"Checking word: {clean_word_check}")
-        if clean_word_check in toxic_words:
-            antonym = get_antonym(clean_word_check)
-            words[i] = antonym  # Replace toxic word with its antonym
-            # Debugging: Print the replacement
-            print(f"Replaced '{clean_word_check}' with '{antonym}'")
-    return ' '.join(words)  # Rejoin the words into a single string
-
-# Example usage with the toxic words from your file
-text = "You are an idiot and a fornicator."
-
-cleaned_text = replace_toxic_with_antonyms(text, toxic_words)
-
-# Debugging: Print the final cleaned text
-print("Final cleaned text:", cleaned_text)
-
+# Function to replace toxic words and phrases with their antonyms
+def replace_toxic_with_antonyms(text, toxic_words=None):
+    """
+    Replace toxic words and phrases in `text` with their antonyms in a single
+    pass. Uses the compiled lexicon and antonym table from the registry unless
+    a word list is given.
+    """
+    if toxic_words is not None:
+        return ToxicLexicon(toxic_words).replace(text, get_antonym)
+
+    # Replacements for the configured lexicon are precomputed, so saving a
+    # message never touches WordNet
+    antonym_table = registry.get('antonym_table')
+    return registry.get('toxic_lexicon').replace(text, lambda entry: antonym_table.get(entry, entry))
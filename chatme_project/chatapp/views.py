@@ -1,6 +1,14 @@
 #views.py
-from rest_framework import generics, permissions
+from rest_framework import generics, permissions, serializers
 from .serializers import *
+from django.conf import settings
+from django.db.models import Count, F, FloatField, OuterRef, Prefetch, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf, Substr
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, timezone as dt_timezone
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.permissions import IsAuthenticated
@@ -10,10 +18,24 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from . import registry
+from .aggregates import GRANULARITIES
+from .exports import CONTENT_TYPES, EXPORTS, FORMATS, aiterate, stream
+from .ingest import PendingMessage, persist_messages
+from .pagination import FlaggedMessageCursorPagination, MessageCursorPagination, ToxicityPagination
+from . import room_cache
+from .presence import get_presence
+from .scores import rethreshold
+from itertools import islice
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Read position of rooms a user has never opened
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
 User = get_user_model()
 
 class RegisterView(generics.CreateAPIView):
@@ -53,12 +75,18 @@ class ChatRoomListCreateView(generics.ListCreateAPIView):
         room.participants.add(self.request.user)  # Add creator by default
 
 class MessageListView(generics.ListAPIView):
+    """
+    A room's message history, one page at a time. See MessageCursorPagination
+    for the `before`/`after`/`page_size` query parameters.
+    """
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MessageCursorPagination
 
     def get_queryset(self):
         room_id = self.kwargs['pk']
-        return Message.objects.filter(room__id=room_id).order_by('timestamp')
+        # Ordering is applied by the paginator
+        return Message.objects.filter(room_id=room_id).select_related('sender__profile')
     
 
 class UserListView(generics.ListAPIView):
@@ -67,13 +95,51 @@ class UserListView(generics.ListAPIView):
 
     def get_queryset(self):
         # Optionally exclude the logged-in user if you don't want them listed
-        return User.objects.all().exclude(id=self.request.user.id)
+        return User.objects.select_related('profile').exclude(id=self.request.user.id)
     
 class ChatRoomListCreateView(generics.ListCreateAPIView):
-    queryset = ChatRoom.objects.all()
-    serializer_class = ChatRoomSerializer
+    """
+    GET lists room summaries (optionally ?name=<room name>); POST creates a room.
+    """
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_serializer_class(self):
+        if self.request.method == 'GET':
+            return ChatRoomSummarySerializer
+        return ChatRoomSerializer
+
+    def get_queryset(self):
+        user = self.request.user
+        rooms = ChatRoom.objects.all()
+        name = self.request.query_params.get('name')
+        if name:
+            rooms = rooms.filter(name=name)
+
+        # Every summary field is a correlated subquery, so the list is one
+        # query whose cost grows with the number of rooms, not of messages
+        last_message = Message.objects.filter(room=OuterRef('pk')).order_by('-timestamp', '-id')
+        participant_count = (
+            ChatRoom.participants.through.objects.filter(chatroom=OuterRef('pk'))
+            .order_by().values('chatroom').annotate(count=Count('pk')).values('count')
+        )
+        read_until = RoomReadMarker.objects.filter(room=OuterRef('pk'), user=user).values('last_read_at')[:1]
+        unread_count = (
+            Message.objects.filter(room=OuterRef('pk'), timestamp__gt=OuterRef('read_until'))
+            .exclude(sender=user)
+            .order_by().values('room').annotate(count=Count('pk')).values('count')
+        )
+        preview_length = getattr(settings, 'ROOM_PREVIEW_LENGTH', 100)
+        return rooms.annotate(
+            participant_count=Coalesce(Subquery(participant_count), 0),
+            last_message_id=Subquery(last_message.values('id')[:1]),
+            last_message_preview=Subquery(last_message.annotate(
+                preview=Substr('content', 1, preview_length)).values('preview')[:1]),
+            last_message_sender=Subquery(last_message.values('sender__username')[:1]),
+            last_message_timestamp=Subquery(last_message.values('timestamp')[:1]),
+            read_until=Coalesce(Subquery(read_until), Value(EPOCH)),
+            unread_count=Coalesce(Subquery(unread_count), 0),
+        ).order_by(F('last_message_timestamp').desc(nulls_last=True), 'id')
+
     def perform_create(self, serializer):
         room = serializer.save()
         room.participants.add(self.request.user)
@@ -85,14 +151,27 @@ class ChatRoomListCreateView(generics.ListCreateAPIView):
 
 class FlaggedMessagesListView(generics.ListAPIView):
     """
-    Retrieve a list of all flagged messages.
+    The moderation queue: flagged messages, newest first, one page at a time
+    (see FlaggedMessageCursorPagination). Filter with ?label=<toxicity label>
+    and ?room=<room id>.
     Accessible only to admins and moderators.
     """
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated, IsAdminOrModerator]
+    pagination_class = FlaggedMessageCursorPagination
 
     def get_queryset(self):
-        return Message.objects.filter(is_flagged=True).order_by('-timestamp')
+        # Ordering is applied by the paginator
+        queryset = Message.objects.filter(is_flagged=True).select_related('sender__profile')
+        label = self.request.query_params.get('label')
+        if label:
+            queryset = queryset.filter(toxicity=label)
+        room = self.request.query_params.get('room')
+        if room:
+            if not room.isdigit():
+                raise ValidationError({'room': 'Expected a room id.'})
+            queryset = queryset.filter(room_id=room)
+        return queryset
     
 class DeleteMessageView(APIView):
     authentication_classes = [JWTAuthentication]
@@ -126,7 +205,7 @@ class FeedbackListView(APIView):
     permission_classes = [IsAuthenticated, IsAdminOrModerator]
 
     def get(self, request):
-        feedbacks = Feedback.objects.all().order_by('-timestamp')
+        feedbacks = Feedback.objects.select_related('user').order_by('-timestamp')
         data = []
         for f in feedbacks:
             data.append({
@@ -154,6 +233,16 @@ class ChatRoomDetailView(APIView):
     authentication_classes = [JWTAuthentication]
     permission_classes = [IsAuthenticated]
 
+    def get(self, request, pk):
+        room = get_object_or_404(
+            ChatRoom.objects.prefetch_related(
+                Prefetch('participants', queryset=User.objects.select_related('profile'))
+            ),
+            pk=pk,
+        )
+        serializer = ChatRoomSerializer(room, context={'request': request})
+        return Response(serializer.data)
+
     def delete(self, request, pk):
         # Attempt to retrieve the room by ID
         room = get_object_or_404(ChatRoom, pk=pk)
@@ -168,7 +257,34 @@ class ChatRoomDetailView(APIView):
         #     return Response({'detail': 'You are not a participant of this group.'}, status=status.HTTP_403_FORBIDDEN)
 
         # If checks pass, delete the room
+        room_id = room.pk
         room.delete()
+        room_cache.invalidate(room_id=room_id)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+class RoomPresenceView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        """
+        IDs of the users currently connected to the room.
+        """
+        room = get_object_or_404(ChatRoom, pk=pk)
+        return Response({'room': room.pk, 'online': sorted(get_presence().room_members(room.pk))})
+
+class RoomReadView(APIView):
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        """
+        Mark every message currently in the room as read by the requesting user.
+        """
+        room = get_object_or_404(ChatRoom, pk=pk)
+        latest = Message.objects.filter(room=room).order_by('-timestamp', '-id').values_list('timestamp', flat=True).first()
+        if latest is not None:
+            RoomReadMarker.objects.update_or_create(user=request.user, room=room, defaults={'last_read_at': latest})
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 class UserActivityListAPIView(APIView):
@@ -179,6 +295,198 @@ class UserActivityListAPIView(APIView):
         serializer = UserActivitySerializer(users, many=True)
         return Response(serializer.data)
     
+def parse_time_bound(name, value):
+    """
+    Parse a ?since=/?until= query parameter: an ISO date or datetime, UTC
+    unless it carries an offset.
+    """
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValidationError({name: 'Expected an ISO date or datetime.'})
+        parsed = datetime(date.year, date.month, date.day)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+def filter_toxicity_aggregates(request):
+    """
+    ToxicityAggregate rows of one ?granularity= (hour or day, default day)
+    whose buckets start within ?since= and ?until=, optionally for one
+    ?user= or ?room=.
+    """
+    params = request.query_params
+    granularity = params.get('granularity', 'day')
+    if granularity not in GRANULARITIES:
+        raise ValidationError({'granularity': 'Expected one of: ' + ', '.join(GRANULARITIES) + '.'})
+    queryset = ToxicityAggregate.objects.filter(granularity=granularity)
+    if params.get('since'):
+        queryset = queryset.filter(bucket_start__gte=parse_time_bound('since', params['since']))
+    if params.get('until'):
+        queryset = queryset.filter(bucket_start__lt=parse_time_bound('until', params['until']))
+    for name in ('user', 'room'):
+        value = params.get(name)
+        if value:
+            if not value.isdigit():
+                raise ValidationError({name: f'Expected a {name} id.'})
+            queryset = queryset.filter(**{f'{name}_id': value})
+    return queryset
+
+def ordering_param(request, orderings, default):
+    """
+    Validate ?ordering=<field> or -<field> against `orderings`, a map of
+    public names to annotations, and return the order_by() expression.
+    """
+    ordering = request.query_params.get('ordering', default)
+    field = orderings.get(ordering.lstrip('-'))
+    if field is None:
+        raise ValidationError({'ordering': 'Expected one of: ' + ', '.join(orderings) + '.'})
+    return F(field).desc(nulls_last=True) if ordering.startswith('-') else F(field).asc(nulls_last=True)
+
+class ToxicityRankingView(generics.ListAPIView):
+    """
+    Users, or rooms with ?by=room, ranked by their scored messages in the
+    filtered aggregate buckets (see filter_toxicity_aggregates). Top
+    offenders come first by default; sort with ?ordering=toxic_count,
+    non_toxic_count, total or toxic_ratio, prefixed with '-' for descending.
+    Accessible only to admins and moderators.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated, IsAdminOrModerator]
+    serializer_class = ToxicityRankingSerializer
+    pagination_class = ToxicityPagination
+    orderings = {
+        'toxic_count': 'toxic',
+        'non_toxic_count': 'non_toxic',
+        'total': 'total',
+        'toxic_ratio': 'toxic_ratio',
+    }
+    labels = {'user': 'user__username', 'room': 'room__name'}
+
+    def get_queryset(self):
+        by = self.request.query_params.get('by', 'user')
+        if by not in self.labels:
+            raise ValidationError({'by': "Expected 'user' or 'room'."})
+        ordering = ordering_param(self.request, self.orderings, '-toxic_count')
+        return (
+            filter_toxicity_aggregates(self.request)
+            .values(key=F(f'{by}_id'), label=F(self.labels[by]))
+            .annotate(toxic=Sum('toxic_count'), non_toxic=Sum('non_toxic_count'))
+            .annotate(total=F('toxic') + F('non_toxic'))
+            .annotate(toxic_ratio=Cast('toxic', FloatField()) / NullIf('total', 0))
+            # The id keeps ties in a stable order across pages
+            .order_by(ordering, 'key')
+        )
+
+class ToxicityTrendView(generics.ListAPIView):
+    """
+    Toxic and non-toxic counts per hour or day bucket (see
+    filter_toxicity_aggregates), oldest first; ?ordering=-bucket_start
+    for newest first.
+    Accessible only to admins and moderators.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated, IsAdminOrModerator]
+    serializer_class = ToxicityTrendSerializer
+    pagination_class = ToxicityPagination
+    orderings = {
+        'bucket_start': 'bucket_start',
+        'toxic_count': 'toxic',
+        'non_toxic_count': 'non_toxic',
+    }
+
+    def get_queryset(self):
+        ordering = ordering_param(self.request, self.orderings, 'bucket_start')
+        return (
+            filter_toxicity_aggregates(self.request)
+            .values('bucket_start')
+            .annotate(toxic=Sum('toxic_count'), non_toxic=Sum('non_toxic_count'))
+            .order_by(ordering, 'bucket_start')
+        )
+
+class RethresholdView(APIView):
+    """
+    Re-flag stored messages under new thresholds from their saved
+    per-label scores, without running the model (chatapp.scores.rethreshold).
+    `threshold` is a probability or a {label: probability} mapping; the
+    scan can be narrowed with `room`, `since`, `until` and `model_version`,
+    and `dry_run` only reports what would change. New messages keep using
+    TOXICITY_THRESHOLD.
+    Accessible only to admins and moderators.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated, IsAdminOrModerator]
+
+    def post(self, request):
+        threshold = request.data.get('threshold')
+        values = threshold.values() if isinstance(threshold, dict) else [threshold]
+        if not values or not all(
+            isinstance(value, (int, float)) and not isinstance(value, bool) and 0 <= value <= 1
+            for value in values
+        ):
+            raise ValidationError({'threshold': 'Expected a probability or a {label: probability} mapping.'})
+
+        queryset = Message.objects.all()
+        room = request.data.get('room')
+        if room is not None:
+            if not str(room).isdigit():
+                raise ValidationError({'room': 'Expected a room id.'})
+            queryset = queryset.filter(room_id=room)
+        if request.data.get('since'):
+            queryset = queryset.filter(timestamp__gte=parse_time_bound('since', request.data['since']))
+        if request.data.get('until'):
+            queryset = queryset.filter(timestamp__lt=parse_time_bound('until', request.data['until']))
+        if request.data.get('model_version'):
+            queryset = queryset.filter(model_version=request.data['model_version'])
+
+        try:
+            # "false" and "0" must not count as true, as they would with bool()
+            dry_run = serializers.BooleanField().to_internal_value(request.data.get('dry_run', False))
+        except ValidationError:
+            raise ValidationError({'dry_run': 'Expected a boolean.'})
+        try:
+            stats = rethreshold(queryset, threshold, dry_run=dry_run)
+        except ValueError as exc:
+            raise ValidationError({'threshold': str(exc)})
+        logger.info(f"Rethreshold to {threshold} by {request.user.username} (dry run: {dry_run}): {stats}")
+        return Response({'dry_run': dry_run, **stats})
+
+class ExportView(APIView):
+    """
+    Stream a dataset from chatapp.exports (messages, flagged-messages,
+    feedback or user-activity) as ?output=ndjson (default) or csv. Filter
+    with ?since= and ?until= (see parse_time_bound) and ?room=<room id>.
+    Accessible only to admins and moderators.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated, IsAdminOrModerator]
+
+    def get(self, request, dataset):
+        export = EXPORTS.get(dataset)
+        if export is None:
+            return Response({'detail': 'Unknown export.'}, status=status.HTTP_404_NOT_FOUND)
+
+        params = request.query_params
+        output = params.get('output', 'ndjson')
+        if output not in FORMATS:
+            raise ValidationError({'output': 'Expected one of: ' + ', '.join(FORMATS) + '.'})
+        since = parse_time_bound('since', params['since']) if params.get('since') else None
+        until = parse_time_bound('until', params['until']) if params.get('until') else None
+        room = params.get('room')
+        if room:
+            if export.room_field is None:
+                raise ValidationError({'room': 'This export cannot be filtered by room.'})
+            if not room.isdigit():
+                raise ValidationError({'room': 'Expected a room id.'})
+
+        chunks = stream(export, output, since, until, room or None)
+        if isinstance(request._request, ASGIRequest):
+            chunks = aiterate(chunks)
+        response = StreamingHttpResponse(chunks, content_type=CONTENT_TYPES[output])
+        response['Content-Disposition'] = f'attachment; filename="{dataset}.{output}"'
+        return response
+
 class BlockUserAPIView(APIView):
     permission_classes = [IsAuthenticated]  # Adjust permissions as needed
 
@@ -196,4 +504,98 @@ class BlockUserAPIView(APIView):
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_200_OK)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class InferenceStatsView(APIView):
+    """
+    Report this worker's prediction cache counters and the histogram of
+    tokenized message lengths per bucket.
+    Accessible only to admins and moderators.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated, IsAdminOrModerator]
+
+    def get(self, request):
+        return Response({
+            'prediction_cache': registry.get('prediction_cache').stats(),
+            'length_buckets': registry.get('length_buckets').histogram(),
+        }, status=status.HTTP_200_OK)
+
+
+class MessageImportView(APIView):
+    """
+    Import a backlog of messages into a room (bots, migrations).
+    Accepts a JSON list of {"content": ..., "sender": <user id>} objects, or
+    the same objects as NDJSON (application/x-ndjson), which is read line by
+    line. Messages are stored in chunks through the batched persistence path.
+    Accessible only to admins and moderators.
+    """
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated, IsAdminOrModerator]
+
+    def post(self, request, pk):
+        room = get_object_or_404(ChatRoom, pk=pk)
+        chunk_size = getattr(settings, 'MESSAGE_IMPORT_CHUNK_SIZE', 500)
+
+        if request.content_type.startswith('application/x-ndjson'):
+            # DRF leaves request.stream unset when there is no body
+            if request.stream is None:
+                raise ValidationError({'detail': 'Request body cannot be empty.'})
+            lines = (line for line in request.stream if line.strip())
+        else:
+            records = request.data.get('messages') if isinstance(request.data, dict) else request.data
+            if not isinstance(records, list):
+                raise ValidationError({'messages': 'Expected a list of messages.'})
+            lines = iter(records)
+
+        imported = 0
+        flagged = 0
+        errors = []
+        index = 0
+        while True:
+            chunk = list(islice(lines, chunk_size))
+            if not chunk:
+                break
+
+            records = []
+            for line in chunk:
+                try:
+                    record = json.loads(line) if isinstance(line, (bytes, str)) else line
+                except ValueError:
+                    errors.append({'index': index, 'detail': 'Invalid JSON.'})
+                    record = None
+                if record is not None:
+                    records.append((index, record))
+                index += 1
+
+            sender_ids = []
+            for position, record in records:
+                if not isinstance(record, dict) or not str(record.get('content', '')).strip():
+                    errors.append({'index': position, 'detail': 'Message content cannot be empty.'})
+                    continue
+                try:
+                    # Ids may arrive as strings ("5"); lists and objects are rejected here
+                    sender_ids.append((position, record, int(record.get('sender', request.user.id))))
+                except (TypeError, ValueError):
+                    errors.append({'index': position, 'detail': 'Sender must be a user id.'})
+
+            senders = User.objects.in_bulk({sender_id for _, _, sender_id in sender_ids})
+            pending = []
+            for position, record, sender_id in sender_ids:
+                sender = senders.get(sender_id)
+                if sender is None:
+                    errors.append({'index': position, 'detail': 'Sender not found.'})
+                    continue
+                pending.append(PendingMessage(room.pk, sender, str(record['content'])))
+
+            saved = persist_messages(pending)
+            imported += len(saved)
+            flagged += sum(1 for message in saved if message.is_flagged)
+
+        errors.sort(key=lambda error: error['index'])
+        logger.info(f"{imported} messages imported into room {room.pk} by user {request.user.username}.")
+        return Response({
+            'imported': imported,
+            'flagged': flagged,
+            'errors': errors,
+        }, status=status.HTTP_201_CREATED)
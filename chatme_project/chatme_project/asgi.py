@@ -1,4 +1,13 @@
+"""
+ASGI config for backend project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+With TOXICITY_WARMUP_ON_STARTUP enabled, importing it also loads the
+classifier, so only the server should import it in that case.
 
+For more information on this file, see
+https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
+"""
 import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
@@ -18,21 +27,8 @@ application = ProtocolTypeRouter({
     ),
 })
 
-"""
-ASGI config for backend project.
-
-It exposes the ASGI callable as a module-level variable named ``application``.
-
-For more information on this file, see
-https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
-
-
-import os
-
-from django.core.asgi import get_asgi_application
-
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'chatme_project.settings')
-
-application = get_asgi_application()
-
-"""
\ No newline at end of file
+# Load the classifier once per worker so the first chat message does not pay for it
+from django.conf import settings
+if getattr(settings, 'TOXICITY_WARMUP_ON_STARTUP', False):
+    from chatapp.registry import warm_up
+    warm_up()
@@ -199,3 +199,95 @@ AUTH_USER_MODEL = 'chatapp.User'
 # Media files configuration
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Toxicity classifier batching: concurrent predictions are flushed to the
+# model as one padded batch when either limit is reached.
+TOXICITY_BATCH_MAX_SIZE = 32
+TOXICITY_BATCH_MAX_WAIT_MS = 5
+
+# Toxicity classifier resources, loaded lazily by chatapp.registry
+TOXICITY_MODEL_PATH = BASE_DIR / 'model' / 'bert_toxic_comment_classifier'
+TOXICITY_TOKENIZER = 'bert-base-uncased'
+TOXIC_WORDS_PATH = BASE_DIR / 'media' / 'BERT_MODEL_DATA_TOXIC_WORDS.xlsx'
+
+# Load the classifier when the ASGI application starts instead of on the first message.
+# Off by default so tooling and tests that import asgi.py stay light; enable it
+# in the settings of the serving workers.
+TOXICITY_WARMUP_ON_STARTUP = False
+
+# 'strict' scores every message before it is broadcast. 'async' broadcasts
+# first and scores on a background pool, except in rooms with strict_moderation.
+CHAT_MODERATION_MODE = 'strict'
+CHAT_MODERATION_WORKERS = 4
+
+# Prediction cache keyed by normalized text and model version (the backend name
+# plus TOXICITY_MODEL_VERSION, or else a hash of the backend's model file).
+# TOXICITY_CACHE_REDIS adds a shared tier on the presence Redis.
+TOXICITY_MODEL_VERSION = None
+TOXICITY_CACHE_MAX_ENTRIES = 10000
+TOXICITY_CACHE_TTL = 3600
+TOXICITY_CACHE_REDIS = False
+
+# Precomputed antonyms for the toxic-word lexicon, rebuilt when TOXIC_WORDS_PATH changes
+ANTONYM_TABLE_PATH = BASE_DIR / 'media' / 'antonym_table.pkl'
+
+# Inference backend used by predict_toxicity: 'tensorflow' (the SavedModel),
+# 'onnx' (TOXICITY_ONNX_MODEL_PATH, see manage.py export_onnx) or
+# 'model_server' (score on manage.py run_model_server over a Unix socket).
+TOXICITY_BACKEND = 'tensorflow'
+TOXICITY_ONNX_MODEL_PATH = BASE_DIR / 'model' / 'bert_toxic_comment_classifier.int8.onnx'
+TOXICITY_ONNX_THREADS = 0  # 0 lets ONNX Runtime decide
+TOXICITY_MODEL_SERVER_SOCKET = None
+TOXICITY_MODEL_SERVER_WORKERS = 2
+TOXICITY_MODEL_SERVER_BACKEND = 'tensorflow'
+
+# Token-length buckets for batched inference; every bucket is padded to its
+# boundary. Tune against the histogram at /api/inference-stats/.
+TOXICITY_LENGTH_BUCKETS = [16, 32, 64, 128]
+
+# A message is flagged with its most likely specific label (everything but
+# 'toxic') when that label's probability exceeds this threshold
+TOXICITY_THRESHOLD = 0.5
+
+# Buffer profile toxic/non-toxic counter increments and write them in bulk
+# every N milliseconds. 0 applies an atomic UPDATE per message.
+PROFILE_COUNTER_FLUSH_MS = 0
+
+# Coalesce messages from all consumers in a worker into bulk inserts with one
+# batched classifier call per flush
+CHAT_BATCHED_PERSISTENCE = False
+CHAT_PERSIST_BATCH_SIZE = 64
+CHAT_PERSIST_MAX_WAIT_MS = 10
+# Messages per bulk insert when importing a backlog through the REST API
+MESSAGE_IMPORT_CHUNK_SIZE = 500
+# Seconds a consumer-side room cache entry lives before it is re-read (local changes invalidate immediately)
+ROOM_CACHE_TTL = 60
+# Keyset-paginated message history: default and maximum ?page_size
+MESSAGE_PAGE_SIZE = 50
+MESSAGE_PAGE_MAX_SIZE = 200
+# Characters of the last message shown in room list summaries
+ROOM_PREVIEW_LENGTH = 100
+# Presence: one Redis URL per shard, seconds before an un-refreshed connection
+# expires, consumer heartbeat interval, and in-process cache lifetime for reads
+PRESENCE_REDIS_URLS = ['redis://localhost:6379/0']
+PRESENCE_TTL = 90
+PRESENCE_HEARTBEAT_INTERVAL = 30
+PRESENCE_CACHE_TTL = 2.0
+# Connection pool per presence shard (sync and asyncio clients each get one)
+PRESENCE_REDIS_MAX_CONNECTIONS = 50
+PRESENCE_REDIS_SOCKET_TIMEOUT = 5
+# WebSocket handshake cache: verified tokens kept per process (0 disables) and
+# the longest a cached user snapshot is trusted, in seconds, before its token expires.
+# Other processes only see user changes (e.g. blocking) once their copy expires
+WS_AUTH_CACHE_MAX_ENTRIES = 10000
+WS_AUTH_CACHE_TTL = 60
+# Buffer hourly/daily toxicity aggregate increments and write them in bulk
+# every N milliseconds. 0 writes them with each scored message.
+TOXICITY_AGGREGATE_FLUSH_MS = 0
+# Rows per page of the toxicity dashboard endpoints
+TOXICITY_PAGE_SIZE = 25
+TOXICITY_PAGE_MAX_SIZE = 200
+# Rows fetched per database round-trip and encoded per chunk by the streaming exports
+EXPORT_CHUNK_SIZE = 2000
+# Messages re-labelled per transaction when re-applying thresholds to stored scores
+RETHRESHOLD_CHUNK_SIZE = 5000